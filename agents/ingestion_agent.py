@@ -1,11 +1,19 @@
 
-from utils.chunking import chunk_text
-from embeddings.embedder import get_embeddings
+import atexit
+import threading
+import time
+
+import config
+from parsers.registry import SEGMENT_PARSERS, iter_chunks
+from utils.indexing import file_hash, index_chunks, ingest_files
+from embeddings.embedder import get_embedder
+from embeddings.cache import get_embedding_cache
+from mcp.tracing import tracer
 
 # This agent is in charge of taking in new documents, breaking them up, and storing them for later.
 # Think of it as the librarian who catalogs every new book!
 class IngestionAgent:
-    def __init__(self, dispatcher, vector_store, parsers):
+    def __init__(self, dispatcher, vector_store, parsers, embedder=None, embedding_cache=None, segment_parsers=None):
         """
         Set up the IngestionAgent with everything it needs to process documents.
         It registers itself so it can be called when a new file arrives.
@@ -13,21 +21,147 @@ class IngestionAgent:
         self.dispatcher = dispatcher
         self.vector_store = vector_store
         self.parsers = parsers
+        self.segment_parsers = SEGMENT_PARSERS if segment_parsers is None else segment_parsers
+        self.embedder = embedder or get_embedder()
+        self.embedding_cache = embedding_cache or get_embedding_cache()
+        # Snapshots are taken every few changes rather than after each one (see _changed); the lock keeps
+        # a snapshot from catching a document halfway through being ingested
+        self._lock = threading.RLock()
+        self._unsaved = 0
+        self._last_snapshot = time.monotonic()
         dispatcher.register_agent("IngestionAgent", self.handle)
 
     def handle(self, message):
         """
-        When a new document arrives, this method:
+        When a new document arrives (DOCUMENT_UPLOAD), this method:
         1. Figures out what type of file it is
-        2. Reads and parses the file
-        3. Breaks the text into chunks
-        4. Gets embeddings for each chunk
-        5. Stores everything in the vector store for future searching
+        2. Reads and parses the file, one page/slide/block at a time
+        3. Breaks the text into chunks as the pages stream in (CSV rows are grouped whole, with the header repeated)
+        4. Gets embeddings for each chunk (fitting the embedder once, when the corpus is still empty),
+           reusing cached vectors for any chunk text we've embedded before
+        5. Stores everything in the vector store for future searching, along with where each chunk
+           came from (document, page/slide, offsets), and snapshots it to disk
+        6. Resolves the request's trace ID with a short summary, for whoever is waiting on it
+        Only the new chunks are embedded—whatever is already in the vector store is left alone, and a chunk
+        with the same text as one already stored just becomes a reference to it ("duplicates" in the result;
+        "near_duplicates" counts chunks that are only similar to a stored one, which are kept).
+        If a document from the same source (the optional "source" payload field, else the file path)
+        was ingested before, it's an update: the old version is removed once the new one is indexed.
+        A DOCUMENT_BATCH_UPLOAD (payload: "file_paths", and optionally "sources" and "content_hashes",
+        one per file) goes through the bulk pipeline instead,
+        and a DOCUMENT_DELETE (payload: "doc_id" or "source") removes a document.
+        """
+        if message.type == "DOCUMENT_BATCH_UPLOAD":
+            return self.handle_batch(message)
+        if message.type == "DOCUMENT_DELETE":
+            return self.handle_delete(message)
+        with self._lock:
+            result = self._ingest(message)
+        self.dispatcher.resolve(message.trace_id, result)
+        return result
+
+    def _ingest(self, message):
+        """
+        Ingest the one file of a DOCUMENT_UPLOAD (see handle) and return its result.
         """
         file_path = message.payload["file_path"]
         file_type = message.payload["file_type"]
-        text = self.parsers[file_type](file_path)
-        chunks = chunk_text(text)
-        embeddings = get_embeddings(chunks)
-        self.vector_store.add_embeddings(embeddings, chunks)
+        source = message.payload.get("source", file_path)
+        content_hash = message.payload.get("content_hash") or file_hash(file_path)
+        if content_hash in self.vector_store.ingested_hashes:
+            print(f"[IngestionAgent] Skipping {file_path}, already ingested")
+            return {"file_path": file_path, "chunks": 0, "skipped": True}
+        previous = self.vector_store.metadata.doc_ids_for(source)
+        doc_id = self.vector_store.add_document(source, content_hash)
+        # Chunks are embedded and indexed in batches while parsing is still going,
+        # so peak memory depends on the batch size rather than on the size of the document
+        n_chunks, n_duplicates, n_near, batch, metas = 0, 0, 0, [], []
+        chunks = iter_chunks(file_path, file_type, self.segment_parsers, self.parsers)
+        for chunk, location in tracer.iterate("chunk", chunks, file_type=file_type):
+            batch.append(chunk)
+            metas.append(dict(location, doc_id=doc_id))
+            if len(batch) == config.BATCH_EMBED_SIZE:
+                indexed = index_chunks(self.vector_store, self.embedder, self.embedding_cache, batch, metas)
+                n_duplicates, n_near = n_duplicates + indexed.duplicates, n_near + indexed.near_duplicates
+                n_chunks += len(batch)
+                batch, metas = [], []
+        indexed = index_chunks(self.vector_store, self.embedder, self.embedding_cache, batch, metas)
+        n_duplicates, n_near = n_duplicates + indexed.duplicates, n_near + indexed.near_duplicates
+        n_chunks += len(batch)
+        self.embedder.save(config.EMBEDDER_PATH)
+        self.vector_store.ingested_hashes.add(content_hash)
+        # The new version is searchable now, so the old one can go (this only tombstones its chunks)
+        for old_doc_id in previous:
+            self.vector_store.remove_document(old_doc_id)
+        self._changed(1)
         print(f"[IngestionAgent] Ingested {file_path}")
+        return {"file_path": file_path, "doc_id": doc_id, "chunks": n_chunks, "duplicates": n_duplicates,
+                "near_duplicates": n_near, "skipped": False}
+
+    def handle_batch(self, message):
+        """
+        Ingest many files in one go: parsing runs in a process pool, embedding in large batches,
+        and every file ingested counts as one change towards the next snapshot.
+        """
+        with self._lock:
+            summary = ingest_files(message.payload["file_paths"], self.vector_store, self.embedder, self.embedding_cache,
+                                   sources=message.payload.get("sources"),
+                                   content_hashes=message.payload.get("content_hashes"))
+            self._changed(summary["files"])
+        print(f"[IngestionAgent] Batch ingested: {summary}")
+        self.dispatcher.resolve(message.trace_id, summary)
+        return summary
+
+    def handle_delete(self, message):
+        """
+        Remove a document, by "doc_id" or by "source" (every document ingested from it).
+        """
+        with self._lock:
+            doc_ids = [message.payload["doc_id"]] if "doc_id" in message.payload \
+                else self.vector_store.metadata.doc_ids_for(message.payload["source"])
+            removed = sum(self.vector_store.remove_document(doc_id) for doc_id in doc_ids)
+            self._changed(len(doc_ids))
+        print(f"[IngestionAgent] Removed documents {doc_ids} ({removed} chunks)")
+        result = {"doc_ids": doc_ids, "chunks": removed}
+        self.dispatcher.resolve(message.trace_id, result)
+        return result
+
+    def _changed(self, n):
+        """
+        Count n more documents ingested or removed since the last snapshot, and take one if that makes
+        SNAPSHOT_EVERY of them (or on every change, with SNAPSHOT_ON_INGEST). A snapshot rewrites the whole
+        store, so taking one per upload would make each upload cost O(corpus).
+        """
+        with self._lock:
+            self._unsaved += n
+            if self._unsaved and (config.SNAPSHOT_ON_INGEST or self._unsaved >= config.SNAPSHOT_EVERY):
+                self.flush()
+
+    def flush(self):
+        """
+        Snapshot the vector store if anything changed since the last snapshot.
+        """
+        with self._lock:
+            if not self._unsaved:
+                return
+            with tracer.span("snapshot", changes=self._unsaved):
+                self.vector_store.save(config.INDEX_PATH)
+            self._unsaved = 0
+            self._last_snapshot = time.monotonic()
+
+    def start_snapshots(self, interval=config.SNAPSHOT_INTERVAL):
+        """
+        Also snapshot unsaved changes every interval seconds (0 = only every SNAPSHOT_EVERY changes),
+        from a background thread, and once more when the process exits.
+        """
+        atexit.register(self.flush)
+        if interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                if time.monotonic() - self._last_snapshot >= interval:
+                    self.flush()
+
+        threading.Thread(target=run, name="IngestionAgent-snapshots", daemon=True).start()
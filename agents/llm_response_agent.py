@@ -1,49 +1,158 @@
-import cohere
-import streamlit as st  # ✅ added this
+import threading
+
+import config
+from agents.response_cache import ResponseCache
+from embeddings.embedder import get_embedder
+from llm.client import LLMError
+from llm.factory import create_llm_client
+from mcp.tracing import tracer
+from utils.context import pack_context
+from utils.tokens import count_tokens
 
 # This agent is the "answer writer"—it takes the context and your question, and crafts a response using the LLM.
 # Think of it as the helpful expert who reads your notes and gives you a clear answer!
 
-# Initialize Cohere client with your API key
-co = cohere.Client("UPCowgiMPtKn1fI04uJGEjWVGm9dY9kLqXS9m3PD")
+_PROMPT = "Context:\n{context}\n\nQuestion: {query}"
+
+def build_prompt(context, query, token_budget=config.PROMPT_TOKEN_BUDGET, sources=None):
+    """
+    Combine the retrieved context (chunk texts, best first) and the user's question into one prompt of at
+    most token_budget (estimated) tokens. The question is always kept whole; the chunks are packed into
+    whatever room is left (see utils.context), labelled with their sources if given.
+    Returns the prompt and the PackedContext describing what made it in.
+    """
+    room = token_budget - count_tokens(_PROMPT.format(context="", query=query))
+    packed = pack_context(context, room, sources)
+    return _PROMPT.format(context=packed.text, query=query), packed
 
 class LLMResponseAgent:
-    def __init__(self, dispatcher):
+    def __init__(self, dispatcher, response_cache=None, client=None, prompt_budget=config.PROMPT_TOKEN_BUDGET):
         """
         Set up the LLMResponseAgent and register it so it can handle answer requests.
+        Answers are cached, so the same question over the same retrieved chunks never hits the API twice.
+        client is an llm.client.LLMClient; by default one for the configured backend (RAG_LLM_BACKEND).
+        Prompts are kept within prompt_budget (estimated) tokens, and their sizes are tallied (see prompt_stats).
         """
         self.dispatcher = dispatcher
+        self.response_cache = response_cache or ResponseCache(embedder=get_embedder())
+        self.client = client or create_llm_client()
+        self.prompt_budget = prompt_budget
+        # Prompt accounting; handlers may run on several threads at once (see the async dispatcher)
+        self._stats_lock = threading.Lock()
+        self._prompts = {"prompts": 0, "prompt_tokens": 0, "max_prompt_tokens": 0, "truncated": 0,
+                         "duplicate_sentences": 0}
         dispatcher.register_agent("LLMResponseAgent", self.handle)
 
     def handle(self, message):
         """
         When a context and question arrive, this method:
-        1. Builds a prompt for the LLM using the context and question
-        2. Calls the Cohere LLM to generate an answer
-        3. Saves the answer to Streamlit session state for the UI to display
+        1. Checks the answer cache (same question, same chunks, same settings)
+        2. Otherwise builds a prompt for the LLM using the context and question, packed into the token budget
+        3. Calls the LLM to generate an answer (with a deadline, and retries), and caches it
+        4. Resolves the request's trace ID with the answer, waking up whoever is waiting for it
+        If the payload asks to "stream", the result is a generator that yields the answer
+        token by token as the LLM produces it.
+        Building the prompt and calling the LLM are traced as "prompt_build" and "llm_call" spans.
         """
         context = message.payload["retrieved_context"]
         query = message.payload["query"]
+        sources = message.payload.get("sources")
+        # Which chunks were retrieved; fall back to the chunk text itself if the sender didn't say
+        chunk_ids = message.payload.get("chunk_ids", context)
+        settings = (config.LLM_MODEL, config.LLM_TEMPERATURE, config.LLM_MAX_TOKENS)
 
-        # Formulate prompt combining context and user query
-        prompt = f"Context:\n{context}\n\nQuestion: {query}"
+        if self.dispatcher.is_cancelled(message.trace_id):
+            # Whoever asked has given up (timed out or cancelled), so don't spend an LLM call on it
+            return None
+
+        cached = self.response_cache.get(query, chunk_ids, *settings)
+        tracer.annotate(cache_hit=cached is not None)
+        if message.payload.get("stream"):
+            tokens = iter([cached]) if cached is not None else self._stream_answer(context, query, chunk_ids, settings,
+                                                                                     sources, message.trace_id)
+            self.dispatcher.resolve(message.trace_id, tokens)
+            return tokens
 
-        # Call Cohere LLM
-        response = co.generate(
-            model="command-r-plus",  # Or 'command' if on free tier
-            prompt=prompt,
-            max_tokens=300,
-            temperature=0.3
-        )
+        if cached is not None:
+            print("Answer (cached):", cached)
+            self.dispatcher.resolve(message.trace_id, cached)
+            return cached
 
-        # Safety check for generations response
-        if response.generations:
-            answer = response.generations[0].text.strip()
+        # Formulate prompt combining context and user query
+        prompt = self._prompt(context, query, sources, message.trace_id)
 
-            # ✅ Save result to Streamlit session state
-            st.session_state["llm_response"] = answer
+        # Call the LLM
+        model, temperature, max_tokens = settings
+        try:
+            with tracer.span("llm_call", message.trace_id, model=model, stream=False):
+                answer = self.client.complete(prompt, model=model, max_tokens=max_tokens, temperature=temperature).strip()
+        except LLMError as e:
+            print(f"[LLMResponseAgent] {e}")
+            answer = ""
 
+        # Safety check: an empty answer (or a failed call) isn't cached
+        if answer:
+            self.response_cache.put(query, chunk_ids, *settings, answer)
             print("Answer:", answer)  # optional for terminal log
         else:
-            st.session_state["llm_response"] = "No response generated."
+            answer = "No response generated."
             print("No response generated.")
+        self.dispatcher.resolve(message.trace_id, answer)
+        return answer
+
+    def _stream_answer(self, context, query, chunk_ids, settings, sources=None, trace_id=None):
+        """
+        Yield the answer one token at a time, straight from the LLM's streaming API.
+        Once the whole answer has arrived, it goes into the cache like any other; an answer cut off by an
+        error or the deadline isn't cached.
+        The "llm_call" span only counts time spent waiting on the LLM (not the caller's reading of the
+        stream); its first_item_ms is the time to the first token.
+        """
+        prompt = self._prompt(context, query, sources, trace_id)
+        model, temperature, max_tokens = settings
+        answer = ""
+        tokens = self.client.stream(prompt, model=model, max_tokens=max_tokens, temperature=temperature)
+        traced = tracer.iterate("llm_call", tokens, trace_id, model=model, stream=True)
+        try:
+            for text in traced:
+                answer += text
+                yield text
+        except LLMError as e:
+            print(f"[LLMResponseAgent] {e}")
+            if answer:
+                return
+        answer = answer.strip()
+        if answer:
+            self.response_cache.put(query, chunk_ids, *settings, answer)
+            print("Answer (streamed):", answer)
+        else:
+            yield "No response generated."
+
+    def _prompt(self, context, query, sources, trace_id):
+        """
+        Build the prompt for one request, and log and tally its size.
+        """
+        with tracer.span("prompt_build", trace_id, chunks=len(context)) as span:
+            prompt, packed = build_prompt(context, query, self.prompt_budget, sources)
+            tokens = count_tokens(prompt)
+            span.set(prompt_tokens=tokens, packed_chunks=packed.chunks, truncated=packed.truncated,
+                     duplicate_sentences=packed.duplicates)
+        with self._stats_lock:
+            self._prompts["prompts"] += 1
+            self._prompts["prompt_tokens"] += tokens
+            self._prompts["max_prompt_tokens"] = max(self._prompts["max_prompt_tokens"], tokens)
+            self._prompts["truncated"] += packed.truncated
+            self._prompts["duplicate_sentences"] += packed.duplicates
+        print(f"[LLMResponseAgent] {trace_id}: prompt of {tokens} tokens, {packed.chunks} of {len(context)} chunks"
+              f"{' (truncated)' if packed.truncated else ''}, {packed.duplicates} repeated sentences left out")
+        return prompt
+
+    def prompt_stats(self):
+        """
+        Totals over every prompt built so far: how many, their tokens (total, mean and largest), how many had
+        to be truncated to fit the budget, and how many repeated sentences were left out.
+        """
+        with self._stats_lock:
+            stats = dict(self._prompts)
+        stats["mean_prompt_tokens"] = stats["prompt_tokens"] / stats["prompts"] if stats["prompts"] else 0.0
+        return stats
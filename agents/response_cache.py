@@ -0,0 +1,105 @@
+# This module remembers answers the LLM already gave, so asking the same thing twice doesn't cost another API call.
+# An answer is reused only if the question, the retrieved chunks and the generation settings all match.
+# Optionally, near-duplicate questions ("what is X?" vs "what's X") can reuse an answer too.
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+def normalise_query(query):
+    """
+    Lowercase, squash whitespace and drop trailing punctuation, so trivial differences still hit the cache.
+    """
+    return re.sub(r"\s+", " ", query.lower()).strip().rstrip("?!. ")
+
+
+def context_hash(chunk_ids):
+    """
+    A short fingerprint of which chunks were retrieved (and in what order).
+    """
+    return hashlib.sha256("\x1f".join(str(i) for i in chunk_ids).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_items=config.RESPONSE_CACHE_SIZE, ttl=config.RESPONSE_CACHE_TTL,
+                 similarity_threshold=config.RESPONSE_CACHE_SIMILARITY, embedder=None):
+        """
+        Set up the answer cache. Entries expire after ttl seconds, and the oldest ones are evicted past max_items.
+        If similarity_threshold > 0 and an embedder is given, near-duplicate questions can also hit.
+        """
+        self.max_items = max_items
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embedder = embedder
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def semantic(self):
+        return self.similarity_threshold > 0 and self.embedder is not None
+
+    def _embed(self, query):
+        """
+        Embed a normalised query, remembering which embedder version produced it.
+        """
+        return self.embedder.query_version, self.embedder.transform_query([query])
+
+    def get(self, query, chunk_ids, model, temperature, max_tokens):
+        """
+        Look up an answer. Returns None on a miss (or if the matching entry has expired).
+        """
+        query = normalise_query(query)
+        settings = (context_hash(chunk_ids), model, temperature, max_tokens)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((query,) + settings)
+            if entry is not None and entry["expires_at"] > now:
+                self._entries.move_to_end((query,) + settings)
+                self.hits += 1
+                return entry["answer"]
+            if self.semantic:
+                version, vector = self._embed(query)
+                best_key, best_score = None, self.similarity_threshold
+                for key, entry in self._entries.items():
+                    if key[1:] != settings or entry["expires_at"] <= now or entry["vector"] is None:
+                        continue
+                    if entry["vector"][0] != version:
+                        continue
+                    score = vector.multiply(entry["vector"][1]).sum()
+                    if score >= best_score:
+                        best_key, best_score = key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key]["answer"]
+            self.misses += 1
+            return None
+
+    def put(self, query, chunk_ids, model, temperature, max_tokens, answer):
+        """
+        Remember an answer, evicting expired entries and then the least recently used ones if we're full.
+        """
+        query = normalise_query(query)
+        key = (query, context_hash(chunk_ids), model, temperature, max_tokens)
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "expires_at": time.monotonic() + self.ttl,
+                "vector": self._embed(query) if self.semantic else None,
+            }
+            self._entries.move_to_end(key)
+            now = time.monotonic()
+            for old_key in [k for k, e in self._entries.items() if e["expires_at"] <= now]:
+                del self._entries[old_key]
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses, "items": len(self._entries)}
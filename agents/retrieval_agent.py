@@ -1,32 +1,104 @@
 # This agent is like your research assistant—it finds the most relevant parts of your documents for any question you ask!
-from embeddings.embedder import get_embeddings
+import config
+from embeddings.embedder import get_embedder
+from embeddings.cache import get_embedding_cache
 from mcp.message_dispatcher import MCPMessage
+from mcp.tracing import tracer
+from utils.reranking import rerank
 
 class RetrievalAgent:
-    def __init__(self, dispatcher, vector_store):
+    def __init__(self, dispatcher, vector_store, embedder=None, embedding_cache=None, top_k=3,
+                 candidates=config.RERANK_CANDIDATES, token_budget=config.CONTEXT_TOKEN_BUDGET):
         """
         Set up the RetrievalAgent with access to the dispatcher and the vector store.
         Registers itself so it can respond to search requests from the UI or other agents.
+        Several queries that arrive together may be handled in one go (see handle_many).
+        Each search fetches candidates chunks, which are reranked down to top_k within token_budget tokens.
         """
         self.dispatcher = dispatcher
         self.vector_store = vector_store
-        dispatcher.register_agent("RetrievalAgent", self.handle)
+        self.embedder = embedder or get_embedder()
+        self.embedding_cache = embedding_cache or get_embedding_cache()
+        self.top_k = top_k
+        self.candidates = candidates
+        self.token_budget = token_budget
+        dispatcher.register_agent("RetrievalAgent", self.handle, batch_handler=self.handle_many)
 
     def handle(self, message):
         """
-        When a question comes in, this method:
-        1. Turns the question into an embedding (a math-y representation)
-        2. Searches the vector store for the most relevant document chunks
-        3. Packages up the results and sends them to the LLMResponseAgent
+        When a question comes in (QUERY_REQUEST), this method:
+        1. Turns the question into an embedding (a cheap transform with the already-fitted embedder, or a cache hit)
+        2. Searches the vector store for the most relevant document chunks (only within the
+           documents listed in the optional "doc_ids" payload field, if there is one). When the store
+           keeps a BM25 index, the search is hybrid: keyword matches are fused with the vector matches
+        3. Reranks the candidates (see utils.reranking) and keeps the best top_k that fit the token budget
+        4. Packages up the results and sends them to the LLMResponseAgent
+        Whatever the LLMResponseAgent returns (an answer, or a token stream) is passed back to the caller.
+        A QUERY_BATCH_REQUEST (payload: "queries", a list) only retrieves: it's answered with one
+        {"query", "chunk_ids", "retrieved_context", "sources"} dict per query, and no LLM is involved.
         """
-        query = message.payload["query"]
-        query_embedding = get_embeddings([query])[0]
-        top_chunks = self.vector_store.search(query_embedding)
-        response = MCPMessage(
-            sender="RetrievalAgent",
-            receiver="LLMResponseAgent",
-            type="RETRIEVAL_RESULT",
-            trace_id=message.trace_id,
-            payload={"retrieved_context": top_chunks, "query": query}
-        )
-        self.dispatcher.send_message(response)
+        return self.handle_many([message])[0]
+
+    def handle_many(self, messages):
+        """
+        Handle several messages at once: every query among them is embedded in one call, and searched
+        in one vector store call per distinct doc_ids filter, so the index is scanned once for the lot.
+        Returns one result per message, in order.
+        The stages are traced as "query_embed", "search" and "rerank" spans.
+        """
+        queries, owners = [], []
+        for i, message in enumerate(messages):
+            batch = message.payload["queries"] if message.type == "QUERY_BATCH_REQUEST" else [message.payload["query"]]
+            queries.extend(batch)
+            owners.extend([i] * len(batch))
+        query_embeddings = None
+        # An embedder that was never fitted means nothing has been ingested yet: there's nothing to find
+        if queries and self.embedder.is_fitted:
+            with tracer.span("query_embed", queries=len(queries)):
+                query_embeddings = self.embedding_cache.transform(self.embedder, queries, query=True)
+        # Queries with the same filter (and top_k) can share a search
+        groups = {}
+        for row, i in enumerate(owners):
+            doc_ids = messages[i].payload.get("doc_ids")
+            key = (None if doc_ids is None else tuple(sorted(doc_ids)), messages[i].payload.get("top_k", self.top_k))
+            groups.setdefault(key, []).append(row)
+        retrieved = [None] * len(queries)
+        for (doc_ids, top_k), rows in groups.items():
+            with tracer.span("search", queries=len(rows), top_k=max(top_k, self.candidates), filtered=doc_ids is not None):
+                if query_embeddings is None:
+                    found = [[] for _ in rows]
+                else:
+                    found = self.vector_store.search_ids_batch(query_embeddings[rows], max(top_k, self.candidates),
+                                                               doc_ids, [queries[row] for row in rows])
+            with tracer.span("rerank", queries=len(rows), top_k=top_k):
+                for row, ids in zip(rows, found):
+                    texts = {chunk_id: self.vector_store.get_chunk(chunk_id) for chunk_id in ids if chunk_id >= 0}
+                    ids = rerank(queries[row], texts.items(), top_k, self.token_budget)
+                    retrieved[row] = {
+                        "query": queries[row],
+                        "chunk_ids": ids,
+                        "retrieved_context": [texts[chunk_id] for chunk_id in ids],
+                        "sources": [self.vector_store.get_metadata(chunk_id) for chunk_id in ids],
+                    }
+
+        results, row = [], 0
+        for message in messages:
+            if message.type == "QUERY_BATCH_REQUEST":
+                batch = retrieved[row:row + len(message.payload["queries"])]
+                row += len(batch)
+                self.dispatcher.resolve(message.trace_id, batch)
+                results.append(batch)
+                continue
+            found = retrieved[row]
+            row += 1
+            response = MCPMessage(
+                sender="RetrievalAgent",
+                receiver="LLMResponseAgent",
+                type="RETRIEVAL_RESULT",
+                trace_id=message.trace_id,
+                payload={"retrieved_context": found["retrieved_context"], "chunk_ids": found["chunk_ids"],
+                         "sources": found["sources"], "query": found["query"],
+                         "stream": message.payload.get("stream", False)}
+            )
+            results.append(self.dispatcher.send_message(response))
+        return results
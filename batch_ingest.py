@@ -0,0 +1,46 @@
+# This is the bulk-loading entry point: point it at thousands of files (or folders) and it ingests them all.
+# The work is done by utils.indexing.ingest_files: parsing runs in a pool of worker processes, embedding
+# happens in big batches, and chunks are committed to the vector store in bulk, with one snapshot at the very end.
+#
+#   python batch_ingest.py docs/ reports/2024.pdf --workers 8
+import argparse
+import os
+
+import config
+from parsers.registry import PARSERS
+from embeddings.embedder import get_embedder
+from utils.indexing import ingest_files
+from vector_store.factory import load_or_create_vector_store
+
+
+def find_files(paths):
+    """
+    Expand a mix of files and folders into the list of files we know how to parse.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            found.append(path)
+    return [path for path in found if path.rsplit(".", 1)[-1].lower() in PARSERS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest documents into the vector store.")
+    parser.add_argument("paths", nargs="+", help="files or folders to ingest")
+    parser.add_argument("--workers", type=int, default=config.BATCH_WORKERS, help="parser processes")
+    parser.add_argument("--batch-size", type=int, default=config.BATCH_EMBED_SIZE, help="chunks per embedding batch")
+    args = parser.parse_args()
+
+    vector_store = load_or_create_vector_store(embedder=get_embedder())
+    files = find_files(args.paths)
+    print(f"[batch] Found {len(files)} files")
+    summary = ingest_files(files, vector_store, workers=args.workers, batch_size=args.batch_size)
+    vector_store.save(config.INDEX_PATH)
+    print(f"[batch] Done: {summary}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# This script measures what the approximate FAISS indexes cost in accuracy, and what they buy in speed.
+# Every index kind is checked against an exact flat search: recall@k is the share of the true top-k it finds.
+#
+#   python benchmark_ann.py --n 200000 --k 10
+#   python benchmark_ann.py --from-index        # use the vectors in the saved vector store instead
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+import config
+from vector_store.ann import build_index, search_params, train_index
+
+
+def synthetic_vectors(n, dim, seed=0):
+    """
+    Clustered random vectors (a mixture of Gaussians), which behave more like real embeddings than uniform noise.
+    Like our embeddings, they're float32 and L2-normalised.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, n // 1000), dim)).astype(np.float32)
+    vectors = centres[rng.integers(len(centres), size=n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def stored_vectors(path=config.INDEX_PATH):
+    """
+    The live vectors of the saved FAISS vector store.
+    """
+    from vector_store.faiss_store import VectorStore
+    store = VectorStore.load(path)
+    chunk_ids = np.ascontiguousarray(store.metadata.column("chunk_id")[store.metadata.live_mask()])
+    return store.index.reconstruct_batch(chunk_ids)
+
+
+def recall_at_k(found, truth):
+    """
+    Average share of the true top-k neighbours that were found.
+    """
+    k = truth.shape[1]
+    return float(np.mean([len(set(f[f >= 0]) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def benchmark(vectors, queries, k, configs, metric=config.FAISS_METRIC):
+    """
+    Build each (kind, knobs) config over vectors, run queries, and yield one result dict per config.
+    The first result is always the exact flat baseline.
+    """
+    ids = np.arange(len(vectors), dtype=np.int64)
+    truth = None
+    built = {}
+    for kind, knobs in [("flat", {})] + configs:
+        if kind not in built:
+            started = time.perf_counter()
+            index = build_index(kind, vectors.shape[1], len(vectors), metric)
+            train_index(index, vectors)
+            index.add_with_ids(vectors, ids)
+            built[kind] = (index, time.perf_counter() - started)
+        index, build_seconds = built[kind]
+        params = search_params(kind, **knobs)
+        started = time.perf_counter()
+        D, I = index.search(queries, k, params=params)
+        search_seconds = time.perf_counter() - started
+        if truth is None:
+            truth = I
+        yield {
+            "index": kind,
+            "knobs": ", ".join(f"{name}={value}" for name, value in knobs.items()) or "-",
+            "recall": recall_at_k(I, truth),
+            "ms_per_query": 1000 * search_seconds / len(queries),
+            "build_s": build_seconds,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare approximate FAISS indexes against exact search.")
+    parser.add_argument("--n", type=int, default=100000, help="number of synthetic vectors")
+    parser.add_argument("--dim", type=int, default=config.EMBEDDING_DIM, help="synthetic vector size")
+    parser.add_argument("--from-index", action="store_true", help="benchmark the saved vector store's vectors")
+    parser.add_argument("--queries", type=int, default=500, help="number of queries")
+    parser.add_argument("--k", type=int, default=10, help="neighbours per query (the k in recall@k)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64], help="IVF buckets to scan")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256], help="HNSW search breadth")
+    parser.add_argument("--kinds", nargs="+", default=["ivf", "ivfpq", "hnsw"], help="index kinds to try")
+    parser.add_argument("--metric", choices=["ip", "l2"], default=config.FAISS_METRIC, help="similarity metric")
+    args = parser.parse_args()
+
+    vectors = stored_vectors() if args.from_index else synthetic_vectors(args.n, args.dim)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed copies of stored vectors, so each one has real near neighbours
+    queries = vectors[rng.integers(len(vectors), size=args.queries)]
+    queries = np.ascontiguousarray(queries + 0.1 * rng.normal(size=queries.shape), dtype=np.float32)
+    faiss.normalize_L2(queries)
+    configs = []
+    for kind in args.kinds:
+        if kind in ("ivf", "ivfpq"):
+            configs += [(kind, {"nprobe": nprobe}) for nprobe in args.nprobe]
+        elif kind == "hnsw":
+            configs += [(kind, {"ef_search": ef}) for ef in args.ef_search]
+    faiss.omp_set_num_threads(1)
+
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries, recall@{args.k} vs flat ({args.metric})")
+    print(f"{'index':<8}{'knobs':<16}{'recall':>8}{'ms/query':>11}{'build s':>10}")
+    for row in benchmark(vectors, queries, args.k, configs, args.metric):
+        print(f"{row['index']:<8}{row['knobs']:<16}{row['recall']:>8.3f}{row['ms_per_query']:>11.3f}{row['build_s']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
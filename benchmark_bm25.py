@@ -0,0 +1,126 @@
+# This script measures what hybrid retrieval adds to a query: the BM25 keyword search and the
+# reciprocal-rank fusion with the vector results. It also checks what the max_postings shortcut
+# (see vector_store.bm25) costs in accuracy: "recall" is the share of the hits it returns that score at
+# least as high as the k-th hit of exact scoring (ties make comparing the lists themselves meaningless).
+#
+#   python benchmark_bm25.py --n 1000000
+#   python benchmark_bm25.py --from-index        # use the chunks in the saved vector store instead
+import argparse
+import time
+
+import numpy as np
+
+import config
+from vector_store.bm25 import BM25Index, tokenize
+from vector_store.fusion import reciprocal_rank_fusion
+
+
+def synthetic_chunks(n, words_per_chunk=60, vocabulary=200000, seed=0):
+    """
+    Random chunks whose word frequencies follow Zipf's law, like real text: a few words are
+    everywhere, most are rare.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array([f"w{i}" for i in range(vocabulary)])
+    for start in range(0, n, 10000):
+        size = min(10000, n - start)
+        ids = np.minimum(rng.zipf(1.3, size=(size, words_per_chunk)) - 1, vocabulary - 1)
+        yield from (" ".join(words[row]) for row in ids)
+
+
+def stored_chunks(path=config.INDEX_PATH):
+    """
+    The live chunk texts of the saved vector store.
+    """
+    from vector_store.faiss_store import VectorStore
+    store = VectorStore.load(path)
+    return [store.chunks[i] for i in np.flatnonzero(store.metadata.live_mask())]
+
+
+def build(chunks, batch_size=config.BATCH_EMBED_SIZE, **params):
+    """
+    Build a BM25 index the way ingestion does, one batch of chunks at a time. Returns it and the seconds taken.
+    """
+    index = BM25Index(**params)
+    started = time.perf_counter()
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            index.add(batch)
+            batch = []
+    index.add(batch)
+    return index, time.perf_counter() - started
+
+
+def make_queries(index, n_queries, seed=1):
+    """
+    Queries of a few shapes: rare terms only, a mix, and common (but not stopword) terms only—the slowest kind.
+    """
+    rng = np.random.default_rng(seed)
+    terms = np.array(sorted(index.vocabulary, key=index.vocabulary.get))
+    doc_freq = np.frombuffer(index.doc_freq, dtype=np.int64)
+    n_docs = len(index)
+    rare = terms[(doc_freq > 0) & (doc_freq <= max(1, n_docs // 1000))]
+    common = terms[(doc_freq > n_docs // 100) & (doc_freq <= index.max_df * n_docs)]
+    shapes = {"rare": [rare], "mixed": [rare, common], "common": [common]}
+    queries = {}
+    for shape, pools in shapes.items():
+        if any(len(pool) == 0 for pool in pools):
+            continue
+        queries[shape] = [" ".join(rng.choice(pools[i % len(pools)]) for i in range(rng.integers(2, 6)))
+                          for _ in range(n_queries)]
+    return queries
+
+
+def exact_search(index, query, k):
+    """
+    BM25 with the max_postings shortcut turned off.
+    """
+    max_postings, index.max_postings = index.max_postings, len(index) + 1
+    try:
+        return index.search(query, k)
+    finally:
+        index.max_postings = max_postings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure BM25 keyword search and rank fusion latency.")
+    parser.add_argument("--n", type=int, default=200000, help="number of synthetic chunks")
+    parser.add_argument("--from-index", action="store_true", help="benchmark the saved vector store's chunks")
+    parser.add_argument("--queries", type=int, default=200, help="queries per query shape")
+    parser.add_argument("--k", type=int, default=config.HYBRID_CANDIDATES, help="BM25 hits per query")
+    parser.add_argument("--max-postings", type=int, default=config.BM25_MAX_POSTINGS, help="see RAG_BM25_MAX_POSTINGS")
+    args = parser.parse_args()
+
+    chunks = stored_chunks() if args.from_index else synthetic_chunks(args.n)
+    index, build_seconds = build(chunks, k1=config.BM25_K1, b=config.BM25_B, max_df=config.BM25_MAX_DF,
+                                 max_postings=args.max_postings)
+    n_postings = sum(segment.nnz for _, segment in index.segments)
+    print(f"{len(index)} chunks, {len(index.vocabulary)} terms, {n_postings} postings, "
+          f"indexed in {build_seconds:.1f}s ({len(index) / max(build_seconds, 1e-9):.0f} chunks/s)")
+    print(f"{'queries':<10}{'terms':>7}{'p50 ms':>9}{'p99 ms':>9}{'recall@k':>10}")
+    for shape, queries in make_queries(index, args.queries).items():
+        for query in queries:
+            # The first search for a common term caches its best postings; time the steady state
+            index.search(query, args.k)
+        # Stand-ins for the vector hits the BM25 hits get fused with
+        vector_hits = np.random.default_rng(2).integers(len(index), size=(len(queries), args.k)).tolist()
+        timings, recall = [], []
+        for query, vector in zip(queries, vector_hits):
+            started = time.perf_counter()
+            reciprocal_rank_fusion([vector, index.search(query, args.k)], args.k)
+            timings.append(1000 * (time.perf_counter() - started))
+        for query in queries[:20]:
+            exact = exact_search(index, query, args.k)
+            found = index.search(query, args.k)
+            if exact:
+                threshold = index.score(query, exact[-1:])[0]
+                recall.append(np.mean(index.score(query, found) >= threshold - 1e-9) * len(found) / len(exact))
+        n_terms = np.mean([len(set(tokenize(query))) for query in queries])
+        print(f"{shape:<10}{n_terms:>7.1f}{np.percentile(timings, 50):>9.3f}{np.percentile(timings, 99):>9.3f}"
+              f"{np.mean(recall):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
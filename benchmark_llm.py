@@ -0,0 +1,82 @@
+# This script shows what the LLM client's knobs do under load, against the fake backend (no API calls):
+# chats arriving at a steady rate, where a few calls are very slow and a few fail, the way a real API behaves
+# when busy. It runs the same workload with and without hedging and reports latency percentiles (from each
+# chat's arrival, so time spent queueing for a slot counts) and throughput.
+#
+#   python benchmark_llm.py --chats 500 --rate 100 --concurrency 32 --tail-rate 0.05 --hedge-after 0.3
+#   python benchmark_llm.py --rate 0             # every chat at once: the concurrency cap is what matters
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+import config
+from llm.client import LLMClient, LLMError
+from llm.fake_backend import FakeBackend
+
+
+async def run_chats(client, n_chats, rate, stream, seed=0):
+    """
+    Send n_chats prompts, arriving at random at rate chats per second (all at once if rate is 0); returns each
+    one's latency in seconds (to the first token, when streaming) and how many failed.
+    """
+    gaps = np.random.default_rng(seed).exponential(1 / rate, n_chats) if rate > 0 else np.zeros(n_chats)
+    arrivals = np.cumsum(gaps)
+
+    async def chat(i):
+        await asyncio.sleep(arrivals[i])
+        started = time.perf_counter()
+        prompt = f"Context:\nbenchmark\n\nQuestion: question {i}"
+        if stream:
+            tokens = client.astream(prompt)
+            try:
+                await tokens.__anext__()
+                latency = time.perf_counter() - started
+                async for _ in tokens:
+                    pass
+            finally:
+                await tokens.aclose()
+            return latency
+        await client.acomplete(prompt)
+        return time.perf_counter() - started
+
+    results = await asyncio.gather(*(chat(i) for i in range(n_chats)), return_exceptions=True)
+    latencies = [r for r in results if not isinstance(r, BaseException)]
+    failed = [r for r in results if isinstance(r, BaseException)]
+    for error in failed:
+        if not isinstance(error, LLMError):
+            raise error
+    return latencies, len(failed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure LLM client latency under many concurrent chats.")
+    parser.add_argument("--chats", type=int, default=500, help="number of chats")
+    parser.add_argument("--rate", type=float, default=100, help="chats arriving per second (0: all at once)")
+    parser.add_argument("--concurrency", type=int, default=config.LLM_MAX_CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--latency", type=float, default=0.1, help="backend time to first token (s)")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="backend delay per token (s)")
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="extra delay of a slow call (s)")
+    parser.add_argument("--tail-rate", type=float, default=0.05, help="fraction of slow calls")
+    parser.add_argument("--failure-rate", type=float, default=0.02, help="fraction of failing calls")
+    parser.add_argument("--hedge-after", type=float, default=0.3, help="hedge delay for the hedged run (s)")
+    parser.add_argument("--stream", action="store_true", help="stream answers (latency is time to first token)")
+    args = parser.parse_args()
+
+    print(f"{'run':<12}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'chats/s':>9}{'failed':>8}  client stats")
+    for name, hedge_after in (("no hedging", 0.0), ("hedged", args.hedge_after)):
+        backend = FakeBackend(latency=args.latency, token_delay=args.token_delay, tail_latency=args.tail_latency,
+                              tail_rate=args.tail_rate, failure_rate=args.failure_rate)
+        client = LLMClient(backend, max_concurrency=args.concurrency, hedge_after=hedge_after)
+        started = time.perf_counter()
+        latencies, failed = asyncio.run_coroutine_threadsafe(
+            run_chats(client, args.chats, args.rate, args.stream), client.loop).result()
+        elapsed = time.perf_counter() - started
+        client.close()
+        p50, p95, p99 = 1000 * np.percentile(latencies, [50, 95, 99])
+        print(f"{name:<12}{p50:>9.0f}{p95:>9.0f}{p99:>9.0f}{args.chats / elapsed:>9.1f}{failed:>8}  {client.stats}")
+
+
+if __name__ == "__main__":
+    main()
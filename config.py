@@ -0,0 +1,169 @@
+# This module keeps all the knobs for the system in one place.
+# Every setting can be overridden with an environment variable, so Heroku (or your shell) can tweak things without code changes.
+import os
+
+# Where we keep anything that should survive a restart (fitted models, indexes, caches...)
+DATA_DIR = os.getenv("RAG_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+# Embeddings
+EMBEDDING_DIM = int(os.getenv("RAG_EMBEDDING_DIM", "384"))
+EMBEDDER_PATH = os.getenv("RAG_EMBEDDER_PATH", os.path.join(DATA_DIR, "embedder.joblib"))
+# Which embedder to use: "tfidf" learns a vocabulary per corpus, "hashing" is stateless so new
+# documents can be appended without re-embedding anything already indexed.
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "tfidf")
+# Hashing backend only: re-weight queries with IDF statistics that are updated as documents arrive
+HASHING_USE_IDF = os.getenv("RAG_HASHING_USE_IDF", "1") == "1"
+# TF-IDF backend only: once the store holds this many times the chunks the vocabulary was learned from,
+# refit it on all of them and re-embed the store (0 = keep the first vocabulary for good)
+EMBEDDER_REFIT_GROWTH = float(os.getenv("RAG_EMBEDDER_REFIT_GROWTH", "2"))
+
+# Embedding cache: how many vectors to keep in memory, and whether to also keep them in SQLite on disk
+EMBEDDING_CACHE_SIZE = int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "50000"))
+EMBEDDING_CACHE_DISK = os.getenv("RAG_EMBEDDING_CACHE_DISK", "0") == "1"
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", os.path.join(DATA_DIR, "embedding_cache.sqlite"))
+
+# Vector store
+# "faiss" keeps dense vectors in a FAISS index; "sparse" keeps the CSR matrices the embedders produce
+# and scores queries through an inverted index, which is far lighter for TF-IDF/hashing vectors.
+VECTOR_STORE_BACKEND = os.getenv("RAG_VECTOR_STORE_BACKEND", "faiss")
+# Snapshots of the index + chunk table live here; the app warm-starts from the latest one
+INDEX_PATH = os.getenv("RAG_INDEX_PATH", os.path.join(DATA_DIR, "index"))
+# A snapshot rewrites the whole store, so it's taken once SNAPSHOT_EVERY documents have been ingested or
+# removed since the last one, every SNAPSHOT_INTERVAL seconds if anything changed (0 = no timer), and on
+# shutdown. SNAPSHOT_ON_INGEST takes one after every single change instead.
+SNAPSHOT_ON_INGEST = os.getenv("RAG_SNAPSHOT_ON_INGEST", "0") == "1"
+SNAPSHOT_EVERY = int(os.getenv("RAG_SNAPSHOT_EVERY", "20"))
+SNAPSHOT_INTERVAL = float(os.getenv("RAG_SNAPSHOT_INTERVAL", "300"))
+# Removed documents are only tombstoned; once more than this fraction of the chunks are tombstones,
+# they're all swept out of the index at once (compaction)
+COMPACT_THRESHOLD = float(os.getenv("RAG_COMPACT_THRESHOLD", "0.25"))
+
+# FAISS index type: "flat" (exact), "ivf", "ivfpq" or "hnsw" (approximate), or "auto": exact until the
+# store holds FAISS_ANN_THRESHOLD chunks, then rebuilt once as FAISS_AUTO_INDEX
+FAISS_INDEX = os.getenv("RAG_FAISS_INDEX", "auto")
+# How FAISS compares vectors: "ip" (inner product, i.e. cosine similarity, since our embeddings are
+# L2-normalised) or "l2" (Euclidean distance; indexes saved before this option existed use it)
+FAISS_METRIC = os.getenv("RAG_FAISS_METRIC", "ip")
+FAISS_AUTO_INDEX = os.getenv("RAG_FAISS_AUTO_INDEX", "ivf")
+FAISS_ANN_THRESHOLD = int(os.getenv("RAG_FAISS_ANN_THRESHOLD", "50000"))
+# ANN training and tuning: vectors sampled for training, IVF buckets (0 = about 4 * sqrt(chunks)) and
+# buckets scanned per query, PQ sub-vectors, HNSW links per node and search/construction breadth
+ANN_TRAIN_SAMPLE = int(os.getenv("RAG_ANN_TRAIN_SAMPLE", "100000"))
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("RAG_PQ_M", "16"))
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+
+# Hybrid retrieval: a BM25 keyword index over every word of every chunk is kept next to the vector index,
+# and each query's top HYBRID_CANDIDATES from both are merged by reciprocal-rank fusion (constant RRF_K).
+# BM25_MAX_DF: query terms found in more than this fraction of the chunks are ignored, like stopwords.
+# BM25_MAX_POSTINGS: a term in more chunks than this only brings its best-scoring chunks into a search,
+# which keeps each query to a few milliseconds at a million chunks.
+HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+BM25_K1 = float(os.getenv("RAG_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("RAG_BM25_B", "0.75"))
+BM25_MAX_DF = float(os.getenv("RAG_BM25_MAX_DF", "0.5"))
+BM25_MAX_POSTINGS = int(os.getenv("RAG_BM25_MAX_POSTINGS", "1000"))
+
+# Duplicate detection at ingest: a chunk with the same text (up to case and spacing) as one already stored
+# isn't embedded again—the document references the existing chunk. Chunks whose word 3-grams overlap
+# another's by at least DEDUP_THRESHOLD (Jaccard) are counted as near-duplicates, but kept.
+# Candidates are found by MinHash LSH with DEDUP_BANDS bands of DEDUP_ROWS hashes each.
+DEDUP = os.getenv("RAG_DEDUP", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.9"))
+DEDUP_BANDS = int(os.getenv("RAG_DEDUP_BANDS", "8"))
+DEDUP_ROWS = int(os.getenv("RAG_DEDUP_ROWS", "8"))
+
+# Reranking: retrieval over-fetches RERANK_CANDIDATES chunks per question, and a local reranker picks the
+# ones that go into the prompt: at most top_k, within CONTEXT_TOKEN_BUDGET (estimated) tokens.
+# RERANK_DIVERSITY is the MMR trade-off: 0 ranks on relevance alone, higher values penalise near-duplicates.
+RERANK_CANDIDATES = int(os.getenv("RAG_RERANK_CANDIDATES", "20"))
+RERANK_DIVERSITY = float(os.getenv("RAG_RERANK_DIVERSITY", "0.3"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+# Hard cap on the whole prompt (question, instructions and packed context), in (estimated) tokens.
+# Keep it below the model's context window minus LLM_MAX_TOKENS.
+PROMPT_TOKEN_BUDGET = int(os.getenv("RAG_PROMPT_TOKEN_BUDGET", "2000"))
+
+# LLM
+# "cohere" calls the real API; "fake" is a local, deterministic stand-in for tests and benchmarks
+LLM_BACKEND = os.getenv("RAG_LLM_BACKEND", "cohere")
+LLM_MODEL = os.getenv("RAG_LLM_MODEL", "command-r-plus")  # Or 'command' if on free tier
+LLM_MAX_TOKENS = int(os.getenv("RAG_LLM_MAX_TOKENS", "300"))
+LLM_TEMPERATURE = float(os.getenv("RAG_LLM_TEMPERATURE", "0.3"))
+COHERE_API_KEY = os.getenv("COHERE_API_KEY", "")
+COHERE_API_URL = os.getenv("RAG_COHERE_API_URL", "https://api.cohere.ai/v1")
+
+# LLM client: every call gets a deadline of LLM_TIMEOUT seconds (retries included), is retried up to
+# LLM_RETRIES times on retryable errors after a jittered pause of up to LLM_RETRY_BACKOFF * 2^attempt
+# seconds, and waits for one of LLM_MAX_CONCURRENCY slots; LLM_POOL_SIZE caps open connections to the API.
+# LLM_HEDGE_AFTER (seconds, 0 = off) starts a second attempt when the first hasn't answered by then.
+LLM_TIMEOUT = float(os.getenv("RAG_LLM_TIMEOUT", "30"))
+LLM_RETRIES = int(os.getenv("RAG_LLM_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("RAG_LLM_RETRY_BACKOFF", "0.5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("RAG_LLM_MAX_CONCURRENCY", "16"))
+LLM_POOL_SIZE = int(os.getenv("RAG_LLM_POOL_SIZE", "32"))
+LLM_HEDGE_AFTER = float(os.getenv("RAG_LLM_HEDGE_AFTER", "0"))
+# The fake backend's time to first token and per-token delay, in seconds
+LLM_FAKE_LATENCY = float(os.getenv("RAG_LLM_FAKE_LATENCY", "0"))
+LLM_FAKE_TOKEN_DELAY = float(os.getenv("RAG_LLM_FAKE_TOKEN_DELAY", "0"))
+
+# Answer cache in front of the LLM: max entries, time-to-live in seconds, and (optionally) a cosine
+# similarity threshold above which a near-duplicate question reuses a cached answer (0 turns that off)
+RESPONSE_CACHE_SIZE = int(os.getenv("RAG_RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RAG_RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RAG_RESPONSE_CACHE_SIMILARITY", "0"))
+
+# Dispatcher
+# "sync" delivers every message on the caller's stack; "async" gives each agent its own bounded
+# queue and a pool of workers on a background event loop, so slow LLM calls don't block everything else
+DISPATCHER_MODE = os.getenv("RAG_DISPATCHER_MODE", "sync")
+# How many messages may wait in an agent's queue before senders are made to wait (backpressure)
+DISPATCHER_QUEUE_SIZE = int(os.getenv("RAG_DISPATCHER_QUEUE_SIZE", "100"))
+# Workers per agent, e.g. "IngestionAgent=1,RetrievalAgent=4,LLMResponseAgent=8"; others get DISPATCHER_DEFAULT_WORKERS.
+# Keep IngestionAgent at 1 so documents are written to the vector store one at a time.
+DISPATCHER_DEFAULT_WORKERS = int(os.getenv("RAG_DISPATCHER_DEFAULT_WORKERS", "4"))
+DISPATCHER_WORKERS = {
+    name.strip(): int(count)
+    for name, count in (
+        item.split("=") for item in os.getenv(
+            "RAG_DISPATCHER_WORKERS", "IngestionAgent=1,RetrievalAgent=4,LLMResponseAgent=8"
+        ).split(",") if item.strip()
+    )
+}
+
+# Async mode only: queries that reach the RetrievalAgent within this many seconds of each other are
+# searched together in one batch (at most DISPATCHER_COALESCE_MAX at a time); 0 turns that off
+DISPATCHER_COALESCE_WINDOW = float(os.getenv("RAG_DISPATCHER_COALESCE_WINDOW", "0.002"))
+DISPATCHER_COALESCE_MAX = int(os.getenv("RAG_DISPATCHER_COALESCE_MAX", "32"))
+
+# Tracing: every message hop and every stage inside the agents is timed as a span (see mcp/tracing.py).
+# Spans are appended to TRACE_FILE as JSON lines (empty = don't write them), which is rotated to
+# TRACE_FILE + ".1" past TRACE_FILE_MAX_BYTES; latency, queue-wait and payload-size histograms are served
+# in the Prometheus text format at http://METRICS_HOST:METRICS_PORT/metrics (port 0 = no endpoint). The
+# endpoint only listens on loopback unless METRICS_HOST says otherwise (e.g. "0.0.0.0" for every interface).
+TRACING = os.getenv("RAG_TRACING", "1") == "1"
+TRACE_FILE = os.getenv("RAG_TRACE_FILE", os.path.join(DATA_DIR, "traces.jsonl"))
+TRACE_FILE_MAX_BYTES = int(os.getenv("RAG_TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+METRICS_PORT = int(os.getenv("RAG_METRICS_PORT", "9464"))
+METRICS_HOST = os.getenv("RAG_METRICS_HOST", "127.0.0.1")
+
+# How long (in seconds) the UI waits for an answer to start, or for a document to be ingested
+REQUEST_TIMEOUT = float(os.getenv("RAG_REQUEST_TIMEOUT", "60"))
+INGEST_TIMEOUT = float(os.getenv("RAG_INGEST_TIMEOUT", "600"))
+
+# Batch ingestion: parser processes, and how many chunks to embed per batch
+BATCH_WORKERS = int(os.getenv("RAG_BATCH_WORKERS", str(os.cpu_count() or 1)))
+BATCH_EMBED_SIZE = int(os.getenv("RAG_BATCH_EMBED_SIZE", "2048"))
+
+# Chunking: the most (estimated) LLM tokens per chunk, and how many tokens of whole sentences each chunk
+# repeats from the one before it. Chunks are cut between sentences, preferably between paragraphs.
+CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "300"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "40"))
+
+# CSV ingestion: rows read from disk at a time, and the most characters per chunk of whole rows
+CSV_READ_ROWS = int(os.getenv("RAG_CSV_READ_ROWS", "5000"))
+CSV_CHUNK_CHARS = int(os.getenv("RAG_CSV_CHUNK_CHARS", "3000"))
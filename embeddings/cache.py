@@ -0,0 +1,135 @@
+# This module remembers embeddings we've already computed, so the same text is never embedded twice.
+# Entries are keyed by (embedder version, SHA-256 of the text): a recent-items tier lives in memory,
+# and an optional SQLite tier on disk keeps them across restarts.
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+
+import config
+
+
+def text_key(version, text):
+    """
+    The cache key for one piece of text embedded by a given embedder version.
+    """
+    return f"{version}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+class EmbeddingCache:
+    def __init__(self, max_items=config.EMBEDDING_CACHE_SIZE, db_path=None):
+        """
+        Set up the cache. max_items caps the in-memory LRU tier; pass db_path to also keep a SQLite tier on disk.
+        """
+        self.max_items = max_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER, indices BLOB, data BLOB)"
+            )
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key, row):
+        self._memory[key] = row
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Look up one embedding row (a 1 x dim CSR matrix). Returns None on a miss.
+        """
+        with self._lock:
+            row = self._memory.get(key)
+            if row is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return row
+            if self._db is not None:
+                found = self._db.execute("SELECT dim, indices, data FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if found is not None:
+                    dim, indices, data = found
+                    indices = np.frombuffer(indices, dtype=np.int32)
+                    data = np.frombuffer(data, dtype=np.float32)
+                    row = sp.csr_matrix((data, indices, [0, len(indices)]), shape=(1, dim))
+                    self._remember(key, row)
+                    self.disk_hits += 1
+                    return row
+            self.misses += 1
+            return None
+
+    def put_many(self, items):
+        """
+        Store several (key, row) pairs at once (one disk transaction for all of them).
+        """
+        with self._lock:
+            for key, row in items:
+                self._remember(key, row)
+            if self._db is not None:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                        [(key, row.shape[1], row.indices.astype(np.int32).tobytes(), row.data.astype(np.float32).tobytes())
+                         for key, row in items],
+                    )
+
+    def transform(self, embedder, texts, query=False):
+        """
+        Embed texts with the embedder, reusing cached rows and computing only the misses (in one batch).
+        Set query=True for search queries so they go through embedder.transform_query.
+        """
+        version = embedder.query_version if query else embedder.version
+        keys = [text_key(version, text) for text in texts]
+        rows = [self.get(key) for key in keys]
+        missing = [i for i, row in enumerate(rows) if row is None]
+        if missing:
+            embed = embedder.transform_query if query else embedder.transform
+            computed = sp.csr_matrix(embed([texts[i] for i in missing]))
+            new_items = []
+            for j, i in enumerate(missing):
+                rows[i] = computed[j]
+                new_items.append((keys[i], rows[i]))
+            self.put_many(new_items)
+        if not rows:
+            return sp.csr_matrix((0, embedder.dim))
+        return sp.vstack(rows, format="csr")
+
+    def stats(self):
+        """
+        Hit/miss counters, handy for the UI or logs.
+        """
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+
+_cache = None
+
+
+def get_embedding_cache():
+    """
+    Returns the process-wide embedding cache, with the disk tier turned on if the config asks for it.
+    """
+    global _cache
+    if _cache is None:
+        db_path = None
+        if config.EMBEDDING_CACHE_DISK:
+            os.makedirs(os.path.dirname(config.EMBEDDING_CACHE_PATH) or ".", exist_ok=True)
+            db_path = config.EMBEDDING_CACHE_PATH
+        _cache = EmbeddingCache(db_path=db_path)
+    return _cache
@@ -1,19 +1,235 @@
 # This module helps us turn chunks of text into numbers (embeddings) that the AI can understand.
 # Think of it as translating words into a language the computer is really good at: math!
-from sklearn.feature_extraction.text import TfidfVectorizer
+import hashlib
+import os
+import uuid
+
+import joblib
 import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+import config
+
+
+class Embedder:
+    """
+    The bits every embedder shares: saving/loading its state and embedding queries.
+    Subclasses provide fit, partial_fit and transform, and keep version up to date:
+    two embedders with the same version turn the same text into the same vector.
+    Every vector they return is a float32 CSR row with unit L2 length (or all zeros for text with
+    no known words), so a dot product is a cosine similarity and the vector stores can take the
+    vectors as they are, without converting or copying them.
+    """
+    is_fitted = False
+    version = None
+
+    def needs_refit(self, n_chunks):
+        """
+        Whether the stored vectors should all be re-embedded with a refitted embedder, now that the
+        store holds n_chunks live chunks. Embedders whose vectors don't depend on the corpus never do.
+        """
+        return False
+
+    @property
+    def query_version(self):
+        """
+        Like version, but for transform_query (which may use extra state, such as running IDF).
+        """
+        return self.version
+
+    def fit_transform(self, text_chunks):
+        """
+        Fit on the chunks and embed them in one go.
+        """
+        return self.fit(text_chunks).transform(text_chunks)
+
+    def transform_query(self, queries):
+        """
+        Embed search queries. By default a query is embedded exactly like a chunk.
+        """
+        return self.transform(queries)
+
+    def save(self, path):
+        """
+        Write the fitted state to disk so the next startup doesn't have to refit.
+        We write to a temp file first and then swap it in, so a crash never leaves half a file behind.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        joblib.dump(self, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Bring a previously saved embedder back to life.
+        """
+        return joblib.load(path)
+
+
+class TfidfEmbedder(Embedder):
+    def __init__(self, dim=config.EMBEDDING_DIM):
+        """
+        Set up a TF-IDF embedder with a fixed output size.
+        It has to learn a vocabulary once (fit) before it can turn text into vectors (transform).
+        """
+        self.dim = dim
+        self.vectorizer = TfidfVectorizer(max_features=dim, dtype=np.float32)
+        self.is_fitted = False
+        # How many chunks the vocabulary was learned from
+        self.n_fitted = 0
+
+    def fit(self, text_chunks):
+        """
+        Learn the vocabulary and word weights from a whole corpus of chunks.
+        Every vector must live in the same space, so after a refit the whole store has to be
+        re-embedded (see BaseVectorStore.reembed).
+        """
+        self.vectorizer.fit(text_chunks)
+        self.is_fitted = True
+        self.n_fitted = len(text_chunks)
+        # The vector space is fully described by the vocabulary and the IDF weights
+        digest = hashlib.sha256(repr(sorted(self.vectorizer.vocabulary_.items())).encode("utf-8"))
+        digest.update(self.vectorizer.idf_.tobytes())
+        self.version = f"tfidf-{self.dim}-{digest.hexdigest()[:16]}"
+        return self
+
+    def partial_fit(self, text_chunks):
+        """
+        The vocabulary is frozen once learned, so extra documents only matter if we were never fitted.
+        Words it doesn't know are caught up with by the next refit (see needs_refit).
+        """
+        if not self.is_fitted:
+            self.fit(text_chunks)
+        return self
+
+    def needs_refit(self, n_chunks, growth=config.EMBEDDER_REFIT_GROWTH):
+        """
+        Refit once the corpus has grown to growth times the chunks the vocabulary was learned from
+        (0 = never), so words from later documents get into it. Re-embedding costs O(corpus), but as
+        the corpus has to double (by default) each time, that's O(1) per chunk on average.
+        """
+        # Embedders saved before n_fitted existed count as fitted on nothing, and refit at once
+        return self.is_fitted and growth > 0 and n_chunks >= growth * getattr(self, "n_fitted", 0)
+
+    def transform(self, text_chunks):
+        """
+        Turn text into fixed-size sparse (CSR) vectors using the vocabulary we already learned.
+        If the vocabulary is smaller than dim, the extra columns are simply empty—no dense padding needed.
+        TfidfVectorizer already L2-normalises every row.
+        """
+        # Embedders saved before the float32 contract still produce float64, hence the (usually free) cast
+        vectors = self.vectorizer.transform(text_chunks).tocsr().astype(np.float32, copy=False)
+        if vectors.shape[1] < self.dim:
+            vectors = sp.csr_matrix((vectors.data, vectors.indices, vectors.indptr), shape=(vectors.shape[0], self.dim))
+        return vectors
+
+
+class HashingEmbedder(Embedder):
+    def __init__(self, dim=config.EMBEDDING_DIM, use_idf=config.HASHING_USE_IDF):
+        """
+        Set up a stateless embedder that hashes words straight into dim buckets.
+        There is no vocabulary to learn, so a chunk's vector never changes as the corpus grows.
+        """
+        self.dim = dim
+        self.use_idf = use_idf
+        self.vectorizer = HashingVectorizer(n_features=dim, alternate_sign=False, norm=None, dtype=np.float32)
+        # Running document-frequency counts, only used to re-weight queries
+        self.doc_freq = np.zeros(dim)
+        self.n_docs = 0
+        self.is_fitted = True
+        self.version = f"hashing-{dim}"
+        # Changes whenever the IDF statistics do, since those affect query vectors
+        self._idf_version = uuid.uuid4().hex
+
+    def fit(self, text_chunks):
+        """
+        Start a fresh corpus: forget the old IDF statistics and count these chunks.
+        """
+        self.doc_freq = np.zeros(self.dim)
+        self.n_docs = 0
+        self._idf_version = uuid.uuid4().hex
+        return self.partial_fit(text_chunks)
+
+    def partial_fit(self, text_chunks):
+        """
+        Add new chunks to the running IDF statistics. This costs O(new chunks)—nothing already indexed is touched.
+        """
+        if self.use_idf and len(text_chunks):
+            counts = self.vectorizer.transform(text_chunks)
+            self.doc_freq += np.bincount(counts.indices, minlength=self.dim)
+            self.n_docs += counts.shape[0]
+            self._idf_version = uuid.uuid4().hex
+        return self
+
+    @property
+    def query_version(self):
+        return f"{self.version}-idf-{self._idf_version}" if self.use_idf else self.version
+
+    def transform(self, text_chunks):
+        """
+        Turn chunks into sparse L2-normalised term-frequency vectors. No fitted state is involved,
+        so vectors stored yesterday are still comparable with vectors made today.
+        """
+        return normalize(self.vectorizer.transform(text_chunks).astype(np.float32, copy=False))
+
+    def transform_query(self, queries):
+        """
+        Embed queries, applying the IDF correction on the query side only.
+        That way rare words still count for more, without ever re-embedding the stored chunks.
+        """
+        counts = self.vectorizer.transform(queries).astype(np.float32, copy=False)
+        if self.use_idf and self.n_docs:
+            idf = (np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1).astype(np.float32)
+            counts = counts.multiply(idf).tocsr()
+        return normalize(counts)
+
+
+EMBEDDERS = {
+    "tfidf": TfidfEmbedder,
+    "hashing": HashingEmbedder,
+}
+
+
+def create_embedder(backend=config.EMBEDDING_BACKEND):
+    """
+    Build a fresh embedder of the requested kind ("tfidf" or "hashing").
+    """
+    if backend not in EMBEDDERS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    return EMBEDDERS[backend]()
+
+
+_embedder = None
+
+
+def get_embedder(path=config.EMBEDDER_PATH, backend=config.EMBEDDING_BACKEND):
+    """
+    Returns the process-wide embedder, reloading the fitted state from disk on first use if we have one.
+    A saved embedder of a different kind than the configured backend is ignored; a vector store
+    embedded with it gets re-embedded (see BaseVectorStore.ensure_embedder).
+    """
+    global _embedder
+    if _embedder is None:
+        if os.path.exists(path):
+            saved = Embedder.load(path)
+            if isinstance(saved, EMBEDDERS.get(backend, ())):
+                _embedder = saved
+            else:
+                print(f"[Embedder] Ignoring the saved {type(saved).__name__} in {path}: the backend is {backend}")
+        if _embedder is None:
+            _embedder = create_embedder(backend)
+    return _embedder
 
-vectorizer = TfidfVectorizer(max_features=384)  # fixed dimensionality
 
 def get_embeddings(text_chunks):
     """
-    Converts a list of text chunks into fixed-size numerical vectors (embeddings).
-    If there aren't enough features, we pad with zeros so every chunk is the same size.
+    Converts a list of text chunks into fixed-size numerical vectors (embeddings), as a float32 sparse CSR
+    matrix with L2-normalised rows.
+    Uses the shared embedder, fitting it on these chunks only if it has never been fitted.
     """
-    vectors = vectorizer.fit_transform(text_chunks).toarray()
-    # Padding in case fewer than 384 features are found
-    if vectors.shape[1] < 384:
-        padded = np.zeros((vectors.shape[0], 384))
-        padded[:, :vectors.shape[1]] = vectors
-        return padded
-    return vectors
+    embedder = get_embedder()
+    embedder.partial_fit(text_chunks)
+    return embedder.transform(text_chunks)
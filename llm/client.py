@@ -0,0 +1,206 @@
+# This module is the one way the agents talk to an LLM. A backend (the Cohere API, or a local fake) only
+# knows how to make a single call; the client wraps every call in what a busy chat service needs: a deadline
+# per request, retries with jittered exponential backoff, a cap on how many calls are in flight at once,
+# and optionally a hedged second attempt when the first one is slow to answer.
+# Calls run on one background event loop, so every thread that asks for an answer shares the backend's
+# pooled HTTP connections, and the concurrency cap holds across all of them.
+import asyncio
+import random
+import threading
+
+import config
+
+
+class LLMError(Exception):
+    def __init__(self, message, retryable=False):
+        """
+        An LLM call that failed. retryable says whether trying again might help (rate limits, server
+        errors, dropped connections) or not (a bad request, a wrong API key).
+        """
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class LLMTimeoutError(LLMError, TimeoutError):
+    def __init__(self, timeout):
+        """
+        A request that ran past its deadline (retries and waiting for a free slot included).
+        """
+        super().__init__(f"No answer from the LLM within {timeout}s")
+
+
+async def _next(tokens):
+    # run_coroutine_threadsafe wants a coroutine, not the awaitable __anext__ returns
+    try:
+        return await tokens.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _close(tokens):
+    await tokens.aclose()
+
+
+class LLMClient:
+    def __init__(self, backend, timeout=config.LLM_TIMEOUT, retries=config.LLM_RETRIES,
+                 backoff=config.LLM_RETRY_BACKOFF, max_concurrency=config.LLM_MAX_CONCURRENCY,
+                 hedge_after=config.LLM_HEDGE_AFTER):
+        """
+        Wrap a backend. timeout is each request's deadline in seconds; a failed attempt is retried up to
+        retries times if the error is retryable, after a random pause of up to backoff * 2^attempt seconds
+        ("full jitter", so clients that failed together don't retry together). At most max_concurrency
+        calls reach the backend at once; the rest wait their turn. If hedge_after is set and an attempt
+        hasn't answered after that many seconds, a second one is started (if there's a free slot) and
+        whichever answers first wins.
+        """
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_after = hedge_after
+        # Only ever touched on the event loop, so no lock needed
+        self.stats = {"requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0, "failures": 0}
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llm-client", daemon=True)
+        self._thread.start()
+        self._slots = asyncio.run_coroutine_threadsafe(self._make_slots(max_concurrency), self.loop).result()
+
+    async def _make_slots(self, max_concurrency):
+        return asyncio.Semaphore(max_concurrency)
+
+    async def acomplete(self, prompt, model=config.LLM_MODEL, max_tokens=config.LLM_MAX_TOKENS,
+                        temperature=config.LLM_TEMPERATURE, timeout=None):
+        """
+        The LLM's whole answer to a prompt, as a string. Must be awaited on the client's loop.
+        Raises LLMTimeoutError if the deadline passes, or the last LLMError once retries run out.
+        """
+        async def attempt():
+            async with self._slots:
+                return await self.backend.complete(prompt, model, max_tokens, temperature)
+
+        timeout = timeout or self.timeout
+        self.stats["requests"] += 1
+        return await self._within(self.loop.time() + timeout, timeout, self._call(attempt))
+
+    async def astream(self, prompt, model=config.LLM_MODEL, max_tokens=config.LLM_MAX_TOKENS,
+                      temperature=config.LLM_TEMPERATURE, timeout=None):
+        """
+        The LLM's answer as an async iterator of text pieces, as they're generated. Must be iterated on the
+        client's loop. Retries and hedging only apply until the first piece arrives (after that, a
+        second attempt would repeat text the caller has already seen); the deadline covers the whole stream.
+        """
+        async def attempt():
+            await self._slots.acquire()
+            tokens = self.backend.stream(prompt, model, max_tokens, temperature)
+            try:
+                return tokens, await tokens.__anext__()
+            except StopAsyncIteration:
+                return tokens, None
+            except BaseException:
+                await tokens.aclose()
+                self._slots.release()
+                raise
+
+        async def discard(started):
+            await started[0].aclose()
+            self._slots.release()
+
+        timeout = timeout or self.timeout
+        deadline = self.loop.time() + timeout
+        self.stats["requests"] += 1
+        tokens, text = await self._within(deadline, timeout, self._call(attempt, discard))
+        try:
+            while text is not None:
+                yield text
+                text = await self._within(deadline, timeout, _next(tokens))
+        finally:
+            await tokens.aclose()
+            self._slots.release()
+
+    async def _within(self, deadline, timeout, awaitable):
+        try:
+            return await asyncio.wait_for(awaitable, max(deadline - self.loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            raise LLMTimeoutError(timeout) from None
+
+    async def _call(self, attempt, discard=None):
+        """
+        Run attempt() (hedged), retrying retryable errors with jittered exponential backoff.
+        The caller's deadline cancels all of it, backoff pauses included.
+        """
+        for n in range(self.retries + 1):
+            try:
+                return await self._hedged(attempt, discard)
+            except LLMError as e:
+                if not e.retryable or n == self.retries:
+                    self.stats["failures"] += 1
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** n))
+
+    async def _hedged(self, attempt, discard=None):
+        """
+        Run attempt(), plus a second copy if the first hasn't finished within hedge_after seconds and
+        the backend has a free slot (hedging should cut the tail, not add load when we're already busy).
+        The first attempt to succeed wins; the other is cancelled, or handed to discard if it succeeded too.
+        """
+        def clean_up(task):
+            if discard is not None and not task.cancelled() and task.exception() is None:
+                asyncio.ensure_future(discard(task.result()))
+
+        attempts, winner = [asyncio.ensure_future(attempt())], None
+        try:
+            if self.hedge_after:
+                await asyncio.wait(attempts, timeout=self.hedge_after)
+                if not attempts[0].done() and not self._slots.locked():
+                    self.stats["hedges"] += 1
+                    attempts.append(asyncio.ensure_future(attempt()))
+            pending = set(attempts)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in attempts if task in done and task.exception() is None]
+                if succeeded:
+                    winner = succeeded[0]
+                    if winner is not attempts[0]:
+                        self.stats["hedge_wins"] += 1
+                    return winner.result()
+                if not pending:
+                    # Every attempt failed: report the first one's error
+                    raise attempts[0].exception()
+        finally:
+            for task in attempts:
+                if task is not winner:
+                    task.cancel()
+                    task.add_done_callback(clean_up)
+
+    def complete(self, prompt, model=config.LLM_MODEL, max_tokens=config.LLM_MAX_TOKENS,
+                 temperature=config.LLM_TEMPERATURE, timeout=None):
+        """
+        Like acomplete, for callers on ordinary threads (the agents): blocks until the answer is in.
+        """
+        coroutine = self.acomplete(prompt, model, max_tokens, temperature, timeout)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def stream(self, prompt, model=config.LLM_MODEL, max_tokens=config.LLM_MAX_TOKENS,
+               temperature=config.LLM_TEMPERATURE, timeout=None):
+        """
+        Like astream, for callers on ordinary threads: a plain generator of text pieces.
+        Stopping early (or dropping the generator) closes the stream and frees its slot.
+        """
+        tokens = self.astream(prompt, model, max_tokens, temperature, timeout)
+        try:
+            while True:
+                text = asyncio.run_coroutine_threadsafe(_next(tokens), self.loop).result()
+                if text is None:
+                    return
+                yield text
+        finally:
+            asyncio.run_coroutine_threadsafe(_close(tokens), self.loop).result()
+
+    def close(self):
+        """
+        Close the backend's connections and stop the event loop.
+        """
+        asyncio.run_coroutine_threadsafe(self.backend.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
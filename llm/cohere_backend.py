@@ -0,0 +1,86 @@
+# This module calls Cohere's generate endpoint over HTTP. One aiohttp session (a pool of keep-alive
+# connections) is shared by every call, instead of a new connection per answer. Failures come back as
+# LLMError, marked retryable when trying again could help (rate limits, server errors, dropped connections).
+import asyncio
+import json
+
+import aiohttp
+
+import config
+from llm.client import LLMError
+
+# Rate limited, or the server (or something in front of it) is struggling: worth another try
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CohereBackend:
+    def __init__(self, api_key=config.COHERE_API_KEY, base_url=config.COHERE_API_URL, pool_size=config.LLM_POOL_SIZE):
+        """
+        Set up the backend. The API key comes from the COHERE_API_KEY environment variable by default;
+        pool_size caps the open connections to the API.
+        """
+        if not api_key:
+            raise ValueError("No Cohere API key: set COHERE_API_KEY (or RAG_LLM_BACKEND=fake to run without one)")
+        self.api_key = api_key
+        self.url = base_url.rstrip("/") + "/generate"
+        self.pool_size = pool_size
+        self._session = None
+
+    def _get_session(self):
+        # Sessions belong to the event loop they're made on, so this is only created once a call is running
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            )
+        return self._session
+
+    async def _post(self, body):
+        try:
+            response = await self._get_session().post(self.url, json=body)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMError(f"Cohere request failed: {e}", retryable=True) from e
+        if response.status >= 400:
+            detail = await response.text()
+            response.release()
+            raise LLMError(f"Cohere returned {response.status}: {detail[:200]}",
+                           retryable=response.status in _RETRYABLE_STATUS)
+        return response
+
+    async def complete(self, prompt, model, max_tokens, temperature):
+        """
+        The whole generated text for a prompt ("" if the API generated nothing).
+        """
+        response = await self._post({"model": model, "prompt": prompt, "max_tokens": max_tokens,
+                                     "temperature": temperature})
+        try:
+            generations = (await response.json()).get("generations") or []
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMError(f"Cohere response cut off: {e}", retryable=True) from e
+        finally:
+            response.release()
+        return generations[0]["text"] if generations else ""
+
+    async def stream(self, prompt, model, max_tokens, temperature):
+        """
+        The generated text piece by piece. The streaming API sends one JSON object per line.
+        """
+        response = await self._post({"model": model, "prompt": prompt, "max_tokens": max_tokens,
+                                     "temperature": temperature, "stream": True})
+        try:
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event.get("is_finished"):
+                    return
+                if event.get("text"):
+                    yield event["text"]
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMError(f"Cohere stream cut off: {e}", retryable=True) from e
+        finally:
+            response.release()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,16 @@
+# This module picks which LLM backend to use, based on the config, and wraps it in the client.
+import config
+from llm.client import LLMClient
+
+
+def create_llm_client(backend=config.LLM_BACKEND):
+    """
+    Build an LLM client: "cohere" for the real API (needs COHERE_API_KEY), "fake" for the local stand-in.
+    """
+    if backend == "cohere":
+        from llm.cohere_backend import CohereBackend
+        return LLMClient(CohereBackend())
+    if backend == "fake":
+        from llm.fake_backend import FakeBackend
+        return LLMClient(FakeBackend(latency=config.LLM_FAKE_LATENCY, token_delay=config.LLM_FAKE_TOKEN_DELAY))
+    raise ValueError(f"Unknown LLM backend: {backend}")
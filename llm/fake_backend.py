@@ -0,0 +1,69 @@
+# This module is a stand-in for the Cohere API that never touches the network.
+# It always says the same thing for the same prompt, which makes it handy for tests, demos and
+# latency experiments. Its timing can be shaped too: a base latency, a per-token delay, and an occasional
+# slow call or failure (decided by a seeded random sequence, so a run can be repeated exactly), to see
+# what retries, hedging and the concurrency cap do to tail latency (see benchmark_llm.py).
+import asyncio
+import hashlib
+import random
+
+from llm.client import LLMError
+
+
+class FakeBackend:
+    def __init__(self, latency=0.0, token_delay=0.0, tail_latency=0.0, tail_rate=0.0, failure_rate=0.0, seed=0):
+        """
+        Set up the fake backend. Each call waits latency seconds before its first token (plus tail_latency,
+        for a tail_rate fraction of calls), then token_delay seconds per token. A failure_rate fraction
+        of calls fail with a retryable error instead, as an overloaded server would.
+        """
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tail_latency = tail_latency
+        self.tail_rate = tail_rate
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.calls = 0
+
+    def _answer(self, prompt, max_tokens):
+        """
+        Build a deterministic answer from the prompt, at most max_tokens words long.
+        """
+        question = prompt.rsplit("Question:", 1)[-1].strip()
+        fingerprint = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        words = f"This is a fake answer ({fingerprint}) to the question: {question}".split()
+        return words[:max_tokens]
+
+    async def _start(self):
+        """
+        Wait out the time to the first token, then (maybe) fail. The n-th call always behaves the same way.
+        """
+        rng = random.Random(f"{self.seed}:{self.calls}")
+        self.calls += 1
+        slow, fail = rng.random(), rng.random()
+        await asyncio.sleep(self.latency + (self.tail_latency if slow < self.tail_rate else 0.0))
+        if fail < self.failure_rate:
+            raise LLMError("Fake backend: simulated server error", retryable=True)
+
+    async def complete(self, prompt, model, max_tokens, temperature):
+        """
+        The whole answer, once every token has been "generated".
+        """
+        await self._start()
+        words = self._answer(prompt, max_tokens)
+        if self.token_delay:
+            await asyncio.sleep(self.token_delay * len(words))
+        return " ".join(words)
+
+    async def stream(self, prompt, model, max_tokens, temperature):
+        """
+        The answer one word at a time (with the spacing in front, like the real streaming API).
+        """
+        await self._start()
+        for i, word in enumerate(self._answer(prompt, max_tokens)):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+
+    async def close(self):
+        pass
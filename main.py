@@ -1,32 +1,45 @@
 # This is the main entry point for the backend system.
 # It sets up all the agents, the dispatcher, and the vector store—think of it as the "stage manager" for the whole show!
+from types import SimpleNamespace
+
+import config
 from mcp.message_dispatcher import MCPDispatcher
+from mcp.async_dispatcher import AsyncMCPDispatcher
+from mcp.tracing import tracer
 from agents.ingestion_agent import IngestionAgent
 from agents.retrieval_agent import RetrievalAgent
 from agents.llm_response_agent import LLMResponseAgent
-from vector_store.faiss_store import VectorStore
-import parsers.pdf_parser as pdf
-import parsers.pptx_parser as pptx
-import parsers.docx_parser as docx
-import parsers.csv_parser as csv
-import parsers.txt_parser as txt
+from vector_store.factory import load_or_create_vector_store
+from embeddings.embedder import get_embedder
+from parsers.registry import PARSERS
 from mcp.message_dispatcher import MCPMessage
 
-# Set up the core system components
-dispatcher = MCPDispatcher()
-vector_store = VectorStore(dim=384)
-
 # All the file parsers in one place
-parsers = {
-    "pdf": pdf.parse_pdf,
-    "pptx": pptx.parse_pptx,
-    "docx": docx.parse_docx,
-    "csv": csv.parse_csv,
-    "txt": txt.parse_txt
-}
+parsers = PARSERS
+
+
+def build_system():
+    """
+    Set up the core system components and register the agents so they can work together.
+    The vector store warm-starts from its last snapshot on disk, if there is one.
+    This is meant to run once per process—the UI keeps the result in a resource cache.
+    Also starts the metrics endpoint, if METRICS_PORT is set, and the ingestion agent's snapshot timer.
+    """
+    if config.TRACING and config.METRICS_PORT:
+        tracer.serve_metrics(config.METRICS_PORT, config.METRICS_HOST)
+    dispatcher = AsyncMCPDispatcher() if config.DISPATCHER_MODE == "async" else MCPDispatcher()
+    # Stored vectors have to come from the embedder the agents will embed queries with
+    vector_store = load_or_create_vector_store(embedder=get_embedder())
+    ingestion_agent = IngestionAgent(dispatcher, vector_store, parsers)
+    ingestion_agent.start_snapshots()
+    return SimpleNamespace(
+        dispatcher=dispatcher,
+        vector_store=vector_store,
+        ingestion_agent=ingestion_agent,
+        retrieval_agent=RetrievalAgent(dispatcher, vector_store),
+        llm_response_agent=LLMResponseAgent(dispatcher),
+    )
 
-# Register the agents so they can work together
-IngestionAgent(dispatcher, vector_store, parsers)
-RetrievalAgent(dispatcher, vector_store)
-LLMResponseAgent(dispatcher)
 
+if __name__ == "__main__":
+    system = build_system()
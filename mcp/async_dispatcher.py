@@ -0,0 +1,246 @@
+# This module is the "busy post office" version of the dispatcher.
+# Every agent gets its own bounded mailbox (an asyncio queue) and a few workers that empty it,
+# all running on a background event loop. One slow LLM call no longer holds up everybody else.
+import asyncio
+import concurrent.futures
+import contextvars
+import inspect
+import threading
+import time
+
+import config
+from mcp.message_dispatcher import MCPDispatcher, new_trace_id
+from mcp.tracing import payload_size, tracer
+
+
+def wait_result(result, timeout=None):
+    """
+    send_message may hand back a plain value (sync dispatcher) or a future (async dispatcher).
+    This waits for the future if there is one, so callers can treat both the same way.
+    """
+    if isinstance(result, concurrent.futures.Future):
+        return result.result(timeout)
+    return result
+
+
+class AsyncMCPDispatcher(MCPDispatcher):
+    def __init__(self, queue_size=config.DISPATCHER_QUEUE_SIZE, workers=config.DISPATCHER_WORKERS,
+                 default_workers=config.DISPATCHER_DEFAULT_WORKERS, coalesce_window=config.DISPATCHER_COALESCE_WINDOW,
+                 coalesce_max=config.DISPATCHER_COALESCE_MAX):
+        """
+        Start the background event loop. queue_size bounds every agent's mailbox; workers says how
+        many workers each agent gets (agents not listed get default_workers).
+        For agents with a batch handler, a worker that picks up a message waits up to coalesce_window
+        seconds for more (at most coalesce_max in all) and hands them to the batch handler together.
+        """
+        super().__init__()
+        self.queue_size = queue_size
+        self.workers = workers
+        self.default_workers = default_workers
+        self.coalesce_window = coalesce_window
+        self.coalesce_max = coalesce_max
+        self._queues = {}
+        self._tasks = []
+        # Messages still being worked on, by trace_id
+        self.in_flight = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(32, sum(workers.values()) + default_workers), thread_name_prefix="mcp-agent"
+        )
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="mcp-dispatcher", daemon=True)
+        self._thread.start()
+
+    def register_agent(self, agent_name, handler_func, batch_handler=None):
+        """
+        Register an agent so it can receive messages, and start its queue and workers.
+        """
+        super().register_agent(agent_name, handler_func, batch_handler)
+        asyncio.run_coroutine_threadsafe(self._start_agent(agent_name), self.loop).result()
+
+    async def _start_agent(self, agent_name):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queues[agent_name] = queue
+        for _ in range(self.workers.get(agent_name, self.default_workers)):
+            self._tasks.append(asyncio.ensure_future(self._worker(agent_name, queue)))
+
+    async def _worker(self, agent_name, queue):
+        """
+        Take messages off an agent's queue and run its handler. If the agent has a batch handler,
+        messages arriving within coalesce_window of each other are handled in one call.
+        Plain (blocking) handlers run in a thread pool so they never stall the event loop.
+        Each message gets a span (named after the agent) covering its handler call, with the time it
+        spent queued; the agent's own stage spans hang under the first message's span.
+        If the batch handler raises, each message is handled again on its own by the plain handler, so
+        one bad message only fails its own request (batch handlers must be safe to run again).
+        """
+        while True:
+            items = await self._take(agent_name, queue)
+            live, spans = [], []
+            try:
+                # Messages whose caller already gave up are skipped
+                live = [item for item in items if item[1].set_running_or_notify_cancel()]
+                spans = [self._start_span(message, enqueued_at, len(live)) for message, _, enqueued_at in live]
+                outcomes = []
+                if len(live) > 1:
+                    try:
+                        values = await self._call(self.batch_handlers[agent_name], [message for message, _, _ in live], spans[0])
+                        outcomes = [(value, None) for value in values]
+                    except Exception:
+                        for (message, _, _), span in zip(live, spans):
+                            outcomes.append(await self._call_each(agent_name, message, span))
+                elif live:
+                    outcomes = [await self._call_each(agent_name, live[0][0], spans[0])]
+                for span, (_, error) in zip(spans, outcomes):
+                    tracer.finish(span, error)
+                spans = []
+                for (_, result, _), (_, error) in zip(live, outcomes):
+                    if error is not None:
+                        result.set_exception(error)
+                await asyncio.gather(*(self._settle(result, value)
+                                       for (_, result, _), (value, error) in zip(live, outcomes) if error is None))
+            except Exception as e:
+                for span in spans:
+                    tracer.finish(span, e)
+                for _, result, _ in live:
+                    if not result.done():
+                        result.set_exception(e)
+            finally:
+                for _ in items:
+                    queue.task_done()
+
+    async def _take(self, agent_name, queue):
+        """
+        Wait for the next message; for agents with a batch handler, also gather whatever else arrives
+        within coalesce_window (up to coalesce_max messages).
+        """
+        items = [await queue.get()]
+        if agent_name not in self.batch_handlers or self.coalesce_window <= 0:
+            return items
+        deadline = self.loop.time() + self.coalesce_window
+        while len(items) < self.coalesce_max:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    def _start_span(self, message, enqueued_at, batch_size):
+        queue_wait = time.perf_counter() - enqueued_at
+        size = payload_size(message.payload)
+        tracer.observe_message(message.receiver, queue_wait, size)
+        return tracer.start(message.receiver, message.trace_id, parent_id=message.parent_span_id, type=message.type,
+                            sender=message.sender, payload_bytes=size, queue_wait_ms=round(1000 * queue_wait, 3),
+                            batch_size=batch_size)
+
+    async def _call(self, handler, argument, span):
+        """
+        Run a handler with span as the current span: awaited here if it's a coroutine function,
+        otherwise in the thread pool (which doesn't carry the current span over by itself, so it's copied in).
+        """
+        with tracer.activate(span):
+            if inspect.iscoroutinefunction(handler):
+                return await handler(argument)
+            context = contextvars.copy_context()
+        return await self.loop.run_in_executor(self._executor, context.run, handler, argument)
+
+    async def _call_each(self, agent_name, message, span):
+        """
+        Run the agent's plain handler on one message, returning (value, None), or (None, error) if it raised.
+        """
+        try:
+            return await self._call(self.handlers[agent_name], message, span), None
+        except Exception as e:
+            return None, e
+
+    async def _settle(self, result, value):
+        """
+        Complete a message's future with its handler's value. A handler may forward the message and
+        return the next agent's future: then we wait for that too.
+        """
+        try:
+            while isinstance(value, concurrent.futures.Future) or inspect.isawaitable(value):
+                if isinstance(value, concurrent.futures.Future):
+                    forwarded = asyncio.wrap_future(value)
+                    await asyncio.wait([forwarded])
+                    if not forwarded.cancelled():
+                        # The error is reported through value below; this just marks the wrapper's as seen
+                        forwarded.exception()
+                    # .result() re-raises the next agent's error (or CancelledError if it was cancelled)
+                    value = value.result()
+                else:
+                    value = await value
+            result.set_result(value)
+        except Exception as e:
+            result.set_exception(e)
+
+    async def _enqueue(self, message, result):
+        """
+        Put a message in its agent's queue. If the queue is full this waits—that's our backpressure.
+        """
+        await self._queues[message.receiver].put((message, result, time.perf_counter()))
+
+    def send_message(self, message):
+        """
+        Queue a message for the right agent and return a future for the agent's result.
+        From a normal thread you get a concurrent.futures.Future (this call blocks while the agent's
+        queue is full); from inside the event loop you get an awaitable instead.
+        If the agent isn't found, print a warning and return None.
+        """
+        if message.trace_id is None:
+            message.trace_id = new_trace_id()
+        if message.receiver not in self.handlers:
+            print(f"No handler found for {message.receiver}")
+            return None
+        sender_span = tracer.current_span()
+        if message.parent_span_id is None and sender_span is not None and sender_span.trace_id == message.trace_id:
+            message.parent_span_id = sender_span.span_id
+        result = concurrent.futures.Future()
+        self.in_flight[message.trace_id] = result
+        result.add_done_callback(lambda _: self._forget(message.trace_id, result))
+        if self._in_loop():
+            return self.loop.create_task(self._enqueue_and_wait(message, result))
+        asyncio.run_coroutine_threadsafe(self._enqueue(message, result), self.loop).result()
+        return result
+
+    async def _enqueue_and_wait(self, message, result):
+        await self._enqueue(message, result)
+        return await asyncio.wrap_future(result)
+
+    def get_future(self, trace_id):
+        """
+        The future for a message that's still being worked on, looked up by its trace_id.
+        """
+        return self.in_flight.get(trace_id)
+
+    def cancel(self, trace_id):
+        """
+        Give up on a request: the waiting caller is released, and a message still sitting in a queue is skipped.
+        """
+        super().cancel(trace_id)
+        in_flight = self.in_flight.get(trace_id)
+        if in_flight is not None:
+            in_flight.cancel()
+
+    def _forget(self, trace_id, result):
+        if self.in_flight.get(trace_id) is result:
+            del self.in_flight[trace_id]
+
+    def _in_loop(self):
+        return threading.current_thread() is self._thread
+
+    async def _stop_workers(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def shutdown(self):
+        """
+        Stop the workers and the background loop.
+        """
+        asyncio.run_coroutine_threadsafe(self._stop_workers(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
@@ -1,37 +1,172 @@
 # This module is the "post office" for agent messages.
 # It makes sure every message gets to the right agent, just like a good mail sorter!
+import concurrent.futures
+import threading
+import uuid
+
+from mcp.tracing import payload_size, tracer
+
+
+def new_trace_id():
+    """
+    A fresh, unique trace ID for one request (and every message it causes).
+    """
+    return f"trace-{uuid.uuid4().hex}"
 
 class MCPMessage:
-    def __init__(self, sender, receiver, type, trace_id, payload):
+    def __init__(self, sender, receiver, type, trace_id=None, payload=None):
         """
         A message object for agents to communicate.
         Includes sender, receiver, message type, a trace ID for tracking, and the actual data (payload).
+        If no trace ID is given, the dispatcher assigns a unique one when the message is sent.
         """
         self.sender = sender
         self.receiver = receiver
         self.type = type
         self.trace_id = trace_id
-        self.payload = payload
+        self.payload = payload if payload is not None else {}
+        # The span that sent this message, so the receiving agent's span hangs under it in the trace
+        # (the async dispatcher fills this in; in the sync one the handler runs inside the sender's span anyway)
+        self.parent_span_id = None
+
+class PendingResults:
+    def __init__(self):
+        """
+        A registry of requests that someone is waiting on, by trace ID.
+        Each one is a future: the agent that finishes the work resolves it, and the waiting caller wakes up.
+        """
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def register(self, trace_id):
+        future = concurrent.futures.Future()
+        with self._lock:
+            self._futures[trace_id] = future
+        return future
+
+    def resolve(self, trace_id, result):
+        """
+        Hand a result to whoever is waiting on trace_id. Results nobody is waiting for (any more) are dropped.
+        """
+        with self._lock:
+            future = self._futures.pop(trace_id, None)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_result(result)
+
+    def fail(self, trace_id, error):
+        """
+        Wake the waiting caller up with an error instead of a result.
+        """
+        with self._lock:
+            future = self._futures.pop(trace_id, None)
+        if future is not None and future.set_running_or_notify_cancel():
+            future.set_exception(error)
+
+    def cancel(self, trace_id):
+        """
+        The caller gave up on trace_id. Agents can check is_cancelled to skip work nobody wants any more.
+        """
+        with self._lock:
+            future = self._futures.get(trace_id)
+        if future is not None:
+            future.cancel()
+
+    def discard(self, trace_id):
+        """
+        Forget about trace_id without delivering anything (used once a cancelled request has finished).
+        """
+        with self._lock:
+            self._futures.pop(trace_id, None)
+
+    def is_cancelled(self, trace_id):
+        with self._lock:
+            future = self._futures.get(trace_id)
+        return future is not None and future.cancelled()
 
 class MCPDispatcher:
     def __init__(self):
         """
-        Sets up the dispatcher with a place to keep track of all agent handlers.
+        Sets up the dispatcher with a place to keep track of all agent handlers,
+        and a registry of results that callers are waiting on.
         """
         self.handlers = {}
+        self.batch_handlers = {}
+        self.pending = PendingResults()
 
-    def register_agent(self, agent_name, handler_func):
+    def register_agent(self, agent_name, handler_func, batch_handler=None):
         """
         Register an agent so it can receive messages.
+        batch_handler (optional) takes a list of messages and returns one result per message; a dispatcher
+        that sees several messages for the agent at once may hand them over together (see AsyncMCPDispatcher).
         """
         self.handlers[agent_name] = handler_func
+        if batch_handler is not None:
+            self.batch_handlers[agent_name] = batch_handler
+
+    def new_trace_id(self):
+        return new_trace_id()
 
     def send_message(self, message: MCPMessage):
         """
-        Deliver a message to the right agent. If the agent isn't found, print a warning.
+        Deliver a message to the right agent and hand back whatever it returns
+        (for example an answer, or a generator of answer tokens). If the agent isn't found, print a warning.
+        The agent's handling is traced as a span named after it.
         """
+        if message.trace_id is None:
+            message.trace_id = new_trace_id()
         handler = self.handlers.get(message.receiver)
         if handler:
-            handler(message)
+            size = payload_size(message.payload)
+            tracer.observe_message(message.receiver, payload_bytes=size)
+            with tracer.span(message.receiver, message.trace_id, type=message.type, sender=message.sender,
+                             payload_bytes=size):
+                return handler(message)
         else:
             print(f"No handler found for {message.receiver}")
+
+    def request(self, message: MCPMessage, timeout=None):
+        """
+        Send a message and wait until some agent resolves its trace ID with a result.
+        Raises TimeoutError (and cancels the request) if that takes longer than timeout seconds,
+        and re-raises any error an agent hit along the way.
+        """
+        if message.trace_id is None:
+            message.trace_id = new_trace_id()
+        trace_id = message.trace_id
+        future = self.pending.register(trace_id)
+        try:
+            delivery = self.send_message(message)
+        except Exception as e:
+            self.pending.fail(trace_id, e)
+            raise
+        if isinstance(delivery, concurrent.futures.Future):
+            delivery.add_done_callback(lambda done: self._on_delivered(trace_id, done))
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            self.cancel(trace_id)
+            if not isinstance(delivery, concurrent.futures.Future) or delivery.done():
+                # Nothing is still working on it, so there's nothing left to tell "never mind"
+                self.pending.discard(trace_id)
+            raise TimeoutError(f"No result for {trace_id} after {timeout}s")
+
+    def _on_delivered(self, trace_id, delivery):
+        """
+        Once every hop of a request has finished: pass on any error, and clean up cancelled requests.
+        """
+        if not delivery.cancelled() and delivery.exception() is not None:
+            self.pending.fail(trace_id, delivery.exception())
+        elif self.pending.is_cancelled(trace_id):
+            self.pending.discard(trace_id)
+
+    def resolve(self, trace_id, result):
+        """
+        Called by the agent that finishes a request, to deliver the result to the waiting caller.
+        """
+        self.pending.resolve(trace_id, result)
+
+    def cancel(self, trace_id):
+        self.pending.cancel(trace_id)
+
+    def is_cancelled(self, trace_id):
+        return self.pending.is_cancelled(trace_id)
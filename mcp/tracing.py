@@ -0,0 +1,309 @@
+# This module is the stopwatch for the whole system. Every message hop through the dispatcher, and every
+# stage inside the agents (parse, chunk, embed, index add, query embed, search, rerank, prompt build,
+# LLM call), is timed as a span that carries its request's trace id, so one slow answer can be taken
+# apart afterwards. Spans are appended to a JSONL file (see trace_report.py), and their durations also
+# feed Prometheus-style histograms, served as plain text at /metrics.
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+
+# Seconds; wide enough for a cache hit (sub-millisecond) and a slow LLM call alike
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(8))
+
+# The span the code running right now belongs to (each thread and asyncio task has its own)
+_current = contextvars.ContextVar("current_span", default=None)
+# The traced iterables producing an item right now on each thread, innermost last (see Tracer.iterate)
+_local = threading.local()
+
+
+def payload_size(value, depth=0):
+    """
+    Rough size of a message payload in bytes: the UTF-8 length of its text, walking into dicts and lists.
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8", "replace"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if depth < 4 and isinstance(value, dict):
+        return sum(payload_size(k, depth + 1) + payload_size(v, depth + 1) for k, v in value.items())
+    if depth < 4 and isinstance(value, (list, tuple)):
+        return sum(payload_size(v, depth + 1) for v in value)
+    return 8
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, attributes):
+        """
+        One timed piece of work. attributes are free-form (sizes, counts, settings) and can be added
+        to with set() while the span is open.
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "start": self.start, "duration_ms": round(1000 * self.duration, 3),
+                "attributes": self.attributes}
+
+
+class Histogram:
+    def __init__(self, name, help_text, label, buckets):
+        """
+        A Prometheus histogram with one label (say, the span name): bucket counts, sum and count per label value.
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.setdefault(label_value, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """
+        The histogram in the Prometheus text exposition format (buckets are cumulative there).
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {value: (list(counts), total, count) for value, (counts, total, count) in self._series.items()}
+        for value, (counts, total, count) in sorted(series.items()):
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return "\n".join(lines)
+
+
+class JsonlExporter:
+    def __init__(self, path, max_bytes=config.TRACE_FILE_MAX_BYTES):
+        """
+        Append finished spans to path, one JSON object per line. Once the file passes max_bytes it's
+        moved to path + ".1" (replacing the previous one) and a new file is started.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            if self.max_bytes and self._file.tell() > self.max_bytes:
+                self._file.close()
+                os.replace(self.path, self.path + ".1")
+                self._file = None
+
+
+class Tracer:
+    def __init__(self, enabled=config.TRACING, exporter=None):
+        """
+        Set up a tracer. Finished spans go to exporter (if any) and into the histograms;
+        with enabled off, spans are still handed out (so callers needn't check) but nothing is recorded.
+        """
+        self.enabled = enabled
+        self.exporter = exporter
+        self.span_seconds = Histogram("rag_span_seconds", "Time spent in each traced stage.", "span", LATENCY_BUCKETS)
+        self.queue_wait_seconds = Histogram("rag_queue_wait_seconds", "Time messages waited in an agent's queue.",
+                                            "agent", LATENCY_BUCKETS)
+        self.payload_bytes = Histogram("rag_payload_bytes", "Size of the message payloads each agent received.",
+                                       "agent", SIZE_BUCKETS)
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def current_span(self):
+        return _current.get()
+
+    def start(self, name, trace_id=None, parent_id=None, **attributes):
+        """
+        Open a span without making it the current one. trace_id and parent_id default to the current span's.
+        """
+        current = _current.get()
+        if current is not None:
+            trace_id = trace_id or current.trace_id
+            if parent_id is None and current.trace_id == trace_id:
+                parent_id = current.span_id
+        return Span(name, trace_id, parent_id, attributes)
+
+    def finish(self, span, error=None, duration=None):
+        """
+        Close a span, and export and measure it. duration (seconds) defaults to the time since it started.
+        Spans outside any trace (bulk ingest's parser processes, say) only count towards the histograms.
+        """
+        span.duration = time.perf_counter() - span._started if duration is None else duration
+        if error is not None:
+            span.attributes["error"] = type(error).__name__
+        if not self.enabled:
+            return
+        self.span_seconds.observe(span.name, span.duration)
+        if error is not None:
+            with self._lock:
+                self._errors[span.name] = self._errors.get(span.name, 0) + 1
+        if self.exporter is not None and span.trace_id is not None:
+            self.exporter.export(span)
+
+    @contextmanager
+    def activate(self, span):
+        """
+        Make span the current one for the code inside the with-block (its own sub-spans hang under it).
+        """
+        token = _current.set(span)
+        try:
+            yield span
+        finally:
+            _current.reset(token)
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attributes):
+        """
+        Time the code inside the with-block as a span (a child of the current span, if there is one).
+        Yields the span, so attributes found along the way can be added with span.set(...).
+        """
+        span = self.start(name, trace_id, **attributes)
+        try:
+            with self.activate(span):
+                yield span
+        except BaseException as e:
+            self.finish(span, e)
+            raise
+        self.finish(span)
+
+    def annotate(self, **attributes):
+        """
+        Add attributes to the current span, if there is one.
+        """
+        current = _current.get()
+        if current is not None:
+            current.set(**attributes)
+
+    def iterate(self, name, iterable, trace_id=None, **attributes):
+        """
+        Yield from iterable, and record one span for it once it's used up (or dropped). Its duration only
+        counts the time spent producing items—not the caller's loop body, and not the time of other
+        iterables traced this way inside it—so a streaming pipeline's stages can be told apart.
+        The span also notes how many items there were, the wall time, and the time to the first item.
+        Dropping the generator early closes iterable too.
+        """
+        span = self.start(name, trace_id, **attributes)
+        if not hasattr(_local, "stack"):
+            _local.stack = []
+        stack = _local.stack
+        busy, items, error = 0.0, 0, None
+        iterator = iter(iterable)
+        try:
+            while True:
+                frame = [0.0]
+                stack.append(frame)
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - started
+                    stack.pop()
+                    busy += elapsed - frame[0]
+                    if stack:
+                        stack[-1][0] += elapsed
+                if not items:
+                    span.set(first_item_ms=round(1000 * (time.perf_counter() - span._started), 3))
+                items += 1
+                yield item
+        finally:
+            span.set(items=items, wall_ms=round(1000 * (time.perf_counter() - span._started), 3))
+            self.finish(span, error, busy)
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def observe_message(self, agent, queue_wait=None, payload_bytes=None):
+        if not self.enabled:
+            return
+        if queue_wait is not None:
+            self.queue_wait_seconds.observe(agent, queue_wait)
+        if payload_bytes is not None:
+            self.payload_bytes.observe(agent, payload_bytes)
+
+    def metrics_text(self):
+        """
+        Every metric in the Prometheus text exposition format.
+        """
+        parts = [self.span_seconds.render(), self.queue_wait_seconds.render(), self.payload_bytes.render()]
+        with self._lock:
+            errors = dict(self._errors)
+        parts.append("# HELP rag_span_errors_total Spans that ended in an exception.\n"
+                     "# TYPE rag_span_errors_total counter")
+        parts.extend(f'rag_span_errors_total{{span="{name}"}} {count}' for name, count in sorted(errors.items()))
+        return "\n".join(parts) + "\n"
+
+    def serve_metrics(self, port=config.METRICS_PORT, host=config.METRICS_HOST):
+        """
+        Serve the metrics at http://host:port/metrics from a background thread, for Prometheus to scrape.
+        host is the interface to listen on: loopback by default, "0.0.0.0" (or "") for every interface.
+        Returns the server, or None if the port is taken (say, by another copy of the app).
+        """
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.metrics_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"[Tracing] Metrics endpoint not started on port {port}: {e}")
+            return None
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        print(f"[Tracing] Metrics at http://{host or '0.0.0.0'}:{port}/metrics")
+        return server
+
+
+# The tracer everything shares
+tracer = Tracer(exporter=JsonlExporter(config.TRACE_FILE) if config.TRACE_FILE else None)
@@ -1,6 +1,44 @@
 # This parser helps us turn CSV files into readable text tables.
+import csv
+import io
+
 import pandas as pd
 
+import config
+
+def _csv_line(values):
+    """
+    Formats one row as a compact CSV line (quoting only where needed, no fixed-width padding).
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(values)
+    return buffer.getvalue()
+
+def iter_csv(file_path, rows_per_read=config.CSV_READ_ROWS, max_chars=config.CSV_CHUNK_CHARS):
+    """
+    Reads a CSV file a batch of rows at a time (so huge files never have to fit in memory) and yields
+    (text, location) chunks made of whole rows, each starting with the header line, in plain CSV form.
+    A chunk grows until the next row would push it past max_chars (a single longer row gets a chunk
+    to itself). The location gives the chunk's row range as [first, last + 1], counting data rows from 0.
+    These are finished chunks—the word chunker shouldn't split them again.
+    """
+    header, rows, size, start, end = None, [], 0, 0, 0
+    for df in pd.read_csv(file_path, chunksize=rows_per_read, dtype=str, keep_default_na=False):
+        if header is None:
+            header = _csv_line(df.columns)
+        for values in df.itertuples(index=False):
+            line = _csv_line(values)
+            if rows and size + len(line) + 1 > max_chars:
+                yield "\n".join([header] + rows), {"rows": [start, end]}
+                rows, start = [], end
+            if not rows:
+                size = len(header)
+            rows.append(line)
+            size += len(line) + 1
+            end += 1
+    if rows:
+        yield "\n".join([header] + rows), {"rows": [start, end]}
+
 def parse_csv(file_path):
     """
     Reads a CSV file and returns its contents as a nicely formatted string (like a table).
@@ -1,6 +1,23 @@
 # This parser helps us pull out all the text from Word documents.
 from docx import Document
 
+def iter_docx(file_path, block_size=20):
+    """
+    Opens a DOCX file and yields (text, location) for blocks of block_size paragraphs at a time.
+    The location says which paragraph the block starts at (counting from 0).
+    """
+    doc = Document(file_path)
+    block, start = [], 0
+    for i, para in enumerate(doc.paragraphs):
+        if not block:
+            start = i
+        block.append(para.text)
+        if len(block) == block_size:
+            yield "\n".join(block), {"paragraph": start}
+            block = []
+    if block:
+        yield "\n".join(block), {"paragraph": start}
+
 def parse_docx(file_path):
     """
     Opens a DOCX file and grabs the text from every paragraph.
@@ -1,9 +1,17 @@
 # This parser helps us read text from PDF files, one page at a time.
 import fitz
 
+def iter_pdf(file_path):
+    """
+    Opens a PDF and yields (text, location) for one page at a time, so only one page's text is in memory.
+    Pages are numbered from 1.
+    """
+    with fitz.open(file_path) as doc:
+        for page_number, page in enumerate(doc, start=1):
+            yield page.get_text(), {"page": page_number}
+
 def parse_pdf(file_path):
     """
     Opens a PDF and grabs all the text from every page, then puts it together as one big string.
     """
-    doc = fitz.open(file_path)
-    return "\n".join([page.get_text() for page in doc])
+    return "\n".join(text for text, _ in iter_pdf(file_path))
@@ -1,15 +1,20 @@
 # This parser helps us extract all the text from PowerPoint slides.
 from pptx import Presentation
 
+def iter_pptx(file_path):
+    """
+    Opens a PPTX file and yields (text, location) for one slide at a time.
+    Slides are numbered from 1.
+    """
+    prs = Presentation(file_path)
+    for slide_number, slide in enumerate(prs.slides, start=1):
+        texts = [shape.text for shape in slide.shapes if hasattr(shape, "text")]
+        if texts:
+            yield "\n".join(texts) + "\n", {"slide": slide_number}
+
 def parse_pptx(file_path):
     """
     Opens a PPTX file and collects all the text from every slide and shape.
     Returns everything as one big string, separated by newlines.
     """
-    prs = Presentation(file_path)
-    text = ""
-    for slide in prs.slides:
-        for shape in slide.shapes:
-            if hasattr(shape, "text"):
-                text += shape.text + "\n"
-    return text
+    return "".join(text for text, _ in iter_pptx(file_path))
@@ -0,0 +1,76 @@
+# This module keeps every file parser in one place, looked up by file extension.
+# It's importable on its own, so worker processes can find the right parser by name.
+import config
+import parsers.pdf_parser as pdf
+import parsers.pptx_parser as pptx
+import parsers.docx_parser as docx
+import parsers.csv_parser as csv
+import parsers.txt_parser as txt
+from mcp.tracing import tracer
+from utils.chunking import chunk_segments
+
+PARSERS = {
+    "pdf": pdf.parse_pdf,
+    "pptx": pptx.parse_pptx,
+    "docx": docx.parse_docx,
+    "csv": csv.parse_csv,
+    "txt": txt.parse_txt
+}
+
+# The streaming versions: each one yields (text, location) segments—one per page, slide,
+# paragraph block, group of CSV rows or text paragraph—instead of returning one giant string
+SEGMENT_PARSERS = {
+    "pdf": pdf.iter_pdf,
+    "pptx": pptx.iter_pptx,
+    "docx": docx.iter_docx,
+    "csv": csv.iter_csv,
+    "txt": txt.iter_txt
+}
+
+# Streaming parsers whose segments are already finished chunks (like CSV row groups that each
+# carry the header), so the word chunker passes them through untouched
+ATOMIC_SEGMENTS = {"csv"}
+
+def get_parser(file_type):
+    """
+    Returns the parser for a file type (like "pdf"), or raises ValueError if we don't support it.
+    """
+    if file_type not in PARSERS:
+        raise ValueError(f"Unsupported file type: {file_type}")
+    return PARSERS[file_type]
+
+def get_segment_parser(file_type):
+    """
+    Returns the streaming parser for a file type, or raises ValueError if we don't support it.
+    """
+    if file_type not in SEGMENT_PARSERS:
+        raise ValueError(f"Unsupported file type: {file_type}")
+    return SEGMENT_PARSERS[file_type]
+
+def _with_offsets(segments):
+    """
+    Adds "start"/"end" character offsets to segments that are used as chunks as they are.
+    """
+    start = 0
+    for text, location in segments:
+        yield text, dict(location or {}, start=start, end=start + len(text))
+        start += len(text)
+
+def iter_chunks(file_path, file_type, segment_parsers=None, parsers=None, chunk_tokens=config.CHUNK_TOKENS,
+                overlap_tokens=config.CHUNK_OVERLAP_TOKENS):
+    """
+    Parses a file and yields (chunk, location) pairs as the pages stream in. Segments from
+    ATOMIC_SEGMENTS parsers are used as chunks directly; everything else goes through the sentence chunker.
+    A file type with no streaming parser falls back to its whole-text parser as a single segment.
+    Parsing is traced as a "parse" span.
+    """
+    segment_parsers = SEGMENT_PARSERS if segment_parsers is None else segment_parsers
+    parsers = PARSERS if parsers is None else parsers
+    if file_type in segment_parsers:
+        segments = tracer.iterate("parse", segment_parsers[file_type](file_path), file_type=file_type)
+        if file_type in ATOMIC_SEGMENTS:
+            return _with_offsets(segments)
+    else:
+        with tracer.span("parse", file_type=file_type):
+            segments = [(parsers[file_type](file_path), None)]
+    return chunk_segments(segments, chunk_tokens, overlap_tokens)
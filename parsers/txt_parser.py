@@ -1,4 +1,23 @@
 # This parser is for plain text files—simple and straightforward!
+def iter_txt(file_path, max_chars=65536):
+    """
+    Reads a TXT file line by line and yields (text, location) for one paragraph at a time
+    (paragraphs end at a blank line, or after max_chars if the file has no blank lines).
+    The location gives the line the paragraph starts on, counting from 1.
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        block, size, start = [], 0, 1
+        for line_number, line in enumerate(f, start=1):
+            if not block:
+                start = line_number
+            block.append(line)
+            size += len(line)
+            if not line.strip() or size >= max_chars:
+                yield "".join(block), {"line": start}
+                block, size = [], 0
+        if block:
+            yield "".join(block), {"line": start}
+
 def parse_txt(file_path):
     """
     Reads the entire contents of a TXT file and returns it as a string.
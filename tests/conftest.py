@@ -0,0 +1,37 @@
+from types import SimpleNamespace
+
+import pytest
+
+import config
+from agents.ingestion_agent import IngestionAgent
+from embeddings.cache import EmbeddingCache
+from embeddings.embedder import create_embedder
+from mcp.message_dispatcher import MCPDispatcher, MCPMessage
+from parsers.registry import PARSERS
+from vector_store.factory import create_vector_store
+
+
+@pytest.fixture
+def ingestion(tmp_path, monkeypatch):
+    """
+    An IngestionAgent over an empty sparse store, with everything it saves kept under tmp_path.
+    upload(name, text, source=None) writes a text file and ingests it, returning the agent's result.
+    """
+    monkeypatch.setattr(config, "INDEX_PATH", str(tmp_path / "index"))
+    monkeypatch.setattr(config, "EMBEDDER_PATH", str(tmp_path / "embedder.joblib"))
+    dispatcher = MCPDispatcher()
+    store = create_vector_store(backend="sparse")
+    agent = IngestionAgent(dispatcher, store, PARSERS, embedder=create_embedder("hashing"),
+                           embedding_cache=EmbeddingCache(100))
+
+    def upload(name, text, source=None):
+        path = tmp_path / name
+        path.write_text(text)
+        payload = {"file_path": str(path), "file_type": "txt"}
+        if source is not None:
+            payload["source"] = source
+        return dispatcher.send_message(MCPMessage("UI", "IngestionAgent", "DOCUMENT_UPLOAD", "t", payload))
+
+    return SimpleNamespace(store=store, agent=agent, dispatcher=dispatcher, upload=upload)
+
+
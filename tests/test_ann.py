@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import config
+from vector_store.faiss_store import VectorStore
+
+DIM = 32
+
+
+def vectors(n, seed):
+    v = np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+    return v / np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def add(store, embeddings):
+    return store.add_embeddings(embeddings, [f"chunk {store.metadata.next_chunk_id + i}" for i in range(len(embeddings))])
+
+
+def test_auto_index_promotes_once_big_enough(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "FAISS_AUTO_INDEX", "ivf")
+    monkeypatch.setattr(config, "FAISS_ANN_THRESHOLD", 1200)
+    store = VectorStore(DIM, index_type="auto")
+    first = vectors(1199, seed=0)
+    add(store, first)
+    assert store.index_kind == "flat"
+    ids = add(store, vectors(300, seed=1))
+    assert store.index_kind == "ivf" and store.index.ntotal == 1499
+    # Searching for a stored vector still finds it after the rebuild
+    assert store.search_ids(first[7], 1) == [7]
+    # Removed chunks stay out of the ANN index too, before and after compaction and a reload
+    doc_id = store.add_document("extra")
+    extra = store.add_embeddings(vectors(1, seed=2), ["extra chunk"], [{"doc_id": doc_id}])
+    store.remove_document(doc_id)
+    assert extra[0] not in store.search_ids(vectors(1, seed=2)[0], 5)
+    store.compact()
+    store.save(str(tmp_path / "index"))
+    loaded = VectorStore.load(str(tmp_path / "index"))
+    assert loaded.index_kind == "ivf" and loaded.index.ntotal == 1499
+    assert loaded.search_ids(first[7], 1) == [7] and loaded.search_ids(vectors(300, seed=1)[5], 1) == [ids[5]]
+
+
+@pytest.mark.parametrize("kind", ["hnsw", "flat"])
+def test_untrained_kinds_start_right_away(kind):
+    store = VectorStore(DIM, index_type=kind)
+    assert store.index_kind == kind
+    doc_id = store.add_document("doc")
+    stored = vectors(50, seed=3)
+    ids = store.add_embeddings(stored, [f"chunk {i}" for i in range(50)], [{"doc_id": doc_id}] * 50)
+    assert store.search_ids(stored[10], 1) == [ids[10]]
+    # HNSW graphs can't drop nodes: compaction rebuilds the index from the live vectors
+    store.remove_document(doc_id)
+    store.compact()
+    assert store.index.ntotal == 0 and store.index_kind == kind
+
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError):
+        VectorStore(DIM, index_type="annoy")
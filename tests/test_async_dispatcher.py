@@ -0,0 +1,73 @@
+import concurrent.futures
+import threading
+
+import pytest
+
+from mcp.async_dispatcher import AsyncMCPDispatcher
+from mcp.message_dispatcher import MCPMessage
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = AsyncMCPDispatcher(workers={"Echo": 1, "Slow": 1}, coalesce_window=0.2, coalesce_max=8)
+    yield dispatcher
+    dispatcher.shutdown()
+
+
+def echo(message):
+    if message.payload["text"] == "bad":
+        raise ValueError("bad message")
+    return message.payload["text"].upper()
+
+
+def send(dispatcher, receiver, text):
+    return dispatcher.send_message(MCPMessage("test", receiver, "ECHO", None, {"text": text}))
+
+
+def test_messages_arriving_together_are_coalesced(dispatcher):
+    batches = []
+
+    def echo_many(messages):
+        batches.append(len(messages))
+        return [echo(message) for message in messages]
+
+    dispatcher.register_agent("Echo", echo, batch_handler=echo_many)
+    futures = [send(dispatcher, "Echo", text) for text in ("a", "b", "c", "d")]
+    assert [future.result(5) for future in futures] == ["A", "B", "C", "D"]
+    assert batches == [4]
+
+
+def test_bad_message_only_fails_itself(dispatcher):
+    def echo_many(messages):
+        return [echo(message) for message in messages]
+
+    dispatcher.register_agent("Echo", echo, batch_handler=echo_many)
+    futures = [send(dispatcher, "Echo", text) for text in ("a", "bad", "c")]
+    assert futures[0].result(5) == "A" and futures[2].result(5) == "C"
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+
+
+def test_timeout_and_cancel(dispatcher):
+    release, handled = threading.Event(), []
+
+    def slow(message):
+        release.wait(5)
+        handled.append(message.payload["text"])
+        dispatcher.resolve(message.trace_id, message.payload["text"])
+        return message.payload["text"]
+
+    dispatcher.register_agent("Slow", slow)
+    first = MCPMessage("test", "Slow", "ECHO", None, {"text": "first"})
+    with pytest.raises(TimeoutError):
+        dispatcher.request(first, timeout=0.05)
+    assert dispatcher.is_cancelled(first.trace_id)
+    # The worker is still busy with the first message, so this one waits in the queue, and is skipped once cancelled
+    message = MCPMessage("test", "Slow", "ECHO", None, {"text": "queued"})
+    queued = dispatcher.send_message(message)
+    dispatcher.cancel(message.trace_id)
+    release.set()
+    with pytest.raises(concurrent.futures.CancelledError):
+        queued.result(5)
+    assert send(dispatcher, "Slow", "last").result(5) == "last"
+    assert handled == ["first", "last"]
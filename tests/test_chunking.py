@@ -0,0 +1,43 @@
+from utils.chunking import chunk_segments, chunk_text, split_sentences
+from utils.tokens import count_tokens
+
+SENTENCES = [f"Sentence number {i} talks about topic {i % 7} for a little while." for i in range(60)]
+
+
+def test_chunks_stay_within_budget():
+    text = "A short start. " + "x" * 5000 + " and a " + "-".join(["ab"] * 400) + " to end with."
+    chunks = chunk_text(text, chunk_tokens=50, overlap_tokens=10)
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 50 for chunk in chunks)
+    # Nothing is lost: the over-long words come back when the pieces are put together
+    assert "".join(chunks).count("x") == 5000
+
+
+def test_chunks_end_between_sentences_and_overlap():
+    chunks = chunk_text(" ".join(SENTENCES), chunk_tokens=80, overlap_tokens=20)
+    assert len(chunks) > 2
+    sentences = [split_sentences(chunk) for chunk in chunks]
+    for chunk in sentences:
+        assert all(sentence in SENTENCES for sentence, _ in chunk)
+    for previous, chunk in zip(sentences, sentences[1:]):
+        # Each chunk repeats the end of the one before, up to overlap_tokens
+        overlap = [sentence for sentence, _ in previous if sentence in {s for s, _ in chunk}]
+        assert overlap and overlap == [sentence for sentence, _ in chunk[:len(overlap)]]
+        assert count_tokens(" ".join(overlap)) <= 20
+    assert [s for s, _ in sentences[-1]][-1] == SENTENCES[-1]
+
+
+def test_chunks_prefer_paragraph_ends():
+    paragraphs = [" ".join(SENTENCES[i:i + 3]) for i in range(0, 30, 3)]
+    chunks = chunk_text("\n\n".join(paragraphs), chunk_tokens=100, overlap_tokens=0)
+    for chunk in chunks:
+        # Every chunk holds whole paragraphs
+        assert all(paragraph in paragraphs for paragraph in chunk.split("\n\n"))
+
+
+def test_offsets_point_into_the_document():
+    segments = [(" ".join(SENTENCES[:20]) + "\n\n", {"page": 1}), (" ".join(SENTENCES[20:40]), {"page": 2})]
+    document = "".join(text for text, _ in segments)
+    for chunk, location in chunk_segments(segments, chunk_tokens=60, overlap_tokens=10):
+        assert " ".join(document[location["start"]:location["end"]].split()) == " ".join(chunk.split())
+        assert location["page"] in (1, 2)
@@ -0,0 +1,27 @@
+from agents.llm_response_agent import build_prompt
+from parsers.csv_parser import iter_csv
+from utils.context import source_label
+from vector_store.metadata import ChunkMetadata
+
+
+def test_prompt_from_csv_chunks(tmp_path):
+    # CSV chunks carry a row range; it has to survive the metadata table and end up in the citation
+    path = tmp_path / "people.csv"
+    path.write_text("name,city\n" + "".join(f"person{i},city{i % 3}\n" for i in range(50)))
+    chunks = list(iter_csv(str(path), max_chars=200))
+    metadata = ChunkMetadata()
+    doc_id = metadata.add_document(str(path))
+    metadata.extend([dict(location, doc_id=doc_id) for _, location in chunks])
+    sources = [metadata[i] for i in range(len(chunks))]
+    assert sources[1]["rows"] == chunks[1][1]["rows"]
+
+    prompt, packed = build_prompt([text for text, _ in chunks], "Where does person3 live?", sources=sources)
+    first, last = chunks[0][1]["rows"]
+    assert f"[1] people.csv, rows {first + 1}-{last}" in prompt
+    assert packed.chunks > 0
+
+
+def test_source_label_single_row():
+    # Snapshots from before row ranges were kept only have the first row
+    assert source_label({"source": "/data/people.csv", "rows": 40}) == "people.csv, row 41"
+    assert source_label({"source": "/data/people.csv", "rows": [40, 60]}) == "people.csv, rows 41-60"
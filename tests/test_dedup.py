@@ -0,0 +1,46 @@
+import numpy as np
+
+from vector_store.factory import create_vector_store
+
+FOOTER = "Confidential - Acme Corp quarterly review, do not distribute outside the company."
+# Long enough that changing one word leaves a word 3-gram Jaccard similarity above 0.9
+TERMS = "".join(f"Clause {i}: the supplier delivers order {i} of office chairs to the main office. " for i in range(8))
+
+
+def live_chunks(store, doc_id=None):
+    rows = np.flatnonzero(store.metadata.live_mask())
+    return [store.chunks[row] for row in rows if doc_id is None or store.metadata[row]["doc_id"] == doc_id]
+
+
+def test_revised_upload_keeps_changed_text(ingestion):
+    # A revision that only changes a figure is a near-duplicate of the old chunk, never a duplicate
+    store, upload = ingestion.store, ingestion.upload
+    first = upload("contract.txt", TERMS + "The total price is 5000 dollars.")
+    revised = upload("contract.txt", TERMS + "The total price is 9000 dollars.")
+    assert revised["duplicates"] == 0 and revised["near_duplicates"] == 1
+    text = " ".join(live_chunks(store))
+    assert "9000" in text and "5000" not in text
+    assert first["doc_id"] not in {store.metadata[row]["doc_id"] for row in np.flatnonzero(store.metadata.live_mask())}
+
+
+def test_identical_chunks_collapse_and_hand_over(ingestion):
+    store, upload = ingestion.store, ingestion.upload
+    a = upload("a.txt", FOOTER, source="a")
+    b = upload("b.txt", TERMS, source="b")
+    # The same text (up to case and spacing) is shared, not stored twice
+    c = upload("c.txt", "  " + FOOTER.upper(), source="c")
+    assert c["duplicates"] == 1 and len(live_chunks(store)) == 2
+    # Removing the document that owns the shared chunk hands it over to one still using it
+    store.remove_document(a["doc_id"])
+    assert live_chunks(store, c["doc_id"]) == [FOOTER]
+    store.remove_document(c["doc_id"])
+    store.remove_document(b["doc_id"])
+    assert live_chunks(store) == []
+
+
+def test_duplicate_within_one_batch():
+    store = create_vector_store(backend="sparse")
+    matches = store.find_duplicates([FOOTER, TERMS, "  " + FOOTER.lower(), TERMS.replace("chairs", "stools", 1)])
+    assert matches[0] is None and matches[1] is None
+    assert matches[2] == ("batch", 0, True)
+    assert matches[3] is not None and matches[3][:2] == ("batch", 1) and not matches[3].exact
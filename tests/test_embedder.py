@@ -0,0 +1,57 @@
+import config
+from agents.retrieval_agent import RetrievalAgent
+from embeddings.cache import EmbeddingCache
+from embeddings.embedder import TfidfEmbedder
+from mcp.message_dispatcher import MCPDispatcher, MCPMessage
+from utils.indexing import index_chunks
+from vector_store.factory import create_vector_store, load_or_create_vector_store
+
+PLANETS = [f"Planet {name} orbits the sun at its own distance." for name in ("mercury", "venus", "earth", "mars")]
+ANIMALS = [f"The {name} lives in the savanna and eats what it finds there." for name in
+           ("zebra", "lion", "giraffe", "hyena", "elephant", "rhino", "buffalo", "cheetah")]
+
+
+def search(store, embedder, query):
+    cache = EmbeddingCache(100)
+    ids = store.search_ids(cache.transform(embedder, [query], query=True)[0], 1, query_text=query)
+    return store.get_chunk(ids[0]) if ids else None
+
+
+def test_query_before_anything_is_ingested():
+    dispatcher = MCPDispatcher()
+    agent = RetrievalAgent(dispatcher, create_vector_store(backend="faiss"), embedder=TfidfEmbedder(),
+                           embedding_cache=EmbeddingCache(100))
+    message = MCPMessage("UI", "RetrievalAgent", "QUERY_BATCH_REQUEST", "t", {"queries": ["where is mars?"]})
+    assert dispatcher.send_message(message)[0]["chunk_ids"] == []
+    assert not agent.embedder.is_fitted
+
+
+def test_refit_once_the_corpus_doubles():
+    store = create_vector_store(backend="sparse")
+    store.lexical = None  # vectors only, so the search shows what the embedder knows
+    embedder, cache = TfidfEmbedder(), EmbeddingCache(100)
+    index_chunks(store, embedder, cache, PLANETS)
+    version = embedder.version
+    assert "zebra" not in embedder.vectorizer.vocabulary_
+    index_chunks(store, embedder, cache, ANIMALS)
+    assert embedder.version != version and store.embedder_version == embedder.version
+    assert embedder.n_fitted == len(PLANETS) + len(ANIMALS)
+    assert search(store, embedder, "zebra") == ANIMALS[0]
+    assert search(store, embedder, "mars") == PLANETS[3]
+
+
+def test_snapshot_with_another_embedder_is_reembedded(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDER_PATH", str(tmp_path / "embedder.joblib"))
+    store, embedder = create_vector_store(backend="faiss"), TfidfEmbedder()
+    store.lexical = None
+    index_chunks(store, embedder, EmbeddingCache(100), PLANETS + ANIMALS)
+    store.save(str(tmp_path / "index"))
+    # The saved embedder went missing: a fresh one has to be fitted, and every vector redone with it
+    fresh = TfidfEmbedder()
+    loaded = load_or_create_vector_store(str(tmp_path / "index"), backend="faiss", embedder=fresh)
+    assert fresh.is_fitted and loaded.embedder_version == fresh.version
+    loaded.lexical = None
+    assert search(loaded, fresh, "giraffe") == ANIMALS[2]
+    # Both were saved again, so the next start matches straight away
+    again = load_or_create_vector_store(str(tmp_path / "index"), backend="faiss", embedder=TfidfEmbedder.load(config.EMBEDDER_PATH))
+    assert again.embedder_version == fresh.version
@@ -0,0 +1,60 @@
+import numpy as np
+
+from embeddings.embedder import TfidfEmbedder
+from vector_store.bm25 import BM25Index
+from vector_store.factory import create_vector_store
+from vector_store.fusion import reciprocal_rank_fusion
+
+CHUNKS = [
+    "The disk is full and the server stopped writing logs.",
+    "Error E4711 means the backup disk could not be mounted.",
+    "The server restarts every night after the backup.",
+    "Logs are rotated weekly and kept for a month.",
+    "Error E4711 again: the backup disk mount failed, the disk may be unplugged, check the disk cable.",
+    "Nothing about errors here, just a note about lunch.",
+]
+
+
+def test_bm25_ranking():
+    index = BM25Index(max_df=0.5, max_postings=1000)
+    index.add(CHUNKS[:3])
+    index.add(CHUNKS[3:])
+    assert len(index) == len(CHUNKS)
+    # Only chunks with a query term come back, the rarest term counting most
+    assert set(index.search("e4711 cable")) == {1, 4} and index.search("e4711 cable")[0] == 4
+    assert index.search("lunch") == [5]
+    # "the" is in most chunks, so it's ignored like a stopword
+    assert index.search("the") == []
+    allowed = np.zeros(len(CHUNKS), dtype=bool)
+    allowed[[1, 2]] = True
+    assert index.search("e4711 cable", allowed=allowed) == [1]
+    scores = index.score("e4711", [5, 1])
+    assert scores[0] == 0 and scores[1] > 0
+
+
+def test_bm25_take_and_reload(tmp_path):
+    index = BM25Index()
+    index.add(CHUNKS)
+    kept = index.take([1, 3, 5])
+    assert kept.search("e4711") == [0] and kept.search("lunch") == [2]
+    kept.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("lunch") == [2]
+    assert np.allclose(loaded.score("e4711 mounted", [0, 1, 2]), kept.score("e4711 mounted", [0, 1, 2]))
+
+
+def test_reciprocal_rank_fusion():
+    # b is second in both lists, which beats first in one and missing from the other
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["d", "b"]], k=60) == ["b", "a", "d", "c"]
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "a"]], top_k=1) == ["a"]
+    assert reciprocal_rank_fusion([[], []]) == []
+
+
+def test_hybrid_search_finds_rare_terms():
+    # The embedder never saw "E4711", so only the keyword side can find it
+    embedder = TfidfEmbedder().fit(["The server writes logs.", "The backup runs at night.", "Lunch is at noon."])
+    store = create_vector_store(backend="sparse")
+    store.add_embeddings(embedder.transform(CHUNKS), CHUNKS)
+    query = embedder.transform(["E4711"])[0]
+    assert query.nnz == 0
+    assert set(store.search_ids(query, 2, query_text="E4711")) == {1, 4}
@@ -0,0 +1,16 @@
+import config
+from vector_store.snapshot import current_snapshot
+
+
+def test_snapshot_every_n_changes(ingestion, monkeypatch):
+    monkeypatch.setattr(config, "SNAPSHOT_EVERY", 3)
+    ingestion.upload("a.txt", "The first document.")
+    ingestion.upload("b.txt", "The second document.")
+    assert current_snapshot(config.INDEX_PATH) is None
+    ingestion.upload("c.txt", "The third document.")
+    first = current_snapshot(config.INDEX_PATH)
+    assert first is not None
+    # Whatever is left unsaved goes out with flush (as on shutdown)
+    ingestion.upload("d.txt", "The fourth document.")
+    ingestion.agent.flush()
+    assert current_snapshot(config.INDEX_PATH) != first
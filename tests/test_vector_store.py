@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from embeddings.embedder import create_embedder
+from vector_store.factory import create_vector_store
+
+DOCS = {
+    "planets.txt": [f"Planet {name} orbits the sun." for name in ("mercury", "venus", "earth", "mars")],
+    "animals.txt": [f"The {name} lives in the savanna." for name in ("zebra", "lion", "giraffe", "hyena")],
+    "rivers.txt": [f"The river {name} flows to the sea." for name in ("nile", "amazon", "danube", "rhine")],
+}
+
+
+def build(backend, **kwargs):
+    store, embedder = create_vector_store(backend=backend), create_embedder("hashing")
+    for name, value in kwargs.items():
+        setattr(store, name, value)
+    doc_ids = {}
+    for source, chunks in DOCS.items():
+        doc_ids[source] = store.upsert_document(source, embedder.transform(chunks), chunks, content_hash=source)
+    return store, embedder, doc_ids
+
+
+def found(store, embedder, text, top_k=20):
+    return {store.get_chunk(i) for i in store.search_ids(embedder.transform([text])[0], top_k, query_text=text)}
+
+
+@pytest.mark.parametrize("backend", ["faiss", "sparse"])
+def test_remove_tombstones_then_compacts(backend):
+    store, embedder, doc_ids = build(backend, compact_threshold=0.5)
+    ids = {store.get_chunk(i): i for i in store.metadata.column("chunk_id").tolist()}
+    assert store.remove_document(doc_ids["animals.txt"]) == 4
+    # Only tombstoned: still in the table, never in a search
+    assert store.metadata.n_deleted == 4 and len(store.chunks) == 12
+    assert not found(store, embedder, "the zebra lives in the savanna") & set(DOCS["animals.txt"])
+    assert "animals.txt" not in store.ingested_hashes
+    # Past compact_threshold the tombstones are swept out; chunk ids stay the same
+    store.remove_document(doc_ids["rivers.txt"])
+    assert store.metadata.n_deleted == 0 and len(store.chunks) == 4
+    for chunk in DOCS["planets.txt"]:
+        assert store.get_chunk(ids[chunk]) == chunk
+    assert found(store, embedder, "mars") == set(DOCS["planets.txt"])
+
+
+@pytest.mark.parametrize("backend", ["faiss", "sparse"])
+def test_replace_and_reload(backend, tmp_path):
+    store, embedder, doc_ids = build(backend)
+    revised = ["Planet pluto orbits the sun, or used to."]
+    new_id = store.upsert_document("planets.txt", embedder.transform(revised), revised, content_hash="v2")
+    assert store.metadata.doc_ids_for("planets.txt") == [new_id]
+    store.save(str(tmp_path / "index"))
+    loaded = type(store).load(str(tmp_path / "index"))
+    assert loaded.metadata.n_deleted == store.metadata.n_deleted
+    assert loaded.ingested_hashes == {"v2", "animals.txt", "rivers.txt"}
+    assert found(loaded, embedder, "planet orbits the sun") & set(DOCS["planets.txt"] + revised) == set(revised)
+    # Chunk ids keep counting from where they were, across compaction and reloads
+    loaded.compact()
+    chunk_id = loaded.add_embeddings(embedder.transform(["A new chunk."]), ["A new chunk."])[0]
+    assert chunk_id == store.metadata.next_chunk_id
+    assert np.all(loaded.metadata.live_mask())
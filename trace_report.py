@@ -0,0 +1,111 @@
+# This script reads the spans the tracer wrote (see mcp/tracing.py) and shows where the time goes:
+# latency percentiles for every stage, then the slowest requests, each taken apart span by span.
+#
+#   python trace_report.py                      # the configured RAG_TRACE_FILE
+#   python trace_report.py data/traces.jsonl --slowest 5 --name LLMResponseAgent
+import argparse
+import json
+import os
+from collections import defaultdict
+
+import numpy as np
+
+import config
+
+
+def read_spans(path):
+    """
+    Every span in path (and in its rotated predecessor, path + ".1", if there is one), oldest first.
+    Lines that don't parse (a write cut short by a crash) are skipped.
+    """
+    spans = []
+    for file_path in (path + ".1", path):
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return spans
+
+
+def stage_table(spans):
+    """
+    One row per span name: (name, count, p50, p95, p99, total), durations in milliseconds, busiest first.
+    """
+    durations = defaultdict(list)
+    for span in spans:
+        durations[span["name"]].append(span["duration_ms"])
+    rows = []
+    for name, values in durations.items():
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        rows.append((name, len(values), p50, p95, p99, sum(values)))
+    return sorted(rows, key=lambda row: -row[5])
+
+
+def traces(spans):
+    """
+    Spans grouped by trace id, with each trace's end-to-end time in milliseconds (first start to last end),
+    as a list of (elapsed, spans), slowest first.
+    """
+    grouped = defaultdict(list)
+    for span in spans:
+        grouped[span["trace_id"]].append(span)
+    result = []
+    for trace_spans in grouped.values():
+        start = min(span["start"] for span in trace_spans)
+        end = max(span["start"] + span["duration_ms"] / 1000 for span in trace_spans)
+        result.append((1000 * (end - start), trace_spans))
+    return sorted(result, key=lambda item: -item[0])
+
+
+def print_tree(trace_spans):
+    """
+    Print a trace's spans as a tree (children under their parent, in start order), with their attributes.
+    """
+    ids = {span["span_id"] for span in trace_spans}
+    children = defaultdict(list)
+    for span in sorted(trace_spans, key=lambda span: span["start"]):
+        children[span["parent_id"] if span["parent_id"] in ids else None].append(span)
+    t0 = min(span["start"] for span in trace_spans)
+
+    def walk(parent_id, depth):
+        for span in children[parent_id]:
+            attributes = ", ".join(f"{key}={value}" for key, value in span["attributes"].items())
+            label = "  " * depth + span["name"]
+            print(f"    {label:<32}{1000 * (span['start'] - t0):>9.1f}{span['duration_ms']:>10.1f}  {attributes}")
+            walk(span["span_id"], depth + 1)
+
+    print(f"    {'span':<32}{'at ms':>9}{'took ms':>10}")
+    walk(None, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise the tracer's spans: per-stage latency and the slowest requests.")
+    parser.add_argument("path", nargs="?", default=config.TRACE_FILE, help="span file (JSON lines)")
+    parser.add_argument("--slowest", type=int, default=3, help="how many of the slowest traces to break down")
+    parser.add_argument("--name", help="only consider traces that have a span with this name (e.g. LLMResponseAgent)")
+    args = parser.parse_args()
+
+    spans = read_spans(args.path)
+    if not spans:
+        print(f"No spans in {args.path}")
+        return
+    if args.name:
+        wanted = {span["trace_id"] for span in spans if span["name"] == args.name}
+        spans = [span for span in spans if span["trace_id"] in wanted]
+
+    print(f"{len(spans)} spans from {len({span['trace_id'] for span in spans})} traces\n")
+    print(f"{'span':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'total ms':>12}")
+    for name, count, p50, p95, p99, total in stage_table(spans):
+        print(f"{name:<20}{count:>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}{total:>12.1f}")
+
+    for elapsed, trace_spans in traces(spans)[:args.slowest]:
+        print(f"\n{trace_spans[0]['trace_id']}: {elapsed:.1f} ms end to end")
+        print_tree(trace_spans)
+
+
+if __name__ == "__main__":
+    main()
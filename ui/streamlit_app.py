@@ -11,34 +11,29 @@ print("Python PATH:", sys.path)
 print("Working dir:", os.getcwd())
 
 # --- Core Imports ---
-from mcp.message_dispatcher import MCPDispatcher, MCPMessage
-from agents.ingestion_agent import IngestionAgent
-from agents.retrieval_agent import RetrievalAgent
-from agents.llm_response_agent import LLMResponseAgent
-from vector_store.faiss_store import VectorStore
-import parsers.pdf_parser as pdf
-import parsers.pptx_parser as pptx
-import parsers.docx_parser as docx
-import parsers.csv_parser as csv
-import parsers.txt_parser as txt
+import hashlib
+import importlib.machinery
+import tempfile
+import traceback
+import config
+from mcp.message_dispatcher import MCPMessage
+from main import build_system
 import streamlit as st
 
+# Batch ingestion parses files in spawned worker processes (see utils.indexing.ingest_files), and a spawned
+# process re-runs the main script first: under Streamlit, that's this whole app, store and all. A spec named
+# "__main__" tells multiprocessing the main module has nothing to re-run.
+__spec__ = importlib.machinery.ModuleSpec("__main__", None)
+
 # === System Initialization ===
-# Set up the dispatcher (message hub) and the vector store (memory for document chunks)
-dispatcher = MCPDispatcher()
-vector_store = VectorStore(dim=384)
-parsers_dict = {
-    "pdf": pdf.parse_pdf,
-    "pptx": pptx.parse_pptx,
-    "docx": docx.parse_docx,
-    "csv": csv.parse_csv,
-    "txt": txt.parse_txt
-}
-
-# Register all the agents so they can talk to each other
-IngestionAgent(dispatcher, vector_store, parsers_dict)
-RetrievalAgent(dispatcher, vector_store)
-LLMResponseAgent(dispatcher)
+# The dispatcher (message hub), the agents and the vector store (memory for document chunks) are built
+# once per process and shared by every rerun and every session, instead of being rebuilt on each click.
+@st.cache_resource
+def get_system():
+    return build_system()
+
+system = get_system()
+dispatcher = system.dispatcher
 
 # === UI Styling (unchanged) ===
 st.markdown("""
@@ -559,32 +554,74 @@ with st.sidebar:
     </div>
     """, unsafe_allow_html=True)
     # User uploads a file here; we process it and let the agents know
-    uploaded_file = st.file_uploader("Choose a file", type=["pdf", "pptx", "docx", "csv", "txt"])
-    if uploaded_file:
-        file_type = uploaded_file.name.split(".")[-1]
-        temp_path = f"temp_upload.{file_type}"
-        with st.spinner("Processing your document, hang tight!"):
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            # Send a message to the IngestionAgent to start processing
-            ingestion_msg = MCPMessage(
-                sender="UI",
-                receiver="IngestionAgent",
-                type="DOCUMENT_UPLOAD",
-                trace_id="trace-001",
-                payload={"file_path": temp_path, "file_type": file_type}
-            )
-            dispatcher.send_message(ingestion_msg)
+    uploaded_files = st.file_uploader("Choose files", type=["pdf", "pptx", "docx", "csv", "txt"], accept_multiple_files=True)
+    if uploaded_files:
+        # Streamlit keeps the uploads around on every rerun, so we key ingestion on each file's content:
+        # an unchanged upload is never parsed, chunked or embedded twice
+        ingested = st.session_state.setdefault("ingested_hashes", set())
+        new_files = []
+        for uploaded_file in uploaded_files:
+            content_hash = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+            if content_hash not in ingested:
+                new_files.append((uploaded_file, content_hash))
+        upload_error = None
+        if new_files:
+            # The parsers read from disk, so the uploads go to a temporary folder that's removed once they're ingested
+            with tempfile.TemporaryDirectory(prefix="rag_upload_") as upload_dir, \
+                    st.spinner("Processing your documents, hang tight!"):
+                new_files = [(uploaded_file, content_hash,
+                              os.path.join(upload_dir, f"upload_{content_hash[:16]}.{uploaded_file.name.split('.')[-1]}"))
+                             for uploaded_file, content_hash in new_files]
+                for uploaded_file, content_hash, temp_path in new_files:
+                    with open(temp_path, "wb") as f:
+                        f.write(uploaded_file.getbuffer())
+                # Send a message to the IngestionAgent to start processing: one file on its own,
+                # or several at once through the parallel batch pipeline
+                if len(new_files) == 1:
+                    uploaded_file, content_hash, temp_path = new_files[0]
+                    ingestion_msg = MCPMessage(
+                        sender="UI",
+                        receiver="IngestionAgent",
+                        type="DOCUMENT_UPLOAD",
+                        trace_id=dispatcher.new_trace_id(),
+                        payload={"file_path": temp_path, "file_type": temp_path.split(".")[-1], "content_hash": content_hash,
+                                 "source": uploaded_file.name}
+                    )
+                else:
+                    ingestion_msg = MCPMessage(
+                        sender="UI",
+                        receiver="IngestionAgent",
+                        type="DOCUMENT_BATCH_UPLOAD",
+                        trace_id=dispatcher.new_trace_id(),
+                        payload={"file_paths": [temp_path for _, _, temp_path in new_files],
+                                 "sources": [uploaded_file.name for uploaded_file, _, _ in new_files],
+                                 "content_hashes": [content_hash for _, content_hash, _ in new_files]}
+                    )
+                try:
+                    dispatcher.request(ingestion_msg, timeout=config.INGEST_TIMEOUT)
+                except TimeoutError:
+                    upload_error = "Processing your documents took too long. Please try again."
+                except Exception as e:
+                    print(f"[UI] Ingestion failed ({ingestion_msg.trace_id}):\n{traceback.format_exc()}")
+                    upload_error = f"Sorry, your documents couldn't be processed: {e}"
+            if upload_error is None:
+                ingested.update(content_hash for _, content_hash, _ in new_files)
+            else:
+                st.error(upload_error)
         # Show a custom message to the user (invisible text on white, as requested)
-        st.markdown(f"""
-        <div style='background:#fff; color:#fff; border:1.5px solid #111; border-radius:8px; padding:1rem 1.2rem; font-family:Inter,sans-serif; margin-bottom:1.2rem;'>
-        ✅ Document '{uploaded_file.name}' successfully processed and indexed
-        </div>
-        """, unsafe_allow_html=True)
-    st.markdown("""
+        names = ", ".join(f"'{uploaded_file.name}'" for uploaded_file in uploaded_files)
+        if upload_error is None:
+            st.markdown(f"""
+            <div style='background:#fff; color:#fff; border:1.5px solid #111; border-radius:8px; padding:1rem 1.2rem; font-family:Inter,sans-serif; margin-bottom:1.2rem;'>
+            ✅ Document{"s" if len(uploaded_files) > 1 else ""} {names} successfully processed and indexed
+            </div>
+            """, unsafe_allow_html=True)
+    cache_stats = system.ingestion_agent.embedding_cache.stats()
+    st.markdown(f"""
     <div class='sidebar-system-box'>
         <b>System Status</b><br>
-        Vector Store: Active (384 dims)<br>
+        Vector Store: Active ({config.VECTOR_STORE_BACKEND}, {config.EMBEDDING_DIM} dims)<br>
+        Embedding Cache: {cache_stats["memory_hits"] + cache_stats["disk_hits"]} hits / {cache_stats["misses"]} misses<br>
         Supported: PDF, PPTX, DOCX, CSV, TXT<br>
         Agents: Ingestion, Retrieval, LLM Response<br>
         Dispatcher: Running
@@ -677,6 +714,10 @@ for entry in st.session_state["chat_history"]:
 
 st.markdown("</div>", unsafe_allow_html=True)
 
+# An error from the last question (kept across the rerun that shows its answer)
+if "chat_error" in st.session_state:
+    st.error(st.session_state.pop("chat_error"))
+
 # Chat input at the bottom: user types a question and hits send
 with st.container():
     st.markdown("""
@@ -696,7 +737,8 @@ with st.container():
 # When the user sends a message, add it to the chat history and trigger the agents
 if send and user_input.strip():
     st.session_state["chat_history"].append({"role": "user", "content": user_input.strip()})
-    if not uploaded_file:
+    # Documents ingested before (and warm-started from a snapshot) count too, not just this session's uploads
+    if len(system.vector_store.chunks) - system.vector_store.metadata.n_deleted == 0:
         st.session_state["chat_history"].append({"role": "agent", "content": "Please upload a document before asking a question."})
     else:
         # Build a message for the RetrievalAgent to fetch relevant context
@@ -704,19 +746,28 @@ if send and user_input.strip():
             sender="UI",
             receiver="RetrievalAgent",
             type="QUERY_REQUEST",
-            trace_id="trace-002",
-            payload={"query": user_input.strip()}
+            trace_id=dispatcher.new_trace_id(),
+            payload={"query": user_input.strip(), "stream": True}
         )
-        dispatcher.send_message(retrieval_msg)
-        # Wait for the LLMResponseAgent to put the answer in session state
-        import time
-        for _ in range(30):
-            if "llm_response" in st.session_state:
-                break
-            time.sleep(0.1)
-        if "llm_response" in st.session_state:
-            st.session_state["chat_history"].append({"role": "agent", "content": st.session_state["llm_response"]})
-            del st.session_state["llm_response"]
+        # Wait for the LLMResponseAgent to resolve our trace ID—no polling, and no shared session slot
+        try:
+            token_stream = dispatcher.request(retrieval_msg, timeout=config.REQUEST_TIMEOUT)
+            if token_stream is not None:
+                # Render the answer token by token as the LLM streams it back
+                st.markdown(f"<div class='user-bubble'>{user_input.strip()}</div>", unsafe_allow_html=True)
+                bubble = st.empty()
+                answer = ""
+                for token in token_stream:
+                    answer += token
+                    bubble.markdown(f"<div class='agent-bubble'>{answer}</div>", unsafe_allow_html=True)
+        except TimeoutError:
+            token_stream = None
+        except Exception as e:
+            print(f"[UI] Question failed ({retrieval_msg.trace_id}):\n{traceback.format_exc()}")
+            st.session_state["chat_error"] = f"Sorry, something went wrong while answering: {e}"
+            token_stream = None
+        if token_stream is not None:
+            st.session_state["chat_history"].append({"role": "agent", "content": answer.strip() or "Sorry, no response generated."})
         else:
             st.session_state["chat_history"].append({"role": "agent", "content": "Sorry, no response generated."})
     st.experimental_rerun()
@@ -1,9 +1,153 @@
 # This function helps us break up long text into smaller, manageable pieces.
 # It's like slicing a big loaf of bread into snack-sized portions for the AI to digest!
-def chunk_text(text, chunk_size=500):
+# Chunks are measured in (estimated) LLM tokens and cut between sentences—preferably between
+# paragraphs—so each one reads as a whole thought, and neighbouring chunks can share a little overlap.
+import re
+from collections import namedtuple
+
+import config
+from utils.tokens import count_tokens
+
+# A sentence: anything up to terminal punctuation (plus closing quotes/brackets) followed by
+# whitespace, up to a blank line, or up to the end of the segment
+_SENTENCE = re.compile(r"\S.*?(?:[.!?]+[\"')\]]*(?=\s|$)|(?=\n[ \t]*\n)|$)", re.S)
+_PARAGRAPH_BREAK = re.compile(r"[ \t]*\n[ \t]*\n")
+_WORD = re.compile(r"\S+")
+
+# One sentence (or piece of an over-long one): its normalised text, its segment's location, its
+# character offsets in the whole document, its token count, and whether a paragraph ends after it
+_Unit = namedtuple("_Unit", "text location start end tokens paragraph_end")
+
+
+def _sentences(text):
     """
-    Splits the input text into chunks of a specified size (in words).
+    Yield (match, paragraph_end) for each sentence of a text; the end of the text counts as a paragraph end.
+    """
+    for match in _SENTENCE.finditer(text):
+        yield match, match.end() == len(text) or bool(_PARAGRAPH_BREAK.match(text, match.end()))
+
+
+def split_sentences(text):
+    """
+    The sentences of a text as (sentence, paragraph_end) pairs, where paragraph_end says whether a
+    blank line (or the end of the text) follows the sentence. Line breaks inside a sentence are kept.
+    """
+    return [(match.group().rstrip(), paragraph_end) for match, paragraph_end in _sentences(text)]
+
+
+def _split_word(word, max_tokens):
+    """
+    Yield (offset, piece, tokens) for a word: the whole word if it fits in max_tokens tokens, otherwise
+    pieces of it (of a long URL, say, or a base64 blob) that each do, cut as long as they can be.
+    """
+    tokens = count_tokens(word)
+    if tokens <= max_tokens:
+        yield 0, word, tokens
+        return
+    start = 0
+    while start < len(word):
+        # Every character costs at most one token, so max_tokens of them always fit; and no more than
+        # five per token (plus rounding) ever do. The longest prefix in between that fits is found by
+        # bisection, since the token count only grows as a prefix gets longer.
+        low, high = min(len(word), start + max(1, max_tokens)), min(len(word), start + 5 * max_tokens + 2)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if count_tokens(word[start:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        yield start, word[start:low], count_tokens(word[start:low])
+        start = low
+
+
+def _units(segments, max_tokens):
+    """
+    Split a stream of (text, location) segments into sentence units of at most max_tokens tokens each.
+    A segment's end (a page, slide or paragraph) counts as a paragraph end.
+    """
+    base = 0
+    for text, location in segments:
+        for match, paragraph_end in _sentences(text):
+            sentence = match.group()
+            tokens = count_tokens(sentence)
+            if tokens <= max_tokens:
+                yield _Unit(" ".join(sentence.split()), location, base + match.start(), base + match.end(),
+                            tokens, paragraph_end)
+                continue
+            # A sentence too long for a chunk on its own is split between words (and a word too long
+            # for one, inside it)
+            words, size, start = [], 0, None
+            for word in _WORD.finditer(sentence):
+                for offset, piece, piece_tokens in _split_word(word.group(), max_tokens):
+                    if words and size + piece_tokens > max_tokens:
+                        yield _Unit(" ".join(words), location, start, end, size, False)
+                        words, size = [], 0
+                    if not words:
+                        start = base + match.start() + word.start() + offset
+                    words.append(piece)
+                    size += piece_tokens
+                    end = base + match.start() + word.start() + offset + len(piece)
+            yield _Unit(" ".join(words), location, start, end, size, paragraph_end)
+        base += len(text)
+
+
+def _join(units):
+    """
+    The text of a chunk: sentences joined by spaces, paragraphs by a blank line.
+    """
+    parts = []
+    for unit in units:
+        parts.append(unit.text)
+        parts.append("\n\n" if unit.paragraph_end else " ")
+    return "".join(parts[:-1])
+
+
+def chunk_segments(segments, chunk_tokens=config.CHUNK_TOKENS, overlap_tokens=config.CHUNK_OVERLAP_TOKENS):
+    """
+    Splits a stream of (text, location) segments—as yielded by the streaming parsers—into chunks of at
+    most chunk_tokens (estimated) tokens, yielding (chunk, location) as soon as each chunk is complete.
+    Chunks end between sentences: at the last paragraph end if that leaves the chunk at least half full,
+    otherwise after the last sentence that fits. Each chunk after the first starts with the previous one's
+    last few sentences, up to overlap_tokens, so a thought cut in two is still whole in one of them.
+    A chunk's location is that of the segment its first sentence came from, plus "start"/"end": the chunk's
+    character offsets in the document's text (all the segments back to back).
+    Only about one chunk's worth of sentences is held at a time, however long the document is.
+    """
+    chunk, size, n_overlap = [], 0, 0
+
+    def cut():
+        # Where to end the chunk: the last paragraph end past the overlap that leaves it at least half full
+        total = sum(unit.tokens for unit in chunk)
+        for k in range(len(chunk), n_overlap, -1):
+            if chunk[k - 1].paragraph_end and total >= chunk_tokens / 2:
+                return k
+            total -= chunk[k - 1].tokens
+        return len(chunk)
+
+    for unit in _units(segments, chunk_tokens):
+        while len(chunk) > n_overlap and size + unit.tokens > chunk_tokens:
+            k = cut()
+            emitted, rest = chunk[:k], chunk[k:]
+            yield _join(emitted), dict(emitted[0].location or {}, start=emitted[0].start, end=emitted[k - 1].end)
+            overlap, overlap_size = [], 0
+            for previous in reversed(emitted[n_overlap:]):
+                if overlap_size + previous.tokens > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += previous.tokens
+            rest_size = sum(u.tokens for u in rest)
+            if overlap_size + rest_size + unit.tokens > chunk_tokens:
+                overlap, overlap_size = [], 0
+            chunk, size, n_overlap = overlap + rest, overlap_size + rest_size, len(overlap)
+        chunk.append(unit)
+        size += unit.tokens
+    if len(chunk) > n_overlap:
+        yield _join(chunk), dict(chunk[0].location or {}, start=chunk[0].start, end=chunk[-1].end)
+
+
+def chunk_text(text, chunk_tokens=config.CHUNK_TOKENS, overlap_tokens=config.CHUNK_OVERLAP_TOKENS):
+    """
+    Splits the input text into chunks of at most chunk_tokens tokens (see chunk_segments).
     This makes it easier for downstream processing and avoids overwhelming the model.
     """
-    words = text.split()
-    return [" ".join(words[i:i+chunk_size]) for i in range(0, len(words), chunk_size)]
+    return [chunk for chunk, _ in chunk_segments([(text, None)], chunk_tokens, overlap_tokens)]
@@ -0,0 +1,90 @@
+# This module assembles the context part of the LLM prompt from the reranked chunks.
+# Every prompt token costs latency and money, so the chunks are packed into a token budget: best chunks
+# first, each labelled with where it came from, leaving out sentences that are already in (neighbouring
+# chunks overlap, and boilerplate repeats across documents), and cutting the chunk that doesn't fit whole
+# at a sentence boundary.
+import os
+from collections import namedtuple
+
+from utils.chunking import split_sentences
+from utils.tokens import count_tokens
+from vector_store.bm25 import tokenize
+
+# The packed context, its (estimated) token count, how many chunks made it in (whole or in part), how many
+# repeated sentences were left out, and whether anything was cut for lack of room
+PackedContext = namedtuple("PackedContext", "text tokens chunks duplicates truncated")
+
+
+def source_label(meta):
+    """
+    A short citation for a chunk: its file name, plus the page, slide, paragraph or rows if known.
+    CSV rows come as a [first, last + 1] range counted from 0 (or, from older snapshots, just the first
+    row), and are cited counting from 1.
+    """
+    if not meta or not meta.get("source"):
+        return ""
+    label = os.path.basename(meta["source"])
+    for key in ("page", "slide", "paragraph"):
+        if key in meta:
+            return f"{label}, {key} {meta[key]}"
+    if "rows" in meta:
+        rows = meta["rows"]
+        if isinstance(rows, (list, tuple)):
+            return f"{label}, rows {rows[0] + 1}-{rows[1]}"
+        return f"{label}, row {rows + 1}"
+    return label
+
+
+def _cut_words(sentence, token_budget):
+    """
+    The longest run of sentence's first words that fits in token_budget tokens.
+    """
+    words, used = [], 0
+    for word in sentence.split():
+        tokens = count_tokens(word)
+        if used + tokens > token_budget:
+            break
+        words.append(word)
+        used += tokens
+    return " ".join(words), used
+
+
+def pack_context(chunks, token_budget, sources=None):
+    """
+    Pack chunk texts (best first) into at most token_budget (estimated) tokens, and return a PackedContext.
+    Each chunk becomes a block headed "[n] source" (sources, optional, has one metadata dict per chunk).
+    Sentences already packed from an earlier chunk are skipped, and a chunk with nothing new is left out.
+    The first chunk that doesn't fit is cut after its last sentence that does, and packing stops there.
+    Only if not even one sentence fits is a sentence cut between words, so the context is never empty
+    when there's any room at all.
+    """
+    blocks, seen = [], set()
+    used, duplicates, truncated = 0, 0, False
+    for i, chunk in enumerate(chunks):
+        label = source_label(sources[i]) if sources else ""
+        header = f"[{len(blocks) + 1}] {label}".rstrip()
+        header_tokens = count_tokens(header)
+        body, body_tokens = [], 0
+        for sentence, paragraph_end in split_sentences(chunk):
+            key = " ".join(tokenize(sentence))
+            if key and key in seen:
+                duplicates += 1
+                continue
+            tokens = count_tokens(sentence)
+            if used + header_tokens + body_tokens + tokens > token_budget:
+                truncated = True
+                if not blocks and not body:
+                    sentence, tokens = _cut_words(sentence, token_budget - used - header_tokens)
+                    if sentence:
+                        body.append(sentence)
+                        body_tokens += tokens
+                break
+            seen.add(key)
+            body.append(sentence + ("\n" if paragraph_end else " "))
+            body_tokens += tokens
+        if body:
+            blocks.append(header + "\n" + "".join(body).strip())
+            used += header_tokens + body_tokens
+        if truncated:
+            break
+    return PackedContext("\n\n".join(blocks), used, len(blocks), duplicates, truncated)
@@ -0,0 +1,176 @@
+# These helpers are shared by every ingestion path (one file at a time, or in bulk):
+# fingerprinting files, turning chunks into vectors in the vector store, and bulk-loading many files
+# (used by batch_ingest.py and the IngestionAgent's batch uploads).
+import hashlib
+import multiprocessing
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import config
+from embeddings.cache import get_embedding_cache
+from embeddings.embedder import get_embedder
+from mcp.tracing import tracer
+from parsers.registry import iter_chunks
+
+
+# What index_chunks did with a batch: chunks collapsed into an identical existing chunk, and chunks stored
+# even though they nearly duplicate one (a revised paragraph, say)
+Indexed = namedtuple("Indexed", "duplicates near_duplicates")
+
+
+def file_hash(file_path, block_size=1 << 20):
+    """
+    SHA-256 of a file's contents, read in blocks so big files don't have to fit in memory.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_chunks(vector_store, embedder, embedding_cache, chunks, metadata=None):
+    """
+    Embed chunks and add them to the vector store. If the store is still empty, this is the start
+    of a new corpus, so the embedder is fitted; otherwise it's only updated incrementally, until the
+    store has grown enough that the embedder wants refitting (see Embedder.needs_refit), at which
+    point every chunk is re-embedded.
+    metadata (optional) has one dict per chunk, with its doc_id and location.
+    Duplicates—chunks with the same text as one already in the store, or as an earlier chunk in this
+    batch—aren't embedded or stored again: their document gets a reference to the existing chunk instead.
+    Near-duplicates are only counted; they're stored like any other chunk, since the words that differ
+    (a changed figure in a revised file) may be the ones that matter.
+    Returns an Indexed with both counts.
+    The three steps are traced as "dedup", "embed" and "index_add" spans (and a refit as "reembed").
+    """
+    if not chunks:
+        return Indexed(0, 0)
+    metadata = metadata if metadata is not None else [{}] * len(chunks)
+    with tracer.span("dedup", chunks=len(chunks)) as span:
+        matches = vector_store.find_duplicates(chunks)
+        new = [i for i, match in enumerate(matches) if match is None or not match.exact]
+        near_duplicates = sum(match is not None and not match.exact for match in matches)
+        span.set(duplicates=len(chunks) - len(new), near_duplicates=near_duplicates)
+    new_chunks = [chunks[i] for i in new]
+    chunk_ids = {}
+    if new_chunks:
+        with tracer.span("embed", chunks=len(new_chunks)):
+            if len(vector_store.chunks) == 0:
+                embedder.fit(new_chunks)
+            else:
+                embedder.partial_fit(new_chunks)
+            embeddings = embedding_cache.transform(embedder, new_chunks)
+        with tracer.span("index_add", chunks=len(new_chunks)):
+            chunk_ids = dict(zip(new, vector_store.add_embeddings(embeddings, new_chunks, [metadata[i] for i in new])))
+            vector_store.embedder_version = embedder.version
+        n_live = len(vector_store.metadata) - vector_store.metadata.n_deleted
+        if embedder.needs_refit(n_live):
+            with tracer.span("reembed", chunks=n_live):
+                vector_store.reembed(embedder)
+    references = []
+    for i, match in enumerate(matches):
+        if match is not None and match.exact:
+            target = chunk_ids[match.target] if match.kind == "batch" else match.target
+            references.append((metadata[i].get("doc_id", -1), target))
+    vector_store.add_references(references)
+    return Indexed(len(references), near_duplicates)
+
+
+def _parse_and_chunk(file_path, file_type):
+    """
+    Runs inside a worker process: stream one file's pages through the chunker.
+    Returns a list of (chunk, location) pairs.
+    """
+    return list(iter_chunks(file_path, file_type))
+
+
+def ingest_files(file_paths, vector_store, embedder=None, embedding_cache=None, workers=config.BATCH_WORKERS,
+                 batch_size=config.BATCH_EMBED_SIZE, progress=print, sources=None, content_hashes=None):
+    """
+    Ingest many files at once. Files are parsed and chunked in a process pool (at most 2 x workers
+    files in flight, so memory stays bounded), and chunks are embedded and added to the vector store
+    in batches of about batch_size. Files already in the store (same content hash), or repeating an
+    earlier file of the same run, are skipped; files that can't be read or parsed count as failed.
+    sources (optional, one per file) names each document; it defaults to the file path. A file whose
+    source was ingested before replaces the old version, which is removed once the new one is in.
+    content_hashes (optional, one per file) are the files' SHA-256 hashes if the caller already has them;
+    otherwise each file is hashed here.
+    Returns a summary dict with counts of files ingested, skipped and failed, chunks added, how many of
+    those were duplicates stored as references, and how many were near-duplicates (see index_chunks).
+    """
+    sources = dict(zip(file_paths, sources or file_paths))
+    known_hashes = dict(zip(file_paths, content_hashes or []))
+    embedder = embedder or get_embedder()
+    embedding_cache = embedding_cache or get_embedding_cache()
+    summary = {"files": 0, "skipped": 0, "failed": 0, "chunks": 0, "duplicates": 0, "near_duplicates": 0}
+    buffer, buffered_metas, buffered_hashes, replaced = [], [], [], []
+    seen = set()
+    started = time.monotonic()
+
+    def flush():
+        for start in range(0, len(buffer), batch_size):
+            indexed = index_chunks(vector_store, embedder, embedding_cache, buffer[start:start + batch_size],
+                                   buffered_metas[start:start + batch_size])
+            summary["duplicates"] += indexed.duplicates
+            summary["near_duplicates"] += indexed.near_duplicates
+        vector_store.ingested_hashes.update(buffered_hashes)
+        for doc_id in replaced:
+            vector_store.remove_document(doc_id)
+        summary["chunks"] += len(buffer)
+        buffer.clear()
+        buffered_metas.clear()
+        replaced.clear()
+        buffered_hashes.clear()
+
+    # Worker processes are spawned, not forked: this runs inside a process full of threads (the dispatcher's
+    # event loop and thread pool, Streamlit's), and a fork can copy a lock one of them holds, deadlocking the child.
+    # A spawned worker imports the main script again, so that has to be safe to import (if __name__ == "__main__")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = {}
+        todo = iter(file_paths)
+        total = len(file_paths)
+        while True:
+            # Keep the pool busy, but never hold more than 2 x workers parsed files in memory
+            for file_path in todo:
+                try:
+                    content_hash = known_hashes.get(file_path) or file_hash(file_path)
+                except OSError as e:
+                    summary["failed"] += 1
+                    progress(f"[batch] Failed to read {file_path}: {e}")
+                    continue
+                # ingested_hashes only learns about this run's files at the next flush, so copies of one
+                # file within the run are caught by seen
+                if content_hash in vector_store.ingested_hashes or content_hash in seen:
+                    summary["skipped"] += 1
+                    continue
+                seen.add(content_hash)
+                file_type = file_path.rsplit(".", 1)[-1].lower()
+                pending[pool.submit(_parse_and_chunk, file_path, file_type)] = (file_path, content_hash)
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path, content_hash = pending.pop(future)
+                try:
+                    chunks = future.result()
+                    replaced.extend(vector_store.metadata.doc_ids_for(sources[file_path]))
+                    doc_id = vector_store.add_document(sources[file_path], content_hash)
+                    buffer.extend(chunk for chunk, _ in chunks)
+                    buffered_metas.extend(dict(location, doc_id=doc_id) for _, location in chunks)
+                    buffered_hashes.append(content_hash)
+                    summary["files"] += 1
+                except Exception as e:
+                    summary["failed"] += 1
+                    progress(f"[batch] Failed to parse {file_path}: {e}")
+            if len(buffer) >= batch_size:
+                flush()
+            finished = summary["files"] + summary["skipped"] + summary["failed"]
+            elapsed = time.monotonic() - started
+            progress(f"[batch] {finished}/{total} files, {summary['chunks'] + len(buffer)} chunks, "
+                     f"{finished / elapsed if elapsed else 0:.1f} files/s")
+    flush()
+    embedder.save(config.EMBEDDER_PATH)
+    return summary
@@ -0,0 +1,65 @@
+# This module is the reranking stage between retrieval and the LLM. Retrieval over-fetches a few dozen
+# candidates; this picks the handful worth putting in the prompt. It's entirely local (no cross-encoder,
+# no API call): candidates are scored by their retrieval rank and how many query terms they contain,
+# and then picked by maximal marginal relevance (MMR), so near-duplicates don't crowd out other evidence.
+# The picks stop at top_k chunks or the token budget, whichever comes first.
+import config
+from utils.tokens import count_tokens
+from vector_store.bm25 import tokenize
+
+
+def _similarity(a, b):
+    """
+    Jaccard similarity of two term sets.
+    """
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def rerank(query, candidates, top_k=3, token_budget=config.CONTEXT_TOKEN_BUDGET,
+           diversity=config.RERANK_DIVERSITY, overlap_weight=0.5):
+    """
+    Pick up to top_k of the (chunk_id, text) candidates, which come best first from retrieval, and return
+    their chunk ids in the order they were picked. Invalid ids (negative or None, as FAISS pads with) and
+    repeats—the same id, or the same text from another document—are dropped first.
+
+    A candidate's relevance mixes its retrieval rank with the share of query terms it contains
+    (overlap_weight is the share of the latter). Each pick then maximises
+    (1 - diversity) * relevance - diversity * (its highest similarity to a chunk already picked).
+    Chunks that would take the picks past token_budget tokens are skipped; the first pick is always kept.
+    """
+    query_terms = set(tokenize(query))
+    pool, seen_ids, seen_texts = [], set(), set()
+    for chunk_id, text in candidates:
+        if chunk_id is None or chunk_id < 0 or chunk_id in seen_ids:
+            continue
+        terms = tokenize(text)
+        fingerprint = " ".join(terms)
+        if fingerprint in seen_texts:
+            continue
+        seen_ids.add(chunk_id)
+        seen_texts.add(fingerprint)
+        pool.append((chunk_id, set(terms), count_tokens(text)))
+    if not pool:
+        return []
+    relevance = []
+    for rank, (_, terms, _) in enumerate(pool):
+        overlap = len(query_terms & terms) / len(query_terms) if query_terms else 0.0
+        relevance.append((1 - overlap_weight) * (1 - rank / len(pool)) + overlap_weight * overlap)
+
+    picked, picked_terms, used = [], [], 0
+    remaining = list(range(len(pool)))
+    while remaining and len(picked) < top_k:
+        def mmr(i):
+            redundancy = max((_similarity(pool[i][1], terms) for terms in picked_terms), default=0.0)
+            return (1 - diversity) * relevance[i] - diversity * redundancy
+        best = max(remaining, key=mmr)
+        remaining.remove(best)
+        chunk_id, terms, tokens = pool[best]
+        if picked and used + tokens > token_budget:
+            continue
+        picked.append(chunk_id)
+        picked_terms.append(terms)
+        used += tokens
+    return picked
@@ -0,0 +1,102 @@
+# This module builds the FAISS indexes behind the VectorStore, from exact to approximate:
+#   flat  - exhaustive scan: exact, but every query touches every vector
+#   ivf   - vectors are bucketed around trained centroids; a query only scans the nprobe nearest buckets
+#   ivfpq - like ivf, but vectors are also compressed (product quantisation), so they take a fraction of the memory
+#   hnsw  - a navigable graph: very fast and accurate, but more memory, and nothing can be removed in place
+import math
+
+import faiss
+import numpy as np
+
+import config
+
+INDEX_KINDS = ("flat", "ivf", "ivfpq", "hnsw")
+
+METRICS = {"ip": faiss.METRIC_INNER_PRODUCT, "l2": faiss.METRIC_L2}
+
+# How many vectors an index kind needs before it can be trained sensibly
+# (k-means wants ~39 points per centroid; PQ trains 256 centroids per sub-vector)
+MIN_TRAIN = {"flat": 0, "hnsw": 0, "ivf": 1000, "ivfpq": 10000}
+
+
+def default_nlist(n_vectors):
+    """
+    The usual rule of thumb for IVF: about 4 * sqrt(n) buckets, with at least 39 training points each.
+    """
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def build_index(kind, dim, n_vectors, metric=config.FAISS_METRIC, nlist=config.IVF_NLIST, pq_m=config.PQ_M,
+                hnsw_m=config.HNSW_M, ef_construction=config.HNSW_EF_CONSTRUCTION):
+    """
+    Build an empty (untrained) index of the given kind and metric ("ip" or "l2"), sized for about
+    n_vectors vectors. Every kind it returns accepts our own 64-bit ids through add_with_ids: IVF
+    indexes store ids natively, and flat/HNSW ones are wrapped in an IndexIDMap2.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown FAISS metric: {metric}")
+    faiss_metric = METRICS[metric]
+    if kind == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlat(dim, faiss_metric))
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss_metric)
+        index.hnsw.efConstruction = ef_construction
+        return faiss.IndexIDMap2(index)
+    nlist = nlist or default_nlist(n_vectors)
+    quantizer = faiss.IndexFlat(dim, faiss_metric)
+    if kind == "ivf":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss_metric)
+    elif kind == "ivfpq":
+        if dim % pq_m:
+            raise ValueError(f"PQ needs the embedding size ({dim}) to be a multiple of RAG_PQ_M ({pq_m})")
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8, faiss_metric)
+    else:
+        raise ValueError(f"Unknown FAISS index type: {kind}")
+    # Lets us look vectors up (and remove them) by id, which rebuilding and compaction need
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def train_index(index, vectors, sample_size=config.ANN_TRAIN_SAMPLE, seed=0):
+    """
+    Train an index (if it needs it) on a random sample of at most sample_size vectors.
+    """
+    if index.is_trained:
+        return
+    if len(vectors) > sample_size:
+        vectors = vectors[np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)]
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+
+
+def index_kind(index):
+    """
+    Which of INDEX_KINDS an index is (used when loading one back from disk).
+    """
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    if isinstance(index, faiss.IndexIDMap2) and isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW):
+        return "hnsw"
+    return "flat"
+
+
+def index_metric(index):
+    """
+    Which of METRICS an index uses.
+    """
+    return "ip" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+
+
+def search_params(kind, selector=None, nprobe=config.IVF_NPROBE, ef_search=config.HNSW_EF_SEARCH):
+    """
+    The per-query knobs for an index kind: how many IVF buckets to scan (nprobe) or how wide the
+    HNSW search is (efSearch). Higher is more accurate and slower. selector limits which ids may be returned.
+    """
+    if kind in ("ivf", "ivfpq"):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
@@ -0,0 +1,315 @@
+# This module holds the parts every vector store shares: the chunk text, the chunk metadata,
+# the list of documents, and the bookkeeping for removing or replacing a document.
+# Removing a document only tombstones its chunks; they are swept out in one go (compaction)
+# once enough of the store is dead, so updating one file never means rebuilding everything.
+# Next to the vectors, a BM25 keyword index (vector_store.bm25) can be kept over the same chunks,
+# and a MinHash index (vector_store.dedup) that catches duplicate chunks before they're embedded.
+import threading
+
+import numpy as np
+
+import config
+from vector_store.bm25 import BM25Index
+from vector_store.chunk_table import ChunkTable
+from vector_store.dedup import NearDuplicateIndex
+from vector_store.fusion import reciprocal_rank_fusion
+from vector_store.metadata import ChunkMetadata
+from vector_store.snapshot import current_snapshot, load_meta, save_meta, write_snapshot
+
+
+def _bm25_params():
+    return {"k1": config.BM25_K1, "b": config.BM25_B, "max_df": config.BM25_MAX_DF, "max_postings": config.BM25_MAX_POSTINGS}
+
+
+def _dedup_params():
+    return {"threshold": config.DEDUP_THRESHOLD, "bands": config.DEDUP_BANDS, "rows": config.DEDUP_ROWS}
+
+
+class BaseVectorStore:
+    """
+    Subclasses provide the index itself: _add_vectors, _search_vectors, _compact_index, _clear_index and
+    _save_index/_load_index. Chunks are always referred to by their stable chunk id.
+    """
+    backend = None
+
+    def __init__(self, dim, compact_threshold=config.COMPACT_THRESHOLD, hybrid=config.HYBRID_SEARCH,
+                 hybrid_candidates=config.HYBRID_CANDIDATES, dedup=config.DEDUP):
+        self.dim = dim
+        self.chunks = ChunkTable()
+        # Where each chunk came from (document, page/slide, offsets), in the same order as the chunks
+        self.metadata = ChunkMetadata()
+        # Content hashes of the files indexed here, so the same file is never ingested twice
+        self.ingested_hashes = set()
+        # Compact once more than this fraction of the chunks are tombstones
+        self.compact_threshold = compact_threshold
+        # BM25 over the chunk text, row for row with the chunk table (None when hybrid search is off)
+        self.lexical = BM25Index(**_bm25_params()) if hybrid else None
+        # How many hits each side (vectors, BM25) contributes to a hybrid search before fusion
+        self.hybrid_candidates = hybrid_candidates
+        # MinHash/LSH over the chunk text, to collapse duplicates at ingest (None when dedup is off)
+        self.near_duplicates = NearDuplicateIndex(**_dedup_params()) if dedup else None
+        # The version of the embedder the stored vectors came from (None until something is added)
+        self.embedder_version = None
+        # Agents may add and search from different threads (see the async dispatcher)
+        self._lock = threading.RLock()
+
+    def add_embeddings(self, embeddings, chunks, metadata=None):
+        """
+        Add new embeddings and their text chunks, and return the chunk ids they were given.
+        metadata (optional) has one dict per chunk: its doc_id and location, as the chunker yields them.
+        """
+        with self._lock:
+            chunk_ids = self.metadata.extend(metadata if metadata is not None else [{}] * len(chunks))
+            self._add_vectors(embeddings, chunk_ids)
+            self.chunks.extend(chunks)
+            if self.lexical is not None:
+                self.lexical.add(chunks)
+            if self.near_duplicates is not None:
+                self.near_duplicates.add(chunks, chunk_ids)
+        return chunk_ids
+
+    def find_duplicates(self, chunks):
+        """
+        Check chunks about to be added for duplicates, before anything is spent on embedding them.
+        Returns one entry per chunk: a vector_store.dedup.Match against a live chunk already in the store
+        ("chunk", chunk_id) or an earlier chunk in the same list ("batch", i), exact if it's the same text
+        and not if it's only a near-duplicate; or None if it's new (or dedup is off).
+        """
+        if self.near_duplicates is None:
+            return [None] * len(chunks)
+
+        def stored_text(chunk_id):
+            try:
+                row = self.metadata.row(chunk_id)
+            except KeyError:
+                return None
+            return self.chunks[row] if self.metadata.is_live(row) else None
+
+        with self._lock:
+            return self.near_duplicates.find(chunks, stored_text)
+
+    def add_references(self, references):
+        """
+        Record (doc_id, chunk_id) pairs: the document contains a duplicate of that existing chunk, which
+        stands in for it. The chunk then shows up in searches filtered to that document too.
+        References from a chunk's own document (or from no document) aren't needed and are skipped.
+        """
+        with self._lock:
+            for doc_id, chunk_id in references:
+                if doc_id >= 0 and self.metadata[self.metadata.row(chunk_id)]["doc_id"] != doc_id:
+                    self.metadata.add_reference(doc_id, chunk_id)
+
+    def get_chunk(self, chunk_id):
+        """
+        The text of a chunk, looked up by its chunk id.
+        """
+        with self._lock:
+            return self.chunks[self.metadata.row(chunk_id)]
+
+    def get_metadata(self, chunk_id):
+        """
+        Where a chunk came from (document, source, page/slide, offsets), looked up by its chunk id.
+        """
+        with self._lock:
+            return self.metadata[self.metadata.row(chunk_id)]
+
+    def search_ids(self, query_embedding, top_k=3, doc_ids=None, query_text=None):
+        """
+        Find the chunk ids of the top_k most similar chunks to one query embedding.
+        If doc_ids is given, only chunks from those documents are considered.
+        If query_text is given too, the search is hybrid (see search_ids_batch).
+        """
+        return self.search_ids_batch(query_embedding, top_k, doc_ids, None if query_text is None else [query_text])[0]
+
+    def search_ids_batch(self, query_embeddings, top_k=3, doc_ids=None, query_texts=None):
+        """
+        Find the chunk ids of the top_k best chunks for every query embedding (one per row).
+        If doc_ids is given, only chunks from those documents are considered.
+        With query_texts (the queries themselves, one per row) and the BM25 index on, the search is hybrid:
+        each query's top hybrid_candidates by vector similarity and by BM25 are merged by reciprocal-rank
+        fusion, so a chunk sharing a rare exact term with the query can surface even if its embedding doesn't.
+        """
+        if query_texts is None or self.lexical is None:
+            return self._search_vectors(query_embeddings, top_k, doc_ids)
+        n_candidates = max(top_k, self.hybrid_candidates)
+        with self._lock:
+            vector_hits = self._search_vectors(query_embeddings, n_candidates, doc_ids)
+            allowed = self._allowed_rows(doc_ids)
+            lexical_hits = [self.metadata.values("chunk_id", self.lexical.search(text, n_candidates, allowed)).tolist()
+                            for text in query_texts]
+        return [reciprocal_rank_fusion([vector, lexical], top_k) for vector, lexical in zip(vector_hits, lexical_hits)]
+
+    def _allowed_rows(self, doc_ids):
+        """
+        A boolean mask of the rows a search may return (live, and in doc_ids if given), or None if every row may.
+        """
+        if doc_ids is not None:
+            return self.metadata.mask(doc_ids) & self.metadata.live_mask()
+        if self.metadata.n_deleted:
+            return self.metadata.live_mask()
+        return None
+
+    def search(self, query_embedding, top_k=3, doc_ids=None):
+        """
+        Find the top_k most similar chunks to the query embedding.
+        This is like asking, "Which parts of my notes are most relevant to this question?"
+        """
+        return [self.get_chunk(i) for i in self.search_ids(query_embedding, top_k, doc_ids)]
+
+    def search_batch(self, query_embeddings, top_k=3, doc_ids=None):
+        """
+        Like search, for a whole matrix of queries (one per row) in a single pass over the index.
+        Returns one list of chunk texts per query.
+        """
+        return [[self.get_chunk(i) for i in ids] for ids in self.search_ids_batch(query_embeddings, top_k, doc_ids)]
+
+    def add_document(self, source, content_hash=None):
+        """
+        Register a new document and return its doc id (its chunks are added with add_embeddings).
+        """
+        with self._lock:
+            return self.metadata.add_document(source, content_hash)
+
+    def remove_document(self, doc_id):
+        """
+        Remove a document from search results and return how many chunks it had.
+        Its chunks are only tombstoned here—this costs O(that document), however large the store is.
+        Once tombstones pass compact_threshold of the store, they are all swept out at once.
+        """
+        with self._lock:
+            rows = np.flatnonzero(self.metadata.mask([doc_id], references=False) & self.metadata.live_mask())
+            # Chunks other documents reference (as collapsed duplicates) pass to one of them instead
+            self.metadata.drop_references(doc_id)
+            rows = self.metadata.hand_over(rows)
+            self.metadata.delete(rows)
+            self._on_delete(self.metadata.column("chunk_id")[rows])
+            document = self.metadata.documents[doc_id]
+            document["removed"] = True
+            content_hash = document["content_hash"]
+            if not any(doc["content_hash"] == content_hash and not doc.get("removed") for doc in self.metadata.documents):
+                self.ingested_hashes.discard(content_hash)
+            if len(self.metadata) and self.metadata.n_deleted / len(self.metadata) > self.compact_threshold:
+                self.compact()
+        return len(rows)
+
+    def upsert_document(self, source, embeddings, chunks, metadata=None, content_hash=None):
+        """
+        Add (or replace) the document from source: the new version is added first, and only then
+        is any previous version removed, so searches never see the document missing. Returns the new doc id.
+        """
+        with self._lock:
+            previous = self.metadata.doc_ids_for(source)
+            doc_id = self.add_document(source, content_hash)
+            metadata = metadata if metadata is not None else [{}] * len(chunks)
+            self.add_embeddings(embeddings, chunks, [dict(meta, doc_id=doc_id) for meta in metadata])
+            if content_hash is not None:
+                self.ingested_hashes.add(content_hash)
+            for old_doc_id in previous:
+                self.remove_document(old_doc_id)
+        return doc_id
+
+    def compact(self):
+        """
+        Sweep out every tombstoned chunk: from the index, the chunk table and the metadata.
+        Chunk ids don't change. Returns how many chunks were dropped.
+        """
+        with self._lock:
+            if not self.metadata.n_deleted:
+                return 0
+            live = self.metadata.live_mask()
+            keep = np.flatnonzero(live)
+            dead_ids = self.metadata.column("chunk_id")[~live]
+            self._compact_index(keep, dead_ids)
+            dropped = self.metadata.n_deleted
+            self.chunks = self.chunks.take(keep)
+            self.metadata = self.metadata.take(keep)
+            if self.lexical is not None:
+                self.lexical = self.lexical.take(keep)
+            if self.near_duplicates is not None:
+                self.near_duplicates.drop(dead_ids)
+        return dropped
+
+    def reembed(self, embedder, batch_size=config.BATCH_EMBED_SIZE):
+        """
+        Refit embedder on the live chunks and rebuild the vector index from their new vectors, so that
+        stored vectors and query vectors come from the same embedder again. Tombstones are swept out
+        first. Chunk ids, metadata and the BM25 and near-duplicate indexes are left as they are.
+        """
+        with self._lock:
+            self.compact()
+            self._clear_index()
+            texts = [self.chunks[i] for i in range(len(self.chunks))]
+            chunk_ids = self.metadata.column("chunk_id")
+            if texts:
+                embedder.fit(texts)
+            for start in range(0, len(texts), batch_size):
+                self._add_vectors(embedder.transform(texts[start:start + batch_size]),
+                                  np.ascontiguousarray(chunk_ids[start:start + batch_size]))
+            self.embedder_version = embedder.version
+
+    def ensure_embedder(self, embedder):
+        """
+        Make sure the stored vectors came from embedder, the one queries will go through. If they came
+        from another one (a different vocabulary or kind), or embedder was never fitted (its saved state
+        is missing), every chunk is re-embedded (see reembed). Snapshots from before the embedder was
+        recorded are trusted as long as embedder is fitted. Returns whether the chunks were re-embedded.
+        """
+        with self._lock:
+            if len(self.metadata) == self.metadata.n_deleted:
+                return False
+            if embedder.is_fitted and self.embedder_version in (None, embedder.version):
+                return False
+            print(f"[VectorStore] Vectors come from embedder {self.embedder_version}, not "
+                  f"{embedder.version or 'a new, unfitted one'}: re-embedding {len(self.metadata) - self.metadata.n_deleted} chunks")
+            self.reembed(embedder)
+        return True
+
+    def _on_delete(self, chunk_ids):
+        """
+        Hook for subclasses that cache anything derived from the tombstones.
+        """
+
+    def save(self, path):
+        """
+        Snapshot the index, the chunk table and the metadata to disk, atomically.
+        """
+        def write(snap_dir):
+            self._save_index(snap_dir)
+            self.chunks.save(snap_dir)
+            self.metadata.save(snap_dir)
+            if self.lexical is not None:
+                self.lexical.save(snap_dir)
+            if self.near_duplicates is not None:
+                self.near_duplicates.save(snap_dir)
+            save_meta(snap_dir, {"backend": self.backend, "dim": self.dim, "ingested_hashes": sorted(self.ingested_hashes),
+                                 "embedder": self.embedder_version})
+        with self._lock:
+            write_snapshot(path, write)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Warm start from the latest snapshot under path. The chunk text is memory-mapped, not read in.
+        Snapshots saved without a BM25 or near-duplicate index get one built from their chunk text
+        (once; it's saved with the next snapshot).
+        """
+        snap_dir = current_snapshot(path)
+        meta = load_meta(snap_dir)
+        store = cls(meta["dim"])
+        store.chunks = ChunkTable.load(snap_dir)
+        store.metadata = ChunkMetadata.load(snap_dir, len(store.chunks))
+        store.ingested_hashes = set(meta["ingested_hashes"])
+        store.embedder_version = meta.get("embedder")
+        store._load_index(snap_dir)
+        if store.lexical is not None:
+            store.lexical = BM25Index.load(snap_dir, **_bm25_params())
+            if store.lexical is None or len(store.lexical) != len(store.chunks):
+                store.lexical = BM25Index(**_bm25_params())
+                store.lexical.add(store.chunks[i] for i in range(len(store.chunks)))
+        if store.near_duplicates is not None:
+            store.near_duplicates = NearDuplicateIndex.load(snap_dir, **_dedup_params())
+            if store.near_duplicates is None:
+                store.near_duplicates = NearDuplicateIndex(**_dedup_params())
+                rows = np.flatnonzero(store.metadata.live_mask())
+                store.near_duplicates.add([store.chunks[i] for i in rows], store.metadata.values("chunk_id", rows))
+        return store
@@ -0,0 +1,261 @@
+# This module is a keyword search engine (BM25) that sits next to the vector index.
+# Embeddings only keep a few hundred dimensions, so rare exact terms—IDs, names, error codes—get lost;
+# BM25 indexes every word, and its results are fused with the vector results (see vector_store.fusion).
+#
+# Postings live in a few term-major CSR "segments". New chunks become a new small segment, and
+# segments are merged as they pile up (like a log-structured merge tree), so adding a document costs
+# about O(that document) however big the index is, and a search only reads the posting lists of its own terms
+# (and only the top of the long ones: see search).
+import json
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+import scipy.sparse as sp
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Lowercased word tokens. Numbers and IDs are kept as they are (no stemming, no stopword list).
+    """
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    def __init__(self, k1=1.2, b=0.75, max_df=0.5, max_postings=1000):
+        """
+        Start an empty index. k1 and b are the usual BM25 knobs (term-frequency saturation and
+        length normalisation). Terms found in more than max_df of the chunks are skipped at query time,
+        since their long posting lists cost the most and tell us the least. max_postings bounds how
+        many candidates one term may bring into a search (see search).
+        Chunks are numbered by row, in the same order as the vector store's chunk table.
+        """
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        self.max_postings = max_postings
+        self.vocabulary = {}
+        self.doc_freq = array("q")
+        self.doc_lengths = array("i")
+        self.total_length = 0
+        # (first row, term x chunk CSR of term frequencies), oldest first
+        self.segments = []
+        # (segment's first row, term) -> that term's highest-impact rows in the segment
+        self._top_postings = {}
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, chunks):
+        """
+        Index new chunks (they get the next row numbers).
+        """
+        first_row = len(self)
+        rows, cols, counts = [], [], []
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            self.doc_lengths.append(len(tokens))
+            self.total_length += len(tokens)
+            for term, count in Counter(tokens).items():
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    term_id = self.vocabulary[term] = len(self.vocabulary)
+                    self.doc_freq.append(0)
+                self.doc_freq[term_id] += 1
+                rows.append(term_id)
+                cols.append(row)
+                counts.append(count)
+        n_new = len(self) - first_row
+        if n_new == 0:
+            return
+        segment = sp.csr_matrix((np.array(counts, dtype=np.float32), (rows, cols)),
+                                shape=(len(self.vocabulary), n_new))
+        segment.sort_indices()
+        self.segments.append((first_row, segment))
+        # Merge the newest segments while the last one is at least half the size of the one before it,
+        # which keeps the number of segments logarithmic in the number of chunks
+        while len(self.segments) > 1 and self.segments[-1][1].shape[1] * 2 >= self.segments[-2][1].shape[1]:
+            (start, older), (_, newer) = self.segments[-2], self.segments[-1]
+            self.segments[-2:] = [(start, self._hstack(older, newer))]
+            self._top_postings = {}
+
+    def _hstack(self, *segments):
+        n_terms = max(segment.shape[0] for segment in segments)
+        padded = [sp.csr_matrix((s.data, s.indices, np.concatenate([s.indptr, np.full(n_terms - s.shape[0], s.indptr[-1])])),
+                                shape=(n_terms, s.shape[1])) for s in segments]
+        merged = sp.hstack(padded, format="csr")
+        merged.sort_indices()
+        return merged
+
+    def search(self, query, top_k=10, allowed=None):
+        """
+        The rows of the top_k chunks by BM25 score for a query string, best first (only chunks that
+        match at least one query term). allowed is an optional boolean mask over rows: anything
+        not allowed is dropped before the top_k are picked.
+
+        Candidates come from each term's posting list, but a common term only contributes its
+        max_postings highest-impact chunks (highest tf for their length), so a query never walks a
+        posting list hundreds of thousands of entries long. Every candidate is then scored exactly on
+        all query terms, by binary search in the posting lists. Rankings are exact whenever no query
+        term is in more than max_postings chunks; queries made only of such common terms are
+        approximate (benchmark_bm25.py measures by how much).
+        """
+        term_ids = self._query_terms(query)
+        if not term_ids or top_k <= 0:
+            return []
+        if allowed is not None and np.count_nonzero(allowed) <= self.max_postings:
+            # A narrow filter (say, one document): just score every chunk it allows
+            rows = np.flatnonzero(allowed)
+        else:
+            rows = np.unique(np.concatenate([self._candidates(term_id) for term_id in term_ids]))
+            if allowed is not None:
+                rows = rows[allowed[rows]]
+        scores = self._scores(term_ids, rows)
+        matched = scores > 0
+        rows, scores = rows[matched], scores[matched]
+        top_k = min(top_k, len(rows))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [int(i) for i in rows[best]]
+
+    def score(self, query, rows):
+        """
+        The exact BM25 scores of the given rows for a query string (0 for rows matching no query term).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.argsort(rows)
+        scores = np.zeros(len(rows))
+        scores[order] = self._scores(self._query_terms(query), rows[order])
+        return scores
+
+    def _query_terms(self, query):
+        """
+        The ids of a query's indexed terms, minus those in more than max_df of the chunks.
+        A query made only of such common terms carries no keyword signal; the vector search has it covered.
+        """
+        n_docs = len(self)
+        doc_freq = np.frombuffer(self.doc_freq, dtype=np.int64)
+        term_ids = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        return [t for t in term_ids if doc_freq[t] <= self.max_df * n_docs]
+
+    def _scores(self, term_ids, rows):
+        """
+        BM25 scores of the given sorted rows, over the given terms.
+        """
+        n_docs = len(self)
+        doc_freq = np.frombuffer(self.doc_freq, dtype=np.int64)
+        scores = np.zeros(len(rows))
+        for term_id in term_ids:
+            idf = float(np.log(1 + (n_docs - doc_freq[term_id] + 0.5) / (doc_freq[term_id] + 0.5)))
+            self._score(term_id, idf, rows, scores)
+        return scores
+
+    def _weights(self, tf, rows):
+        """
+        The BM25 term-frequency part of the score (everything but the idf) for the given postings.
+        """
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)[rows]
+        length_norm = self.k1 * (1 - self.b + self.b * lengths / (self.total_length / len(self)))
+        return tf * (self.k1 + 1) / (tf + length_norm)
+
+    def _candidates(self, term_id):
+        """
+        The rows containing a term, or for a common term only its max_postings highest-impact rows
+        per segment. Those are worked out once per (segment, term) and cached until segments change.
+        """
+        found = []
+        for first_row, segment in self.segments:
+            if term_id >= segment.shape[0]:
+                continue
+            start, end = segment.indptr[term_id], segment.indptr[term_id + 1]
+            rows = segment.indices[start:end].astype(np.int64) + first_row
+            if end - start > self.max_postings:
+                key = (first_row, term_id)
+                if key not in self._top_postings:
+                    impact = self._weights(segment.data[start:end], rows)
+                    self._top_postings[key] = rows[np.argpartition(-impact, self.max_postings - 1)[:self.max_postings]]
+                rows = self._top_postings[key]
+            found.append(rows)
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def _score(self, term_id, idf, rows, scores):
+        """
+        Add a term's BM25 scores to the given (sorted) rows that contain it, in place.
+        """
+        for first_row, segment in self.segments:
+            if term_id >= segment.shape[0]:
+                continue
+            start, end = segment.indptr[term_id], segment.indptr[term_id + 1]
+            lo, hi = np.searchsorted(rows, [first_row, first_row + segment.shape[1]])
+            if start == end or lo == hi:
+                continue
+            postings = segment.indices[start:end]
+            # Same dtype as the postings, or searchsorted would convert the whole posting list first
+            wanted = (rows[lo:hi] - first_row).astype(postings.dtype)
+            at = np.minimum(np.searchsorted(postings, wanted), len(postings) - 1)
+            hit = postings[at] == wanted
+            scores[lo:hi][hit] += idf * self._weights(segment.data[start:end][at[hit]], rows[lo:hi][hit])
+
+    def take(self, rows):
+        """
+        A new index holding just the given rows, in order (used when the vector store compacts).
+        Document frequencies are recounted; the vocabulary is kept as it is.
+        """
+        index = BM25Index(self.k1, self.b, self.max_df, self.max_postings)
+        index.vocabulary = self.vocabulary
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.int32)[rows]
+        index.doc_lengths = array("i", lengths.tobytes())
+        index.total_length = int(lengths.sum())
+        if self.segments:
+            merged = self._hstack(*[segment for _, segment in self.segments])[:, rows].tocsr()
+            merged.sort_indices()
+            index.segments = [(0, merged)]
+            index.doc_freq = array("q", np.diff(merged.indptr).astype(np.int64).tobytes())
+            index.doc_freq.extend([0] * (len(self.vocabulary) - len(index.doc_freq)))
+        else:
+            index.doc_freq = array("q", [0] * len(self.vocabulary))
+        return index
+
+    def save(self, dir_path):
+        """
+        Write the index (all segments merged into one) as bm25.npz, plus its vocabulary and chunk lengths.
+        """
+        if self.segments:
+            self.segments = [(0, self._hstack(*[segment for _, segment in self.segments]))]
+            self._top_postings = {}
+            sp.save_npz(os.path.join(dir_path, "bm25.npz"), self.segments[0][1], compressed=False)
+        np.save(os.path.join(dir_path, "bm25_lengths.npy"), np.frombuffer(self.doc_lengths, dtype=np.int32))
+        with open(os.path.join(dir_path, "bm25_terms.json"), "w") as f:
+            json.dump(sorted(self.vocabulary, key=self.vocabulary.get), f)
+
+    @classmethod
+    def load(cls, dir_path, **params):
+        """
+        Load a saved index, or return None if the snapshot doesn't have one.
+        params are the scoring knobs (k1, b, max_df, max_postings); they aren't part of the snapshot.
+        """
+        terms_path = os.path.join(dir_path, "bm25_terms.json")
+        if not os.path.exists(terms_path):
+            return None
+        with open(terms_path) as f:
+            terms = json.load(f)
+        index = cls(**params)
+        index.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        lengths = np.load(os.path.join(dir_path, "bm25_lengths.npy"))
+        index.doc_lengths = array("i", lengths.astype(np.int32).tobytes())
+        index.total_length = int(lengths.sum())
+        index.doc_freq = array("q", [0] * len(index.vocabulary))
+        segment_path = os.path.join(dir_path, "bm25.npz")
+        if os.path.exists(segment_path):
+            segment = sp.load_npz(segment_path).tocsr()
+            segment.sort_indices()
+            index.segments = [(0, segment)]
+            doc_freq = np.diff(segment.indptr).astype(np.int64)
+            index.doc_freq[:len(doc_freq)] = array("q", doc_freq.tobytes())
+        return index
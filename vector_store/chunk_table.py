@@ -0,0 +1,91 @@
+# This module stores the text of every chunk in one compact block of bytes instead of thousands of Python strings.
+# Saved tables can be memory-mapped straight back in, so a warm start doesn't have to read every chunk into RAM.
+import os
+from array import array
+
+import numpy as np
+
+
+class ChunkTable:
+    def __init__(self):
+        """
+        Start an empty table. Chunks live in two parts: a read-only "base" (usually memory-mapped
+        from a snapshot) and an in-memory "tail" that new chunks are appended to.
+        """
+        self._base_text = b""
+        self._base_offsets = np.zeros(1, dtype=np.int64)
+        self._tail_text = bytearray()
+        self._tail_offsets = array("q", [0])
+
+    def __len__(self):
+        return len(self._base_offsets) - 1 + len(self._tail_offsets) - 1
+
+    def __getitem__(self, i):
+        """
+        Get chunk number i back as a string. Negative indexes count from the end, just like a list.
+        """
+        return self._raw(i).decode("utf-8")
+
+    def _raw(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("chunk index out of range")
+        n_base = len(self._base_offsets) - 1
+        if i < n_base:
+            start, end = self._base_offsets[i], self._base_offsets[i + 1]
+            return bytes(self._base_text[start:end])
+        i -= n_base
+        start, end = self._tail_offsets[i], self._tail_offsets[i + 1]
+        return bytes(self._tail_text[start:end])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, chunk):
+        self._tail_text += chunk.encode("utf-8")
+        self._tail_offsets.append(len(self._tail_text))
+
+    def extend(self, chunks):
+        for chunk in chunks:
+            self.append(chunk)
+
+    def take(self, rows):
+        """
+        A new, fully in-memory table holding just the given rows, in order (used when compacting).
+        """
+        table = ChunkTable()
+        for i in rows:
+            table._tail_text += self._raw(int(i))
+            table._tail_offsets.append(len(table._tail_text))
+        return table
+
+    def save(self, dir_path):
+        """
+        Write the table as text.bin (all chunks back to back) plus offsets.npy (where each one starts).
+        """
+        base_end = int(self._base_offsets[-1])
+        offsets = np.concatenate([self._base_offsets, np.frombuffer(self._tail_offsets, dtype=np.int64)[1:] + base_end])
+        with open(os.path.join(dir_path, "text.bin"), "wb") as f:
+            f.write(self._base_text[:base_end])
+            f.write(self._tail_text)
+        np.save(os.path.join(dir_path, "offsets.npy"), offsets)
+
+    @classmethod
+    def load(cls, dir_path, mmap=True):
+        """
+        Load a saved table. With mmap=True the chunk text stays on disk and is paged in only when read.
+        """
+        table = cls()
+        table._base_offsets = np.load(os.path.join(dir_path, "offsets.npy"), mmap_mode="r" if mmap else None)
+        text_path = os.path.join(dir_path, "text.bin")
+        if table._base_offsets[-1] == 0:
+            table._base_text = b""
+        elif mmap:
+            table._base_text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            with open(text_path, "rb") as f:
+                table._base_text = f.read()
+        return table
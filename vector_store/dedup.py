@@ -0,0 +1,220 @@
+# This module spots duplicate chunks before they are embedded: slide footers, boilerplate headers,
+# the unchanged parts of a re-uploaded revision. It uses MinHash signatures with locality-sensitive
+# hashing (LSH): each chunk's signature is cut into bands, and two chunks become candidates if any band
+# matches, which happens with high probability once their word 3-grams overlap by ~80% or more.
+# Only a candidate with the very same text (up to case and spacing) is a duplicate that can be collapsed;
+# one that's merely similar (a revised clause, a changed figure) is reported as a near-duplicate, and kept.
+#
+# Band keys are kept in sorted numpy segments (merged as they pile up, like the BM25 postings), so the
+# index costs a few bytes per band per chunk rather than a Python dict entry, and a whole batch of
+# chunks is looked up with one binary search per segment.
+import json
+import os
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from vector_store.bm25 import tokenize
+
+# What an incoming chunk matched: ("batch", i) an earlier chunk in the same list or ("chunk", chunk_id) a
+# stored one, and whether it's the same text (exact) or only a near-duplicate of it
+Match = namedtuple("Match", "kind target exact")
+
+
+def normalize(text):
+    """
+    The text as compared for exact duplicates: lowercased, with runs of whitespace made single spaces.
+    Punctuation stays, so "5,000" and "5.000" are different texts.
+    """
+    return " ".join(text.lower().split())
+
+
+def shingles(text, n=3):
+    """
+    The set of word n-grams of a text (or the whole text as one shingle, if it's shorter than n words).
+    """
+    tokens = tokenize(text)
+    if len(tokens) <= n:
+        return {" ".join(tokens)}
+    return {" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1)}
+
+
+def _shingle_hashes(text, mix, n=3):
+    """
+    32-bit hashes of the same word n-grams as shingles(), worked out with numpy: each token is hashed once
+    and an n-gram's hash combines its tokens' hashes (multiplied by the odd constants in mix).
+    """
+    tokens = tokenize(text)
+    hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens), dtype=np.uint64, count=len(tokens))
+    width = min(n, len(hashes))
+    combined = np.zeros(max(len(hashes) - n + 1, 1), dtype=np.uint64)
+    for k in range(width):
+        combined += hashes[k:len(hashes) - width + 1 + k] * mix[k]
+    return np.unique(combined >> np.uint64(32))
+
+
+def jaccard(a, b):
+    """
+    Jaccard similarity of two shingle sets.
+    """
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    def __init__(self, threshold=0.9, bands=8, rows=8, seed=1):
+        """
+        Start an empty index. Chunks whose shingle sets have a Jaccard similarity of at least threshold
+        count as near-duplicates. Signatures have bands * rows MinHash values; more rows per band means
+        fewer false candidates, more bands means fewer missed duplicates.
+        """
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.default_rng(seed)
+        n_hashes = bands * rows
+        # MinHash permutations of the 32-bit shingle hashes x, by multiply-shift: the top 32 bits of
+        # (a * x + b) mod 2^64, with a odd (uint64 arithmetic wraps around, which is the mod 2^64)
+        self._a = rng.integers(0, 1 << 63, size=n_hashes, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, size=n_hashes, dtype=np.uint64)
+        # Odd multipliers that fold a band's rows into one 64-bit key, and a salt per band
+        self._fold = rng.integers(0, 1 << 63, size=rows, dtype=np.uint64) | np.uint64(1)
+        self._salt = rng.integers(0, 1 << 63, size=bands, dtype=np.uint64)
+        # ...and to combine a shingle's token hashes into one
+        self._mix = rng.integers(0, 1 << 63, size=3, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        # (band keys, sorted; chunk id for each key), oldest first
+        self.segments = []
+        self._pending = {}
+
+    def __len__(self):
+        return sum(len(keys) for keys, _ in self.segments) // self.bands
+
+    def band_keys(self, text):
+        """
+        The LSH band keys of a text, as an array of one uint64 per band.
+        Keys worked out by find are kept until add, so each chunk is only hashed once.
+        """
+        if text in self._pending:
+            return self._pending[text]
+        hashes = _shingle_hashes(text, self._mix)
+        signature = ((np.outer(hashes, self._a) + self._b) >> np.uint64(32)).min(axis=0)
+        return (signature.reshape(self.bands, self.rows) * self._fold).sum(axis=1) + self._salt
+
+    def find(self, texts, stored_text):
+        """
+        For each text, a Match for the chunk it duplicates—an earlier text in the same list, or a chunk
+        already indexed—or None if it has none. A Match with exact set is the same text (see normalize) and
+        can be collapsed into its target; otherwise the two only have a word 3-gram Jaccard similarity of
+        at least threshold, and both must be kept. Exact matches are preferred over near ones.
+        stored_text(chunk_id) gives an indexed chunk's text, or None if it's no longer live (the caller
+        owns the chunk text).
+        """
+        keys = [self.band_keys(text) for text in texts]
+        self._pending = dict(zip(texts, keys))
+        stored = self._lookup(np.concatenate(keys)) if keys else {}
+        found, seen, normalized, batch_shingles = [], {}, {}, {}
+
+        def compare(i, text, kind, target, other):
+            # Match(exact=True) for the same text, Match(exact=False) for a near-duplicate, else None
+            if normalized.setdefault(i, normalize(text)) == normalize(other):
+                return Match(kind, target, True)
+            text_shingles = batch_shingles.setdefault(i, shingles(text))
+            if jaccard(text_shingles, shingles(other)) >= self.threshold:
+                return Match(kind, target, False)
+            return None
+
+        for i, (text, text_keys) in enumerate(zip(texts, keys)):
+            candidates = [("batch", j, texts[j]) for j in sorted({seen[key] for key in text_keys.tolist() if key in seen})]
+            for chunk_id in sorted({chunk_id for key in text_keys.tolist() for chunk_id in stored.get(key, ())}):
+                other = stored_text(chunk_id)
+                if other is not None:
+                    candidates.append(("chunk", chunk_id, other))
+            match = None
+            for kind, target, other in candidates:
+                candidate = compare(i, text, kind, target, other)
+                if candidate is not None and (match is None or candidate.exact):
+                    match = candidate
+                    if match.exact:
+                        break
+            if match is None or not match.exact:
+                # This text will be stored, so later texts in the list can match it
+                for key in text_keys.tolist():
+                    seen.setdefault(key, i)
+            found.append(match)
+        return found
+
+    def _lookup(self, keys):
+        """
+        Chunk ids stored under each of the given keys, as {key: [chunk ids]} (keys with no match left out).
+        """
+        matches = {}
+        for segment_keys, chunk_ids in self.segments:
+            lo = np.searchsorted(segment_keys, keys, side="left")
+            hi = np.searchsorted(segment_keys, keys, side="right")
+            for at in np.flatnonzero(hi > lo):
+                matches.setdefault(int(keys[at]), []).extend(chunk_ids[lo[at]:hi[at]].tolist())
+        return matches
+
+    def add(self, texts, chunk_ids):
+        """
+        Index new chunks under their chunk ids.
+        """
+        if not len(texts):
+            return
+        keys = np.concatenate([self.band_keys(text) for text in texts])
+        self._pending = {}
+        ids = np.repeat(np.asarray(chunk_ids, dtype=np.int64), self.bands)
+        order = np.argsort(keys, kind="stable")
+        self.segments.append((keys[order], ids[order]))
+        while len(self.segments) > 1 and len(self.segments[-1][0]) * 2 >= len(self.segments[-2][0]):
+            (older_keys, older_ids), (newer_keys, newer_ids) = self.segments[-2:]
+            keys, ids = np.concatenate([older_keys, newer_keys]), np.concatenate([older_ids, newer_ids])
+            order = np.argsort(keys, kind="stable")
+            self.segments[-2:] = [(keys[order], ids[order])]
+
+    def drop(self, chunk_ids):
+        """
+        Forget the given chunks (used when the vector store compacts).
+        """
+        segments = []
+        for keys, ids in self.segments:
+            keep = ~np.isin(ids, chunk_ids)
+            segments.append((keys[keep], ids[keep]))
+        self.segments = segments
+
+    def save(self, dir_path):
+        """
+        Write the index (all segments merged into one) as dedup_keys.npy and dedup_ids.npy,
+        plus the band layout they were made with.
+        """
+        if len(self.segments) > 1:
+            keys = np.concatenate([keys for keys, _ in self.segments])
+            ids = np.concatenate([ids for _, ids in self.segments])
+            order = np.argsort(keys, kind="stable")
+            self.segments = [(keys[order], ids[order])]
+        keys, ids = self.segments[0] if self.segments else (np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64))
+        np.save(os.path.join(dir_path, "dedup_keys.npy"), keys)
+        np.save(os.path.join(dir_path, "dedup_ids.npy"), ids)
+        with open(os.path.join(dir_path, "dedup.json"), "w") as f:
+            json.dump({"bands": self.bands, "rows": self.rows}, f)
+
+    @classmethod
+    def load(cls, dir_path, **params):
+        """
+        Load a saved index, or return None if the snapshot doesn't have one (or made it with a different
+        band layout, whose keys wouldn't match). params are the index settings (threshold, bands, rows).
+        """
+        layout_path = os.path.join(dir_path, "dedup.json")
+        if not os.path.exists(layout_path):
+            return None
+        index = cls(**params)
+        with open(layout_path) as f:
+            if json.load(f) != {"bands": index.bands, "rows": index.rows}:
+                return None
+        keys_path = os.path.join(dir_path, "dedup_keys.npy")
+        keys, ids = np.load(keys_path), np.load(os.path.join(dir_path, "dedup_ids.npy"))
+        if len(keys):
+            index.segments = [(keys, ids)]
+        return index
@@ -0,0 +1,41 @@
+# This module picks which vector store to build, based on the config.
+import config
+from vector_store.snapshot import current_snapshot, load_meta
+
+
+def _store_class(backend):
+    if backend == "faiss":
+        from vector_store.faiss_store import VectorStore
+        return VectorStore
+    if backend == "sparse":
+        from vector_store.sparse_store import SparseVectorStore
+        return SparseVectorStore
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def create_vector_store(dim=config.EMBEDDING_DIM, backend=config.VECTOR_STORE_BACKEND):
+    """
+    Build an empty vector store: "faiss" for the dense FAISS index, "sparse" for the CSR/inverted-index store.
+    """
+    return _store_class(backend)(dim)
+
+
+def load_or_create_vector_store(path=config.INDEX_PATH, dim=config.EMBEDDING_DIM, backend=config.VECTOR_STORE_BACKEND,
+                                embedder=None):
+    """
+    Warm start from the last snapshot under path if there is one that matches the configured
+    backend and size; otherwise start with an empty store.
+    If embedder (the one queries will go through) is given and isn't the one the snapshot's vectors
+    came from, the store is re-embedded with it, and both are saved again.
+    """
+    snap_dir = current_snapshot(path)
+    if snap_dir is not None:
+        meta = load_meta(snap_dir)
+        if meta["backend"] == backend and meta["dim"] == dim:
+            print(f"[VectorStore] Warm start from {snap_dir}")
+            store = _store_class(backend).load(path)
+            if embedder is not None and store.ensure_embedder(embedder):
+                embedder.save(config.EMBEDDER_PATH)
+                store.save(path)
+            return store
+    return create_vector_store(dim, backend)
@@ -1,28 +1,142 @@
 # This module is our "memory bank" for document chunks.
 # It uses FAISS to quickly find the most relevant pieces of text for any question.
+import os
+
 import faiss
 import numpy as np
+import scipy.sparse as sp
+
+import config
+from vector_store.ann import INDEX_KINDS, MIN_TRAIN, build_index, index_kind, index_metric, search_params, train_index
+from vector_store.base import BaseVectorStore
+
+
+def _to_dense(embeddings):
+    """
+    FAISS only understands dense, C-contiguous float32 arrays, so sparse embeddings get expanded here
+    (and only here). Our embedders already produce float32, so this is the only copy made; a dense
+    float32 array is passed through as it is.
+    """
+    if sp.issparse(embeddings):
+        return embeddings.astype(np.float32, copy=False).toarray()
+    return np.ascontiguousarray(embeddings, dtype=np.float32)
+
 
-class VectorStore:
-    def __init__(self, dim):
+class VectorStore(BaseVectorStore):
+    backend = "faiss"
+
+    def __init__(self, dim, index_type=config.FAISS_INDEX, metric=config.FAISS_METRIC, **kwargs):
         """
         Set up a new vector store with a given embedding size.
         Think of this as creating a blank notebook for storing all our document pieces!
+        The FAISS index returns our stable chunk ids rather than positions. It starts out exact (flat);
+        index_type says what it becomes once there are enough chunks (see vector_store.ann).
+        metric is "ip" (cosine similarity on our normalised vectors) or "l2".
         """
-        self.index = faiss.IndexFlatL2(dim)
-        self.chunks = []
+        super().__init__(dim, **kwargs)
+        if index_type != "auto" and index_type not in INDEX_KINDS:
+            raise ValueError(f"Unknown FAISS index type: {index_type}")
+        self.index_type = index_type
+        self.metric = metric
+        self._clear_index()
+
+    def _clear_index(self):
+        # Kinds that need no training (flat, hnsw) can be used from the very first chunk
+        self.index_kind = self.index_type if self.index_type != "auto" and MIN_TRAIN[self.index_type] == 0 else "flat"
+        self.index = build_index(self.index_kind, self.dim, 0, self.metric)
+        # Bitmap of searchable chunk ids (None while there are no tombstones), rebuilt lazily
+        self._live_bitmap = None
+        self._live_bitmap_stale = False
+
+    def _add_vectors(self, embeddings, chunk_ids):
+        self.index.add_with_ids(_to_dense(embeddings), chunk_ids)
+        self._live_bitmap_stale = True
+        target, threshold = self._ann_target()
+        if self.index_kind == "flat" and target != "flat" and self.index.ntotal >= threshold:
+            print(f"[VectorStore] {self.index.ntotal} chunks: switching from a flat index to {target}")
+            self.rebuild_index(target)
 
-    def add_embeddings(self, embeddings, chunks):
+    def _ann_target(self):
         """
-        Add new embeddings and their corresponding text chunks to our memory bank.
+        The index kind we're aiming for, and how many chunks we need before switching to it.
         """
-        self.index.add(np.array(embeddings))
-        self.chunks.extend(chunks)
+        if self.index_type == "auto":
+            return config.FAISS_AUTO_INDEX, max(config.FAISS_ANN_THRESHOLD, MIN_TRAIN[config.FAISS_AUTO_INDEX])
+        return self.index_type, MIN_TRAIN[self.index_type]
 
-    def search(self, query_embedding, top_k=3):
+    def rebuild_index(self, kind=None):
         """
-        Find the top_k most similar chunks to the query embedding.
-        This is like asking, "Which parts of my notes are most relevant to this question?"
+        Rebuild the index from scratch as the given kind (by default, the current one), training it on
+        a sample of the stored vectors. Tombstoned chunks are left out. Vectors are read back from the
+        current index, so rebuilding from ivfpq keeps its (lossy) compressed vectors.
         """
-        D, I = self.index.search(np.array([query_embedding]), top_k)
-        return [self.chunks[i] for i in I[0]]
+        kind = kind or self.index_kind
+        with self._lock:
+            chunk_ids = np.ascontiguousarray(self.metadata.column("chunk_id")[self.metadata.live_mask()])
+            vectors = self.index.reconstruct_batch(chunk_ids) if len(chunk_ids) else np.zeros((0, self.dim), dtype=np.float32)
+            index = build_index(kind, self.dim, len(chunk_ids), self.metric)
+            train_index(index, vectors)
+            index.add_with_ids(vectors, chunk_ids)
+            self.index, self.index_kind = index, kind
+
+    def _on_delete(self, chunk_ids):
+        self._live_bitmap_stale = True
+
+    def _allowed_bitmap(self, doc_ids):
+        """
+        A bitmap over chunk ids saying which ones a search may return: not tombstoned, and (if doc_ids
+        is given) from one of those documents. None means everything is allowed.
+        """
+        if doc_ids is None:
+            if self.metadata.n_deleted == 0:
+                return None
+            if self._live_bitmap is None or self._live_bitmap_stale:
+                self._live_bitmap = self._bitmap(self.metadata.live_mask())
+                self._live_bitmap_stale = False
+            return self._live_bitmap
+        return self._bitmap(self.metadata.mask(doc_ids) & self.metadata.live_mask())
+
+    def _bitmap(self, row_mask):
+        allowed = np.zeros(self.metadata.next_chunk_id, dtype=bool)
+        allowed[self.metadata.column("chunk_id")[row_mask]] = True
+        return np.packbits(allowed, bitorder="little")
+
+    def _search_vectors(self, query_embeddings, top_k=3, doc_ids=None):
+        """
+        Find the chunk ids of the top_k most similar chunks for every query (one per row), in one
+        FAISS call: the index is scanned once for the whole batch instead of once per query.
+        If doc_ids is given, only chunks from those documents are considered. That filter (and the
+        tombstones of removed documents) is handed to FAISS as an ID selector, so it's applied during
+        the search rather than to the top_k afterwards.
+        """
+        queries = _to_dense(query_embeddings).reshape(-1, self.dim)
+        with self._lock:
+            bitmap = self._allowed_bitmap(doc_ids)
+            if bitmap is None:
+                D, I = self.index.search(queries, top_k, params=search_params(self.index_kind))
+            else:
+                # bitmap has to stay referenced for as long as FAISS is reading it
+                selector = faiss.IDSelectorBitmap(bitmap)
+                D, I = self.index.search(queries, top_k, params=search_params(self.index_kind, selector))
+        # FAISS pads with -1 when fewer than top_k chunks qualify
+        return [[int(i) for i in row if i >= 0] for row in I]
+
+    def _compact_index(self, keep_rows, dead_chunk_ids):
+        if self.index_kind == "hnsw":
+            # HNSW graphs can't drop nodes, so compaction means rebuilding from the live vectors
+            self.rebuild_index()
+        else:
+            self.index.remove_ids(faiss.IDSelectorArray(np.ascontiguousarray(dead_chunk_ids, dtype=np.int64)))
+        self._live_bitmap = None
+
+    def _save_index(self, snap_dir):
+        faiss.write_index(self.index, os.path.join(snap_dir, "index.faiss"))
+
+    def _load_index(self, snap_dir):
+        index = faiss.read_index(os.path.join(snap_dir, "index.faiss"))
+        if isinstance(index, faiss.IndexFlat):
+            # Snapshots from before stable ids hold a bare index; wrap its vectors under their chunk ids
+            vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, self.dim), dtype=np.float32)
+            index = build_index("flat", self.dim, len(vectors), index_metric(index))
+            index.add_with_ids(vectors, self.metadata.column("chunk_id"))
+        self.index, self.index_kind, self.metric = index, index_kind(index), index_metric(index)
@@ -0,0 +1,16 @@
+# This module merges the ranked results of different retrievers (the vector index and BM25) into one list.
+import config
+
+
+def reciprocal_rank_fusion(rankings, top_k=None, k=config.RRF_K):
+    """
+    Reciprocal-rank fusion: every id scores the sum of 1 / (k + rank) over the lists it appears in
+    (ranks start at 1), and the ids come back best first. It only looks at ranks, so BM25 scores and
+    cosine similarities never have to be put on the same scale. Ties keep the order ids were first seen in.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return fused if top_k is None else fused[:top_k]
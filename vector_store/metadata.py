@@ -0,0 +1,308 @@
+# This module keeps track of where every chunk came from: which document, which page/slide/rows,
+# and where in the document's text it sits. It's a handful of flat numeric columns, one row per chunk
+# in the same order as the vectors, so a million chunks cost tens of megabytes rather than a million dicts.
+# A chunk belongs to one document, but other documents can reference it too, when they contained a
+# near-duplicate of it that was collapsed at ingest instead of being stored again.
+import json
+import os
+from array import array
+from bisect import bisect_left
+
+import numpy as np
+
+# The kinds of location the parsers report, stored as a small code in the loc_kind column
+LOCATION_KINDS = ("page", "slide", "paragraph", "line", "rows")
+
+# Column name -> array typecode (and matching numpy dtype). A location that's a range (CSV rows
+# [first, last + 1]) keeps its end in loc_end; for a single page/slide/... loc_end is -1.
+_COLUMNS = {"chunk_id": "q", "doc_id": "i", "loc_kind": "b", "loc": "i", "loc_end": "i", "char_start": "q",
+            "char_end": "q"}
+_DTYPES = {"i": np.int32, "b": np.int8, "q": np.int64}
+
+
+class ChunkMetadata:
+    def __init__(self):
+        """
+        Start an empty table. Like the ChunkTable, columns have a read-only "base" (usually
+        memory-mapped from a snapshot) and an in-memory "tail" that new rows are appended to.
+        Documents get small integer ids; their source paths live once in the documents list.
+        Every chunk gets a stable 64-bit chunk id, handed out in increasing order and never reused,
+        so ids stay valid even after deleted rows are compacted away.
+        """
+        self.documents = []
+        self.next_chunk_id = 0
+        self._base = {name: np.zeros(0, dtype=_DTYPES[code]) for name, code in _COLUMNS.items()}
+        self._tail = {name: array(code) for name, code in _COLUMNS.items()}
+        # One byte per row: 1 if the chunk has been deleted (a tombstone) but not compacted away yet
+        self._deleted = bytearray()
+        self.n_deleted = 0
+        # References: document _refs["doc_id"][i] also contains chunk _refs["chunk_id"][i]
+        self._refs = {"doc_id": array("i"), "chunk_id": array("q")}
+
+    def __len__(self):
+        return len(self._base["doc_id"]) + len(self._tail["doc_id"])
+
+    def add_document(self, source, content_hash=None):
+        """
+        Register a document and return its doc id.
+        """
+        self.documents.append({"source": source, "content_hash": content_hash})
+        return len(self.documents) - 1
+
+    def append(self, meta):
+        """
+        Add one chunk's row and return its new chunk id. meta is what the chunker yields, plus
+        "doc_id": e.g. {"doc_id": 3, "page": 12, "start": 5120, "end": 7984}. Anything missing is stored as -1.
+        A range location, like {"rows": [40, 60]}, keeps both ends.
+        """
+        kind = next((k for k in LOCATION_KINDS if k in meta), None)
+        loc, loc_end = (meta[kind] if kind else -1), -1
+        if isinstance(loc, (list, tuple)):
+            loc, loc_end = loc
+        chunk_id = self.next_chunk_id
+        self.next_chunk_id += 1
+        self._tail["chunk_id"].append(chunk_id)
+        self._tail["doc_id"].append(meta.get("doc_id", -1))
+        self._tail["loc_kind"].append(LOCATION_KINDS.index(kind) if kind else -1)
+        self._tail["loc"].append(loc)
+        self._tail["loc_end"].append(loc_end)
+        self._tail["char_start"].append(meta.get("start", -1))
+        self._tail["char_end"].append(meta.get("end", -1))
+        self._deleted.append(0)
+        return chunk_id
+
+    def extend(self, metas):
+        """
+        Add rows for several chunks and return their new chunk ids as an int64 array.
+        """
+        return np.array([self.append(meta) for meta in metas], dtype=np.int64)
+
+    def column(self, name):
+        """
+        A whole column as one numpy array (base followed by tail).
+        """
+        tail = np.frombuffer(self._tail[name], dtype=_DTYPES[_COLUMNS[name]]) if len(self._tail[name]) else None
+        if tail is None:
+            return self._base[name]
+        return np.concatenate([self._base[name], tail])
+
+    def row(self, chunk_id):
+        """
+        The row a chunk id lives in. Chunk ids are sorted, so this is a binary search, not a scan.
+        Raises KeyError for ids that don't exist (or were compacted away).
+        """
+        base = self._base["chunk_id"]
+        i = int(np.searchsorted(base, chunk_id))
+        if i < len(base) and base[i] == chunk_id:
+            return i
+        tail = self._tail["chunk_id"]
+        j = bisect_left(tail, chunk_id)
+        if j < len(tail) and tail[j] == chunk_id:
+            return len(base) + j
+        raise KeyError(chunk_id)
+
+    def values(self, name, rows):
+        """
+        One column's values for just the given rows, without concatenating the whole column first.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        base = self._base[name]
+        if not len(self._tail[name]):
+            return base[rows]
+        tail = np.frombuffer(self._tail[name], dtype=_DTYPES[_COLUMNS[name]])
+        in_base = rows < len(base)
+        out = np.empty(len(rows), dtype=base.dtype)
+        out[in_base] = base[rows[in_base]]
+        out[~in_base] = tail[rows[~in_base] - len(base)]
+        return out
+
+    def __getitem__(self, i):
+        """
+        Row i's metadata as a dict, e.g. {"chunk_id": 812, "doc_id": 3, "source": "report.pdf",
+        "page": 12, "start": 5120, "end": 7984}, with a range location as a list again ({"rows": [40, 60]}).
+        Negative indexes count from the end, just like a list.
+        """
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("chunk index out of range")
+        n_base = len(self._base["doc_id"])
+        part, j = (self._base, i) if i < n_base else (self._tail, i - n_base)
+        row = {name: int(part[name][j]) for name in _COLUMNS}
+        doc_id = row["doc_id"]
+        meta = {"chunk_id": row["chunk_id"], "doc_id": doc_id,
+                "source": self.documents[doc_id]["source"] if doc_id >= 0 else None}
+        if row["loc_kind"] >= 0:
+            loc = [row["loc"], row["loc_end"]] if row["loc_end"] >= 0 else row["loc"]
+            meta[LOCATION_KINDS[row["loc_kind"]]] = loc
+        meta["start"], meta["end"] = row["char_start"], row["char_end"]
+        return meta
+
+    def doc_ids_for(self, source):
+        """
+        The ids of every (not removed) document ingested from this source path.
+        """
+        return [doc_id for doc_id, doc in enumerate(self.documents) if doc["source"] == source and not doc.get("removed")]
+
+    def mask(self, doc_ids, references=True):
+        """
+        A boolean array saying which chunks belong to any of the given documents (or, with references,
+        are referenced by one of them). This is a single vectorised pass over the doc_id column—no Python
+        objects per chunk.
+        """
+        doc_ids = np.asarray(list(doc_ids), dtype=np.int32)
+        mask = np.isin(self.column("doc_id"), doc_ids)
+        if references and len(self._refs["doc_id"]):
+            ref_doc_ids, ref_chunk_ids = self.references()
+            referenced = ref_chunk_ids[np.isin(ref_doc_ids, doc_ids)]
+            if len(referenced):
+                mask |= np.isin(self.column("chunk_id"), referenced)
+        return mask
+
+    def add_reference(self, doc_id, chunk_id):
+        """
+        Record that a document also contains an existing chunk (a near-duplicate collapsed at ingest).
+        """
+        self._refs["doc_id"].append(doc_id)
+        self._refs["chunk_id"].append(chunk_id)
+
+    def references(self):
+        """
+        Every reference, as two arrays: the referencing doc ids and the referenced chunk ids.
+        """
+        return (np.frombuffer(self._refs["doc_id"], dtype=np.int32),
+                np.frombuffer(self._refs["chunk_id"], dtype=np.int64))
+
+    def _keep_references(self, keep):
+        ref_doc_ids, ref_chunk_ids = self.references()
+        self._refs = {"doc_id": array("i", ref_doc_ids[keep].tobytes()),
+                      "chunk_id": array("q", ref_chunk_ids[keep].tobytes())}
+
+    def drop_references(self, doc_id):
+        """
+        Forget every reference a document holds (it's being removed).
+        """
+        if len(self._refs["doc_id"]):
+            self._keep_references(self.references()[0] != doc_id)
+
+    def hand_over(self, rows):
+        """
+        For rows whose document is being removed: each one another document still references is handed
+        over to that document (its reference becomes ownership), so the text stays searchable for it.
+        Returns the rows nobody references, which can be deleted.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(self._refs["doc_id"]) or not len(rows):
+            return rows
+        ref_doc_ids, ref_chunk_ids = self.references()
+        chunk_ids = self.values("chunk_id", rows)
+        referenced = np.isin(chunk_ids, ref_chunk_ids)
+        keep = np.ones(len(ref_doc_ids), dtype=bool)
+        for row, chunk_id in zip(rows[referenced], chunk_ids[referenced]):
+            heir = np.flatnonzero((ref_chunk_ids == chunk_id) & keep)[0]
+            self._set_doc_id(int(row), int(ref_doc_ids[heir]))
+            keep[heir] = False
+        self._keep_references(keep)
+        return rows[~referenced]
+
+    def _set_doc_id(self, i, doc_id):
+        n_base = len(self._base["doc_id"])
+        if i >= n_base:
+            self._tail["doc_id"][i - n_base] = doc_id
+            return
+        if not self._base["doc_id"].flags.writeable:
+            # The base is memory-mapped read-only from a snapshot; the first change takes a private copy
+            self._base["doc_id"] = np.array(self._base["doc_id"])
+        self._base["doc_id"][i] = doc_id
+
+    def is_live(self, i):
+        """
+        Whether chunk i (by row) hasn't been deleted.
+        """
+        return not self._deleted[i]
+
+    def live_mask(self):
+        """
+        A boolean array saying which chunks haven't been deleted.
+        """
+        return np.frombuffer(self._deleted, dtype=np.uint8) == 0
+
+    def delete(self, rows):
+        """
+        Tombstone the given rows. They stay in place (so nothing else has to move) until the next compaction.
+        """
+        for i in rows:
+            if not self._deleted[i]:
+                self._deleted[i] = 1
+                self.n_deleted += 1
+
+    def take(self, rows):
+        """
+        A new, fully in-memory table holding just the given rows, in order (used when compacting).
+        Documents and the chunk id counter carry over, so every surviving chunk keeps its id.
+        """
+        table = ChunkMetadata()
+        table.documents = self.documents
+        table.next_chunk_id = self.next_chunk_id
+        for name in _COLUMNS:
+            table._base[name] = np.ascontiguousarray(self.column(name)[rows])
+        table._deleted = bytearray(len(rows))
+        table._refs = self._refs
+        if len(self._refs["doc_id"]):
+            table._keep_references(np.isin(self.references()[1], table._base["chunk_id"]))
+        return table
+
+    def save(self, dir_path):
+        """
+        Write every column as its own .npy file, plus the tombstones and documents.json.
+        """
+        for name in _COLUMNS:
+            np.save(os.path.join(dir_path, f"meta_{name}.npy"), self.column(name))
+        np.save(os.path.join(dir_path, "meta_deleted.npy"), np.frombuffer(self._deleted, dtype=np.uint8))
+        ref_doc_ids, ref_chunk_ids = self.references()
+        np.save(os.path.join(dir_path, "meta_ref_doc_id.npy"), ref_doc_ids)
+        np.save(os.path.join(dir_path, "meta_ref_chunk_id.npy"), ref_chunk_ids)
+        with open(os.path.join(dir_path, "documents.json"), "w") as f:
+            json.dump({"documents": self.documents, "next_chunk_id": self.next_chunk_id}, f)
+
+    @classmethod
+    def load(cls, dir_path, n_chunks, mmap=True):
+        """
+        Load a saved table. Older snapshots are filled in: chunk ids default to the row numbers, locations
+        have no range ends, and snapshots from before chunk metadata existed get n_chunks rows of "unknown".
+        """
+        table = cls()
+        table.next_chunk_id = n_chunks
+        table._deleted = bytearray(n_chunks)
+        documents_path = os.path.join(dir_path, "documents.json")
+        if not os.path.exists(documents_path):
+            for name, code in _COLUMNS.items():
+                table._base[name] = np.full(n_chunks, -1, dtype=_DTYPES[code])
+            table._base["chunk_id"] = np.arange(n_chunks, dtype=np.int64)
+            return table
+        with open(documents_path) as f:
+            saved = json.load(f)
+        if isinstance(saved, list):
+            table.documents = saved
+        else:
+            table.documents, table.next_chunk_id = saved["documents"], saved["next_chunk_id"]
+        # An empty array can't be memory-mapped
+        mmap_mode = "r" if mmap and n_chunks else None
+        for name in _COLUMNS:
+            column_path = os.path.join(dir_path, f"meta_{name}.npy")
+            if name == "chunk_id" and not os.path.exists(column_path):
+                table._base[name] = np.arange(n_chunks, dtype=np.int64)
+            elif name == "loc_end" and not os.path.exists(column_path):
+                table._base[name] = np.full(n_chunks, -1, dtype=np.int32)
+            else:
+                table._base[name] = np.load(column_path, mmap_mode=mmap_mode)
+        deleted_path = os.path.join(dir_path, "meta_deleted.npy")
+        if os.path.exists(deleted_path):
+            table._deleted = bytearray(np.load(deleted_path).tobytes())
+            table.n_deleted = table._deleted.count(1)
+        refs_path = os.path.join(dir_path, "meta_ref_doc_id.npy")
+        if os.path.exists(refs_path):
+            table._refs = {"doc_id": array("i", np.load(refs_path).astype(np.int32).tobytes()),
+                           "chunk_id": array("q", np.load(os.path.join(dir_path, "meta_ref_chunk_id.npy")).astype(np.int64).tobytes())}
+        return table
@@ -0,0 +1,62 @@
+# This module takes care of writing snapshots to disk safely.
+# A snapshot is written into its own fresh folder, and only when it's complete do we flip the
+# CURRENT pointer to it—so a crash mid-save always leaves the previous snapshot intact.
+import json
+import os
+import shutil
+import tempfile
+
+
+def _fsync_dir(dir_path):
+    """
+    Make sure everything written inside dir_path has actually reached the disk.
+    """
+    for name in os.listdir(dir_path):
+        with open(os.path.join(dir_path, name), "rb") as f:
+            os.fsync(f.fileno())
+
+
+def write_snapshot(path, write_fn):
+    """
+    Atomically write a new snapshot under path. write_fn gets the folder to write its files into.
+    Older snapshots are cleaned up once the new one is live.
+    """
+    os.makedirs(path, exist_ok=True)
+    snap_dir = tempfile.mkdtemp(prefix="snap-", dir=path)
+    write_fn(snap_dir)
+    _fsync_dir(snap_dir)
+    pointer_tmp = os.path.join(path, "CURRENT.tmp")
+    with open(pointer_tmp, "w") as f:
+        f.write(os.path.basename(snap_dir))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(path, "CURRENT"))
+    for name in os.listdir(path):
+        if name.startswith("snap-") and name != os.path.basename(snap_dir):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return snap_dir
+
+
+def current_snapshot(path):
+    """
+    The folder of the latest complete snapshot under path, or None if nothing has been saved yet.
+    """
+    pointer = os.path.join(path, "CURRENT")
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        snap_dir = os.path.join(path, f.read().strip())
+    return snap_dir if os.path.isdir(snap_dir) else None
+
+
+def save_meta(snap_dir, meta):
+    """
+    Write the small JSON description (backend, size, ingested files...) that goes with every snapshot.
+    """
+    with open(os.path.join(snap_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def load_meta(snap_dir):
+    with open(os.path.join(snap_dir, "meta.json")) as f:
+        return json.load(f)
@@ -0,0 +1,86 @@
+# This module is a lighter "memory bank" for sparse embeddings (TF-IDF or hashing).
+# Instead of expanding every vector into a mostly-zero dense array, it keeps the CSR matrices
+# and answers questions through an inverted index: only the words in the query are ever looked at.
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from vector_store.base import BaseVectorStore
+
+
+class SparseVectorStore(BaseVectorStore):
+    backend = "sparse"
+
+    def __init__(self, dim, **kwargs):
+        """
+        Set up an empty sparse store with a given embedding size.
+        It has the same add_embeddings/search interface as the FAISS VectorStore.
+        """
+        super().__init__(dim, **kwargs)
+        self._clear_index()
+
+    def _clear_index(self):
+        self._blocks = []
+        # Term -> chunk postings (the transpose of the chunk matrix), rebuilt lazily after new adds.
+        # Column j of the postings is row j of the chunk table and metadata.
+        self._postings = sp.csr_matrix((self.dim, 0), dtype=np.float32)
+
+    def _add_vectors(self, embeddings, chunk_ids):
+        """
+        Queue new sparse embeddings for the inverted index. Nothing is densified along the way.
+        """
+        self._blocks.append(sp.csr_matrix(embeddings, dtype=np.float32))
+
+    def _get_postings(self):
+        """
+        Fold any newly added chunks into the inverted index.
+        """
+        if self._blocks:
+            new_postings = sp.vstack(self._blocks, format="csr").T.tocsr()
+            self._postings = sp.hstack([self._postings, new_postings], format="csr")
+            self._blocks = []
+        return self._postings
+
+    def _search_vectors(self, query_embeddings, top_k=3, doc_ids=None, block_size=64):
+        """
+        Find the chunk ids of the top_k chunks with the highest dot product with each query (one per row;
+        cosine similarity, since our embeddings are L2-normalised). The whole batch is scored with one
+        sparse matrix product, a block_size block of queries at a time to bound the memory used for scores.
+        Only the posting lists for the queries' own terms are touched.
+        If doc_ids is given, only chunks from those documents are ranked. That filter, and the tombstones
+        of removed documents, are applied before picking the top_k, so results never come back short
+        just because filtered-out chunks scored higher.
+        """
+        with self._lock:
+            postings = self._get_postings()
+            chunk_ids = self.metadata.column("chunk_id")
+            allowed = self._allowed_rows(doc_ids)
+            candidates = None if allowed is None else np.flatnonzero(allowed)
+        queries = sp.csr_matrix(query_embeddings, dtype=np.float32)
+        if postings.shape[1] == 0:
+            return [[] for _ in range(queries.shape[0])]
+        top_k = min(top_k, postings.shape[1] if candidates is None else len(candidates))
+        if top_k == 0:
+            return [[] for _ in range(queries.shape[0])]
+        results = []
+        for start in range(0, queries.shape[0], block_size):
+            scores = (queries[start:start + block_size] @ postings).toarray()
+            if candidates is not None:
+                scores = scores[:, candidates]
+            best = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1)
+            best = np.take_along_axis(best, order, axis=1)
+            if candidates is not None:
+                best = candidates[best]
+            results.extend([int(i) for i in row] for row in chunk_ids[best])
+        return results
+
+    def _compact_index(self, keep_rows, dead_chunk_ids):
+        self._postings = self._get_postings()[:, keep_rows]
+
+    def _save_index(self, snap_dir):
+        sp.save_npz(os.path.join(snap_dir, "postings.npz"), self._get_postings(), compressed=False)
+
+    def _load_index(self, snap_dir):
+        self._postings = sp.load_npz(os.path.join(snap_dir, "postings.npz")).tocsr()